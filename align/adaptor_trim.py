@@ -6,44 +6,36 @@ by the Biopython SeqIO library.
 
 This can be imported for use in other scripts, or can be run directly. Running
 the script with no arguments will run the tests. Run directly, it will convert a
-fastq to a fasta output file, trimming with the passed adaptor:
+fastq to a fasta output file, trimming with the passed adaptor. Output files
+ending in .fastq or .fq are written as fastq, keeping quality scores. Several
+adaptors can be trimmed in one pass by separating them with commas; the number
+of reads trimmed with each is reported. Passing a number of processes trims in
+parallel. Counts of reads trimmed, rejected, unmatched and written, a
+histogram of
+trimmed lengths and the time spent in each stage are printed and saved as
+JSON next to the output file:
 
 Usage:
 
-    adaptor_trim.py <in fastq file> <out fasta file> <adaptor seq> <number of errors>
+    adaptor_trim.py <in fastq file> <out fasta or fastq file> <adaptor seq>
+                    <number of errors> [<number of processes>]
+
+Paired end reads are trimmed together, writing pairs of fastq files:
+
+    adaptor_trim.py --paired <in fastq 1> <in fastq 2> <out fastq 1>
+                    <out fastq 2> <adaptor seq 1> <adaptor seq 2>
+                    <number of errors> [<number of processes>]
 """
 from __future__ import with_statement
 import sys
 import os
+import time
+import json
+import itertools
 
-from Bio import pairwise2
-from Bio.Seq import Seq
-from Bio import SeqIO
+import numpy
 
-def _remove_adaptor(seq, region, right_side=True):
-    """Remove an adaptor region and all sequence to the right or left.
-    """
-    # A check for repetitive regions. We handle them below by searching
-    # from the left or right depending on the trimming method which should
-    # be the expected result.
-    #size = len(region)
-    #pieces = [str(seq[i:i+size]) for i in range(len(seq) - size)]
-    #if pieces.count(region) != 1:
-    #    raise ValueError("Non-single match: %s to %s" % (region, seq))
-    if right_side:
-        try:
-            pos = seq.find(region)
-        # handle Biopython SeqRecords
-        except AttributeError:
-            pos = seq.seq.find(region)
-        return seq[:pos]
-    else:
-        try:
-            pos = seq.rfind(region)
-        # handle Biopython SeqRecords
-        except AttributeError:
-            pos = seq.seq.rfind(region)
-        return seq[pos+len(region):]
+from Bio.Seq import Seq
 
 def trim_adaptor(seq, adaptor, num_errors, right_side=True):
     """Trim the given adaptor sequence from a starting sequence.
@@ -56,31 +48,391 @@ def trim_adaptor(seq, adaptor, num_errors, right_side=True):
     adaptor and the base sequence. Matches with more than this number of errors
     are not allowed.
     """
-    gap_char = '-'
-    exact_pos = str(seq).find(adaptor)
-    if exact_pos >= 0:
-        seq_region = str(seq[exact_pos:exact_pos+len(adaptor)])
-        adapt_region = adaptor
-    else:
-        aligns = pairwise2.align.localms(str(seq), str(adaptor), 
-                5.0, -4.0, -9.0, -0.5, one_alignment_only=True, 
-                gap_char=gap_char)
-        if len(aligns) == 0:
-            adapt_region, seq_region = ("", "")
+    start, end = adaptor_region(seq, adaptor, num_errors, right_side)
+    return seq[start:end]
+
+def adaptor_region(seq, adaptor, num_errors, right_side=True):
+    """Coordinates of the sequence remaining after trimming an adaptor.
+
+    Returns the start and end to slice the sequence, and any associated
+    quality scores, with. Takes the same arguments as trim_adaptor.
+    """
+    return _adaptor_region(_seq_str(seq), adaptor, num_errors, right_side)
+
+def _seq_str(seq):
+    """Retrieve the sequence string of a string, Seq or SeqRecord.
+    """
+    try:
+        return str(seq.seq)
+    except AttributeError:
+        return str(seq)
+
+# Scores of the local alignment placing adaptors in reads, as given to
+# pairwise2.align.localms: match, mismatch, gap open and gap extend
+_MATCH, _MISMATCH, _GAP_OPEN, _GAP_EXTEND = 5.0, -4.0, -9.0, -0.5
+
+# How each read in a batch was matched, from _adaptor_regions_batch
+EXACT, MISMATCH, ALIGNED, NO_MATCH = 0, 1, 2, -1
+
+def _adaptor_region(seq_str, adaptor, num_errors, right_side=True):
+    """Coordinates of the sequence left after trimming an adaptor.
+
+    Returns a start and end to slice the sequence with; sequences without
+    a match within num_errors are returned whole.
+    """
+    region = _adaptor_matches([seq_str], adaptor, num_errors)[0][0]
+    if region is None:
+        return 0, len(seq_str)
+    return _remove_region(seq_str, region, right_side)
+
+def _adaptor_matches(seq_strs, adaptor, num_errors):
+    """Find the read region matching an adaptor in each sequence.
+
+    Sequences without an exact match are aligned locally to the adaptor,
+    as pairwise2.align.localms did, and the aligned read bases are the
+    match. Errors are adaptor bases not aligned to an identical read base,
+    including those clipped from the ends of the alignment; bases inserted
+    in the read are not counted. Sequences whose longest common subsequence
+    with the adaptor leaves too many errors are not aligned.
+
+    Returns a region, number of errors and match type for each sequence,
+    with a region of None for those without a match within num_errors.
+    Aligned sequences with too many errors keep the number of errors;
+    sequences not aligned have None.
+    """
+    found = [(None, None, NO_MATCH)] * len(seq_strs)
+    to_align = []
+    for i, seq_str in enumerate(seq_strs):
+        if seq_str.find(adaptor) >= 0:
+            found[i] = (adaptor, 0, EXACT)
+        elif _lcs_length(adaptor, seq_str) >= len(adaptor) - num_errors:
+            to_align.append(i)
+    alignments = _local_alignments([seq_strs[i] for i in to_align], adaptor)
+    for i, (region, errors, gapped) in zip(to_align, alignments):
+        if errors > num_errors:
+            found[i] = (None, errors, NO_MATCH)
+        elif gapped:
+            found[i] = (region, errors, ALIGNED)
         else:
-            seq_a, adaptor_a, score, start, end = aligns[0]
-            adapt_region = adaptor_a[start:end]
-            #print seq_a, adaptor_a, score, start, end
-            seq_region = seq_a[start:end]
-    matches = sum((1 if s == adapt_region[i] else 0) for i, s in
-            enumerate(seq_region))
-    # too many errors -- no trimming
-    if (len(adaptor) - matches) > num_errors:
-        return seq
-    # remove the adaptor sequence and return the result
+            found[i] = (region, errors, MISMATCH)
+    return found
+
+def _remove_region(seq_str, region, right_side):
+    """Coordinates left after removing a matched region from a sequence.
+
+    The first copy of the region and everything after it are removed, or
+    the last copy and everything before it when right_side is False.
+    """
+    if right_side:
+        return 0, seq_str.find(region)
     else:
-        return _remove_adaptor(seq, seq_region.replace(gap_char, ""),
-                right_side)
+        pos = seq_str.rfind(region)
+        return pos + len(region), len(seq_str)
+
+def _lcs_length(pattern, text):
+    """Length of the longest common subsequence of pattern and text.
+
+    Uses a bit-parallel algorithm (Allison and Dix, Inf. Process. Lett.
+    23:305-310, 1986), with one bit per pattern base. An alignment can not
+    match more bases than this.
+    """
+    mask = (1 << len(pattern)) - 1
+    peq = dict()
+    for i, base in enumerate(pattern):
+        peq[base] = peq.get(base, 0) | (1 << i)
+    v = mask
+    for base in text:
+        u = v & peq.get(base, 0)
+        v = ((v + u) | (v - u)) & mask
+    return len(pattern) - bin(v).count("1")
+
+def _local_alignments(seq_strs, adaptor, chunk_size=1024):
+    """Align an adaptor to each read, giving the alignment pairwise2 chose.
+
+    Reads are aligned together in chunks with _local_align_matrices. The
+    alignment starts at the first best scoring cell, row by row, and takes
+    the first traceback at each step, as with one_alignment_only. Returns
+    the aligned read bases, the number of adaptor bases not aligned to an
+    identical base and whether there are gaps, for each read.
+    """
+    alignments = []
+    for chunk_start in range(0, len(seq_strs), chunk_size):
+        chunk = seq_strs[chunk_start:chunk_start + chunk_size]
+        lengths = numpy.array([len(s) for s in chunk], dtype=numpy.int64)
+        if len(adaptor) == 0 or lengths.max() == 0:
+            alignments.extend([("", len(adaptor), False)] * len(chunk))
+            continue
+        scores, trace_rows, trace_cols = _local_align_matrices(
+                _pack_reads(chunk, lengths), adaptor)
+        in_read = numpy.arange(scores.shape[1])[numpy.newaxis, :,
+                numpy.newaxis] < lengths[:, numpy.newaxis, numpy.newaxis]
+        best = numpy.where(in_read, scores, -numpy.inf).reshape(
+                len(chunk), -1).argmax(axis=1)
+        for i, seq_str in enumerate(chunk):
+            alignments.append(_recover_alignment(seq_str, adaptor, scores[i],
+                trace_rows[i], trace_cols[i], divmod(int(best[i]),
+                    len(adaptor))))
+    return alignments
+
+def _local_align_matrices(reads, adaptor):
+    """Score and traceback matrices of local alignments of reads to an adaptor.
+
+    reads is a zero padded byte array with a row per read. This is the
+    affine gap recurrence of pairwise2's _make_score_matrix_fast, with the
+    same tie breaking, run on all reads at once and filling one adaptor
+    position of each matrix at a time. Gaps reach back to the earliest of
+    the best scoring cells. Returns scores and the read and adaptor
+    position of the first traceback, -1 where there is none, indexed by
+    read, read position and adaptor position.
+    """
+    num_reads, num_rows = reads.shape
+    size = len(adaptor)
+    # matrices are filled by adaptor position, so keep those first
+    match = numpy.where(numpy.frombuffer(adaptor, dtype=numpy.uint8)[
+        numpy.newaxis, :, numpy.newaxis] == reads[:, numpy.newaxis, :],
+        _MATCH, _MISMATCH)
+    # the first read and adaptor positions score only their match
+    scores = match.copy()
+    trace_rows = numpy.zeros(scores.shape, dtype=numpy.int32) - 1
+    trace_cols = numpy.zeros(scores.shape, dtype=numpy.int32) - 1
+    rows = numpy.arange(num_rows)
+    not_best = numpy.zeros((num_reads, num_rows - 1), dtype=numpy.int32)
+    for col in range(1, size):
+        prev = scores[:, col - 1]
+        nogap = prev[:, :-1]
+        # gaps in the read come from the best cell to the left, up to col - 2,
+        # with scores shifted so extending by a position costs nothing
+        if col == 1:
+            row_gap = nogap - 1.0
+            row_gap_cols = not_best
+        else:
+            shifted = scores[:, col - 2] - _GAP_EXTEND * (col - 2)
+            if col == 2:
+                row_best = shifted.copy()
+                row_best_cols = numpy.zeros(shifted.shape, dtype=numpy.int32)
+            else:
+                higher = shifted > row_best
+                row_best[higher] = shifted[higher]
+                row_best_cols[higher] = col - 2
+            row_gap = row_best[:, :-1] + _GAP_OPEN + _GAP_EXTEND * (col - 2)
+            row_gap_cols = row_best_cols[:, :-1]
+        # gaps in the adaptor come from the best cell of the previous
+        # position, up to row - 2, found with running maximums
+        shifted = prev - _GAP_EXTEND * rows
+        running = numpy.maximum.accumulate(shifted, axis=1)
+        higher = numpy.ones(shifted.shape, dtype=bool)
+        higher[:, 1:] = shifted[:, 1:] > running[:, :-1]
+        running_rows = numpy.maximum.accumulate(
+                numpy.where(higher, rows, 0), axis=1)
+        col_gap = nogap - 1.0
+        col_gap[:, 1:] = running[:, :-2] + _GAP_OPEN + _GAP_EXTEND * rows[:-2]
+        col_gap_rows = not_best.copy()
+        col_gap_rows[:, 1:] = running_rows[:, :-2]
+        best = numpy.maximum(nogap, numpy.maximum(row_gap, col_gap))
+        # ties prefer no gap, then a gap in the read
+        use_nogap = nogap == best
+        use_row_gap = ~use_nogap & (row_gap == best)
+        use_col_gap = ~use_nogap & ~use_row_gap
+        trace_rows[:, col, 1:] = numpy.where(use_col_gap, col_gap_rows,
+                rows[:-1])
+        trace_cols[:, col, 1:] = numpy.where(use_row_gap, row_gap_cols,
+                col - 1)
+        scores[:, col, 1:] = numpy.maximum(best + match[:, col, 1:], 0.0)
+    return (scores.transpose(0, 2, 1), trace_rows.transpose(0, 2, 1),
+            trace_cols.transpose(0, 2, 1))
+
+def _recover_alignment(seq_str, adaptor, scores, trace_rows, trace_cols,
+        start):
+    """Aligned read bases, errors and gaps of a traceback from start.
+
+    Follows pairwise2's _recover_alignments and _clean_alignments for a
+    local alignment, including where the reported alignment begins and
+    ends. Empty alignments give an empty region with every base an error.
+    """
+    if not seq_str or not adaptor:
+        return "", len(adaptor), False
+    row, col = start
+    # alignment columns after the end, left from the first traceback step
+    after_end = max(len(seq_str) - row, len(adaptor) - col) - 1
+    seq_aln = adaptor_aln = ""
+    prev_row, prev_col = len(seq_str), len(adaptor)
+    begin = None
+    while row >= 0:
+        width = max(prev_row - row, prev_col - col)
+        seq_aln = seq_str[row:prev_row].ljust(width, "-") + seq_aln
+        adaptor_aln = adaptor[col:prev_col].ljust(width, "-") + adaptor_aln
+        # local alignments stop at cells scoring zero or less
+        if scores[row, col] <= 0:
+            begin = max(prev_row, prev_col)
+            prev_row, prev_col = row, col
+            break
+        prev_row, prev_col = row, col
+        row = int(trace_rows[prev_row, prev_col])
+        col = int(trace_cols[prev_row, prev_col])
+    traced = len(seq_aln)
+    seq_aln = seq_str[:prev_row] + seq_aln
+    adaptor_aln = adaptor[:prev_col] + adaptor_aln
+    width = max(len(seq_aln), len(adaptor_aln))
+    seq_aln = seq_aln.rjust(width, "-")
+    adaptor_aln = adaptor_aln.rjust(width, "-")
+    if begin is None:
+        begin = width - traced
+    end = width - after_end
+    if begin >= end:
+        return "", len(adaptor), False
+    seq_aln = seq_aln[begin:end]
+    adaptor_aln = adaptor_aln[begin:end]
+    identical = len([s for s, a in zip(seq_aln, adaptor_aln) if s == a])
+    gapped = "-" in seq_aln or "-" in adaptor_aln
+    return seq_aln.replace("-", ""), len(adaptor) - identical, gapped
+
+def adaptor_regions_batch(seqs, adaptor, num_errors, right_side=True):
+    """Coordinates left after trimming an adaptor from a batch of sequences.
+
+    Gives the same result as trim_adaptor for each sequence. Reads without
+    an exact match are packed into a NumPy byte array and aligned to the
+    adaptor together.
+
+    Returns arrays of start and end coordinates for each sequence.
+    """
+    starts, ends, _, _ = _adaptor_regions_batch(seqs, adaptor, num_errors,
+            right_side)
+    return starts, ends
+
+def _adaptor_regions_batch(seqs, adaptor, num_errors, right_side=True):
+    """Batch coordinates, also returning how each read was matched.
+
+    Match types are EXACT, MISMATCH for alignments without gaps, ALIGNED
+    for gapped alignments and NO_MATCH for reads without an adaptor. The
+    number of errors of each match is returned too. Reads aligned with more
+    than num_errors errors are NO_MATCH with their number of errors, and
+    reads not aligned at all have -1.
+    """
+    seq_strs = [_seq_str(s) for s in seqs]
+    lengths = numpy.array([len(s) for s in seq_strs], dtype=numpy.int64)
+    starts = numpy.zeros(len(seq_strs), dtype=numpy.int64)
+    ends = lengths.copy()
+    matches = numpy.zeros(len(seq_strs), dtype=numpy.int64) + NO_MATCH
+    errors = numpy.zeros(len(seq_strs), dtype=numpy.int64) - 1
+    for i, (region, cur_errors, match_type) in enumerate(
+            _adaptor_matches(seq_strs, adaptor, num_errors)):
+        if cur_errors is not None:
+            errors[i] = cur_errors
+        if region is not None:
+            starts[i], ends[i] = _remove_region(seq_strs[i], region,
+                    right_side)
+            matches[i] = match_type
+    return starts, ends, matches, errors
+
+def trim_adaptor_batch(seqs, adaptor, num_errors, right_side=True):
+    """Trim an adaptor from a list of strings, Seqs or SeqRecords.
+    """
+    starts, ends = adaptor_regions_batch(seqs, adaptor, num_errors,
+            right_side)
+    return [seq[start:end] for seq, start, end in
+            zip(seqs, starts.tolist(), ends.tolist())]
+
+def _pack_reads(seq_strs, lengths):
+    """Pack read strings into a zero padded two dimensional byte array.
+    """
+    reads = numpy.zeros((len(seq_strs), int(lengths.max())), dtype=numpy.uint8)
+    in_read = numpy.arange(reads.shape[1])[numpy.newaxis, :] < \
+            lengths[:, numpy.newaxis]
+    reads[in_read] = numpy.frombuffer("".join(seq_strs), dtype=numpy.uint8)
+    return reads
+
+class MultiAdaptorTrimmer:
+    """Trim the best matching of several adaptors from each read.
+
+    A k-mer seed index over all adaptors finds the candidate adaptors for
+    each read in a single scan. Seeds are short enough that a match within
+    num_errors contains one exactly, unless bases inserted in the read
+    split every error free piece: an adaptor split into num_errors + 1
+    pieces has at least one piece without errors, but insertions are not
+    counted as errors. Each adaptor is then searched only in reads where
+    it is a candidate. When several adaptors match, the one trimming the
+    most sequence is used. Ties go to the adaptor with the fewest errors,
+    then to the adaptor listed first.
+    """
+    def __init__(self, adaptors, num_errors, right_side=True, seed_size=None):
+        self.adaptors = list(adaptors)
+        self._num_errors = num_errors
+        self._right_side = right_side
+        if seed_size is None:
+            seed_size = max(1, min(12, min([len(a) for a in self.adaptors]) //
+                (num_errors + 1)))
+        self._seed_size = seed_size
+        self._seeds = dict()
+        for i, adaptor in enumerate(self.adaptors):
+            for pos in range(len(adaptor) - seed_size + 1):
+                self._seeds.setdefault(adaptor[pos:pos + seed_size],
+                        set()).add(i)
+
+    def candidates(self, seq_str):
+        """Indexes of adaptors sharing a seed with the sequence.
+        """
+        found = set()
+        for pos in range(len(seq_str) - self._seed_size + 1):
+            hit = self._seeds.get(seq_str[pos:pos + self._seed_size])
+            if hit:
+                found.update(hit)
+        return found
+
+    def regions(self, seqs):
+        """Coordinates left after trimming, and the adaptor used, per read.
+
+        Returns arrays of starts, ends and adaptor indexes, with -1 for
+        reads without an adaptor.
+        """
+        starts, ends, used, _, _ = self._regions(seqs)
+        return starts, ends, used
+
+    def _regions(self, seqs):
+        """Coordinates and adaptor used, with how each read was matched.
+
+        Also returns the errors of each match as in _adaptor_regions_batch;
+        reads without a match keep the errors of a candidate adaptor
+        aligned with too many errors, or -1.
+        """
+        seq_strs = [_seq_str(s) for s in seqs]
+        lengths = numpy.array([len(s) for s in seq_strs], dtype=numpy.int64)
+        starts = numpy.zeros(len(seq_strs), dtype=numpy.int64)
+        ends = lengths.copy()
+        used = numpy.zeros(len(seq_strs), dtype=numpy.int64) - 1
+        matches = numpy.zeros(len(seq_strs), dtype=numpy.int64) + NO_MATCH
+        errors = numpy.zeros(len(seq_strs), dtype=numpy.int64) - 1
+        by_adaptor = [[] for a in self.adaptors]
+        for i, seq_str in enumerate(seq_strs):
+            for adaptor_index in self.candidates(seq_str):
+                by_adaptor[adaptor_index].append(i)
+        for adaptor_index, read_indexes in enumerate(by_adaptor):
+            if len(read_indexes) == 0:
+                continue
+            read_indexes = numpy.array(read_indexes)
+            cur_starts, cur_ends, cur_matches, cur_errors = \
+                    _adaptor_regions_batch([seq_strs[i] for i in read_indexes],
+                        self.adaptors[adaptor_index], self._num_errors,
+                        self._right_side)
+            if self._right_side:
+                better = cur_ends < ends[read_indexes]
+                ties = cur_ends == ends[read_indexes]
+            else:
+                better = cur_starts > starts[read_indexes]
+                ties = cur_starts == starts[read_indexes]
+            trimmed = (cur_ends - cur_starts) < lengths[read_indexes]
+            better |= ties & (used[read_indexes] >= 0) & \
+                    (cur_errors < errors[read_indexes])
+            better &= trimmed
+            over = (used[read_indexes] < 0) & (cur_matches == NO_MATCH) & \
+                    (cur_errors >= 0)
+            errors[read_indexes[over]] = cur_errors[over]
+            read_indexes = read_indexes[better]
+            starts[read_indexes] = cur_starts[better]
+            ends[read_indexes] = cur_ends[better]
+            used[read_indexes] = adaptor_index
+            matches[read_indexes] = cur_matches[better]
+            errors[read_indexes] = cur_errors[better]
+        return starts, ends, used, matches, errors
 
 def trim_adaptor_w_qual(seq, qual, adaptor, num_errors, right_side=True):
     """Trim an adaptor with an associated quality string.
@@ -88,24 +440,324 @@ def trim_adaptor_w_qual(seq, qual, adaptor, num_errors, right_side=True):
     Works like trimmed adaptor, but also trims an associated quality score.
     """
     assert len(seq) == len(qual)
-    tseq = trim_adaptor(seq, adaptor, num_errors, right_side=right_side)
-    if right_side:
-        pos = seq.find(tseq)
+    start, end = adaptor_region(seq, adaptor, num_errors, right_side)
+    return seq[start:end], qual[start:end]
+
+class TrimStats:
+    """Counts of reads handled while trimming, and time spent in each stage.
+
+    reads_in, reads_out -- Reads read from the input and written.
+    exact, mismatch, aligned -- Reads trimmed with an exact adaptor match,
+    an alignment with mismatches only, or an alignment with insertions or
+    deletions.
+    rejected -- Reads aligned to an adaptor with more than num_errors errors.
+    no_match -- Reads not aligned to any adaptor, since they share no seed
+    with it or too few bases to be within num_errors.
+    empty -- Reads trimmed to nothing.
+    lengths -- Histogram of written read lengths after trimming.
+    adaptor_hits -- Reads trimmed with each adaptor.
+    times -- Seconds spent parsing, matching and writing. Matching and
+    formatting in worker processes are summed over all workers.
+    elapsed -- Total seconds taken.
+    """
+    def __init__(self, adaptors=None):
+        self.reads_in = 0
+        self.reads_out = 0
+        self.exact = 0
+        self.mismatch = 0
+        self.aligned = 0
+        self.rejected = 0
+        self.no_match = 0
+        self.empty = 0
+        self.lengths = dict()
+        self.adaptor_hits = dict()
+        for adaptor in adaptors or []:
+            self.adaptor_hits[adaptor] = 0
+        self.times = dict(parse=0.0, match=0.0, write=0.0)
+        self.elapsed = 0.0
+
+    def count_reads(self, lengths, trimmed_lengths, matches, errors, used,
+            written, adaptors):
+        """Add counts for a batch of reads from arrays of per-read values.
+
+        matches and errors are match types and errors from
+        _adaptor_regions_batch, and used the index in adaptors of the
+        adaptor trimmed, or -1.
+        """
+        self.reads_in += len(lengths)
+        self.reads_out += int(written.sum())
+        match_counts = numpy.bincount(matches - NO_MATCH,
+                minlength=ALIGNED - NO_MATCH + 1)
+        self.rejected += int(((matches == NO_MATCH) & (errors >= 0)).sum())
+        self.no_match += int(((matches == NO_MATCH) & (errors < 0)).sum())
+        self.exact += int(match_counts[EXACT - NO_MATCH])
+        self.mismatch += int(match_counts[MISMATCH - NO_MATCH])
+        self.aligned += int(match_counts[ALIGNED - NO_MATCH])
+        self.empty += int((trimmed_lengths[matches != NO_MATCH] == 0).sum())
+        length_counts = numpy.bincount(trimmed_lengths[written])
+        for length in numpy.flatnonzero(length_counts):
+            self.lengths[int(length)] = (self.lengths.get(int(length), 0) +
+                    int(length_counts[length]))
+        hits = numpy.bincount(used[used >= 0], minlength=len(adaptors))
+        for adaptor, count in zip(adaptors, hits.tolist()):
+            self.adaptor_hits[adaptor] = (self.adaptor_hits.get(adaptor, 0) +
+                    count)
+
+    def add(self, other):
+        """Add the counts and times from another TrimStats, like a batch.
+        """
+        for attr in ["reads_in", "reads_out", "exact", "mismatch", "aligned",
+                "rejected", "no_match", "empty"]:
+            setattr(self, attr, getattr(self, attr) + getattr(other, attr))
+        for to_dict, from_dict in [(self.lengths, other.lengths),
+                (self.adaptor_hits, other.adaptor_hits),
+                (self.times, other.times)]:
+            for key, val in from_dict.items():
+                to_dict[key] = to_dict.get(key, 0) + val
+
+    def reads_per_second(self):
+        if self.elapsed > 0:
+            return self.reads_in / self.elapsed
+        return 0.0
+
+    def summary(self):
+        """Dictionary of all counts and times, as written to JSON.
+        """
+        return dict(reads_in=self.reads_in, reads_out=self.reads_out,
+                exact=self.exact, mismatch=self.mismatch,
+                aligned=self.aligned, rejected=self.rejected,
+                no_match=self.no_match, empty=self.empty, adaptor_hits=dict(self.adaptor_hits),
+                lengths=dict([(str(k), v) for k, v in self.lengths.items()]),
+                times=dict(self.times), elapsed=self.elapsed,
+                reads_per_second=self.reads_per_second())
+
+    def write_json(self, out_file):
+        with open(out_file, "w") as out_handle:
+            json.dump(self.summary(), out_handle, indent=2, sort_keys=True,
+                    separators=(",", ": "))
+            out_handle.write("\n")
+
+def trim_fastq(in_handle, out_handle, adaptor, num_errors,
+        out_format="fasta", workers=1, batch_size=10000):
+    """Trim an adaptor from FASTQ reads, writing the trimmed reads.
+
+    Reads are handled as raw four line records without building SeqRecords.
+    Batches of batch_size reads are trimmed and formatted as FASTA or FASTQ
+    by a pool of worker processes and written in input order; workers=None
+    uses the number of CPUs. As before, reads without an adaptor or trimmed
+    to nothing are not written.
+
+    adaptor may be a list of adaptors, trimming each read with the best
+    matching one using a MultiAdaptorTrimmer. Returns a TrimStats with the
+    number of reads trimmed by each adaptor in adaptor_hits.
+    """
+    start_time = time.time()
+    if isinstance(adaptor, (list, tuple)):
+        adaptors = list(adaptor)
+        trimmer = MultiAdaptorTrimmer(adaptors, num_errors)
     else:
-        pos = seq.rfind(tseq)
-    tqual = qual[pos:pos+len(tseq)]
-    assert len(tseq) == len(tqual)
-    return tseq, tqual
+        adaptors = [adaptor]
+        trimmer = adaptor
+    stats = TrimStats(adaptors)
+    for out_text, batch_stats in _ordered_map(_trim_batch,
+            _timed_batches(_fastq_batches(in_handle, batch_size), stats),
+            (trimmer, num_errors, out_format), workers):
+        write_start = time.time()
+        out_handle.write(out_text)
+        stats.times["write"] += time.time() - write_start
+        stats.add(batch_stats)
+    stats.elapsed = time.time() - start_time
+    return stats
+
+def trim_fastq_pairs(in_handles, out_handles, adaptors, num_errors,
+        out_format="fastq", workers=1, batch_size=10000):
+    """Trim adaptors from paired end FASTQ reads, keeping pairs in sync.
+
+    in_handles, out_handles and adaptors are pairs for the first and second
+    reads. Both files are read in lockstep and each read is trimmed once
+    with its own adaptor. Since only short fragments read into the adaptor,
+    untrimmed reads are kept; a pair is written when both reads have
+    sequence remaining. Returns a TrimStats counting reads from both files.
+    """
+    start_time = time.time()
+    stats = TrimStats(adaptors)
+    for out_text1, out_text2, batch_stats in _ordered_map(_trim_pair_batch,
+            _timed_batches(_paired_batches(in_handles, batch_size), stats),
+            (adaptors, num_errors, out_format), workers):
+        write_start = time.time()
+        out_handles[0].write(out_text1)
+        out_handles[1].write(out_text2)
+        stats.times["write"] += time.time() - write_start
+        stats.add(batch_stats)
+    stats.elapsed = time.time() - start_time
+    return stats
+
+def _paired_batches(in_handles, batch_size):
+    """Read batches from paired files, checking they have the same reads.
+    """
+    batches2 = _fastq_batches(in_handles[1], batch_size)
+    for batch1 in _fastq_batches(in_handles[0], batch_size):
+        batch2 = next(batches2, None)
+        if batch2 is None or len(batch1[0]) != len(batch2[0]):
+            raise ValueError("Paired files have different numbers of reads")
+        yield batch1, batch2
+    if next(batches2, None) is not None:
+        raise ValueError("Paired files have different numbers of reads")
+
+def _ordered_map(fn, batches, args, workers):
+    """Apply a function to batches, in a pool of processes if workers > 1.
+
+    Results are returned in input order, with at most four batches per
+    worker in progress; workers=None uses the number of CPUs.
+    """
+    if workers == 1:
+        for batch in batches:
+            yield fn(batch, *args)
+        return
+    import multiprocessing
+    import collections
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(pool.apply_async(fn, (batch,) + tuple(args)))
+            # limit the number of batches held in memory
+            if len(pending) >= workers * 4:
+                yield pending.popleft().get()
+        while len(pending) > 0:
+            yield pending.popleft().get()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
+
+def _timed_batches(batches, stats):
+    """Pass on batches, adding the time spent reading them to stats.
+    """
+    while 1:
+        start = time.time()
+        batch = next(batches, None)
+        stats.times["parse"] += time.time() - start
+        if batch is None:
+            break
+        yield batch
+
+def _fastq_batches(in_handle, batch_size):
+    """Read FASTQ in batches of titles, sequences and quality strings.
+
+    Expects the usual four lines per read, without line wrapping.
+    """
+    while 1:
+        lines = list(itertools.islice(in_handle, 4 * batch_size))
+        if len(lines) == 0:
+            break
+        while len(lines) % 4 != 0 and not lines[-1].strip():
+            lines.pop()
+        titles = lines[0::4]
+        if (len(lines) % 4 != 0 or
+                [l for l in titles if not l.startswith("@")] or
+                [l for l in lines[2::4] if not l.startswith("+")]):
+            raise ValueError("Expected four line FASTQ records, found: %s" %
+                    titles[0].rstrip())
+        yield ([l[1:].rstrip() for l in titles],
+               [l.rstrip() for l in lines[1::4]],
+               [l.rstrip() for l in lines[3::4]])
+
+def _trim_batch(batch, trimmer, num_errors, out_format):
+    """Trim a batch of reads, returning output text for the trimmed ones.
+
+    trimmer is an adaptor sequence or a MultiAdaptorTrimmer. Also returns
+    a TrimStats for the batch.
+    """
+    titles, seqs, quals = batch
+    stats = TrimStats()
+    match_start = time.time()
+    if isinstance(trimmer, MultiAdaptorTrimmer):
+        starts, ends, used, matches, errors = trimmer._regions(seqs)
+        adaptors = trimmer.adaptors
+    else:
+        starts, ends, matches, errors = _adaptor_regions_batch(seqs, trimmer,
+                num_errors)
+        used = numpy.where(matches != NO_MATCH, 0, -1)
+        adaptors = [trimmer]
+    stats.times["match"] += time.time() - match_start
+    write_start = time.time()
+    lengths = numpy.array([len(s) for s in seqs], dtype=numpy.int64)
+    written = (ends - starts > 0) & (ends - starts < lengths)
+    out = []
+    for i, start, end in zip(numpy.flatnonzero(written).tolist(),
+            starts[written].tolist(), ends[written].tolist()):
+        out.append(_format_read(titles[i], seqs[i][start:end],
+            quals[i][start:end], out_format))
+    stats.times["write"] += time.time() - write_start
+    stats.count_reads(lengths, ends - starts, matches, errors, used, written,
+            adaptors)
+    return "".join(out), stats
+
+def _trim_pair_batch(batch_pair, adaptors, num_errors, out_format):
+    """Trim batches of first and second reads, returning output for each.
+
+    Also returns a TrimStats for the reads of both batches.
+    """
+    (titles1, seqs1, quals1), (titles2, seqs2, quals2) = batch_pair
+    stats = TrimStats()
+    match_start = time.time()
+    starts1, ends1, matches1, errors1 = _adaptor_regions_batch(seqs1,
+            adaptors[0], num_errors)
+    starts2, ends2, matches2, errors2 = _adaptor_regions_batch(seqs2,
+            adaptors[1], num_errors)
+    stats.times["match"] += time.time() - match_start
+    write_start = time.time()
+    out1 = []
+    out2 = []
+    for i, (start1, end1, start2, end2) in enumerate(zip(starts1.tolist(),
+            ends1.tolist(), starts2.tolist(), ends2.tolist())):
+        if _pair_name(titles1[i]) != _pair_name(titles2[i]):
+            raise ValueError("Paired reads out of sync: %s %s" % (titles1[i],
+                titles2[i]))
+        if end1 - start1 > 0 and end2 - start2 > 0:
+            out1.append(_format_read(titles1[i], seqs1[i][start1:end1],
+                quals1[i][start1:end1], out_format))
+            out2.append(_format_read(titles2[i], seqs2[i][start2:end2],
+                quals2[i][start2:end2], out_format))
+    stats.times["write"] += time.time() - write_start
+    written = (ends1 - starts1 > 0) & (ends2 - starts2 > 0)
+    for i, (starts, ends, matches, errors, seqs) in enumerate([
+            (starts1, ends1, matches1, errors1, seqs1),
+            (starts2, ends2, matches2, errors2, seqs2)]):
+        lengths = numpy.array([len(s) for s in seqs], dtype=numpy.int64)
+        stats.count_reads(lengths, ends - starts, matches, errors,
+                numpy.where(matches != NO_MATCH, i, -1), written, adaptors)
+    return "".join(out1), "".join(out2), stats
+
+def _pair_name(title):
+    name = title.split(None, 1)[0]
+    if name.endswith("/1") or name.endswith("/2"):
+        name = name[:-2]
+    return name
+
+def _format_read(title, seq, qual, out_format):
+    if out_format == "fastq":
+        return "@%s\n%s\n+\n%s\n" % (title, seq, qual)
+    else:
+        return ">%s\n%s\n" % (title, "\n".join([seq[i:i + 60]
+            for i in range(0, len(seq), 60)]))
 
 # ------- Testing Code
 import unittest
+import StringIO
+import random
 
+from Bio import SeqIO
 from Bio.SeqRecord import SeqRecord
 from Bio.Seq import Seq
 from Bio.Alphabet.IUPAC import unambiguous_dna
 
 class AdaptorAlignTrimTest(unittest.TestCase):
-    """Test remove adaptor sequences using local alignments.
+    """Test remove adaptor sequences using approximate matching.
     """
     def t_1_simple_trim(self):
         """Trim adaptor from non-complex region with errors and deletions.
@@ -187,6 +839,211 @@ class AdaptorAlignTrimTest(unittest.TestCase):
         tseq = trim_adaptor(to_trim, adaptor, 2)
         assert tseq == to_trim
 
+    def t_7_batch_trim(self):
+        """Trim a batch of reads, matching trimming of single reads.
+        """
+        adaptor = "GATCGATCGATC"
+        seqs = ["GGG" + adaptor + "CCC", "GGG" + "GATCGTTCGATC" + "CCC",
+                "GGG" + "GAACGTTGGATC" + "CCC", "GG", "",
+                "GGG" + "GATCGATCGATC" + "TGATCGATCGATC",
+                "TTTTTTTTTTTTTTTTTT", "GGGGATCGATC", "GGG" + "GACGATCGTC",
+                "GGG" + "GATCGATCGTC" + "CCC"]
+        for right_side in [True, False]:
+            expected = [trim_adaptor(s, adaptor, 2, right_side) for s in seqs]
+            assert trim_adaptor_batch(seqs, adaptor, 2, right_side) == \
+                    expected
+        assert trim_adaptor_batch(seqs[-1:], adaptor, 2, False) == ["CCC"]
+        recs = [SeqRecord(Seq(s, unambiguous_dna), "r%s" % i)
+                for i, s in enumerate(seqs[:2])]
+        trecs = trim_adaptor_batch(recs, adaptor, 2)
+        assert [str(r.seq) for r in trecs] == ["GGG", "GGG"]
+        starts, ends = adaptor_regions_batch(seqs[:2], adaptor, 2, False)
+        assert starts.tolist() == [15, 15] and ends.tolist() == [18, 18]
+
+    def t_8_alignment_errors(self):
+        """Count partial adaptors as errors, but not read insertions.
+        """
+        adaptor = "GATCGATCGATC"
+        tseq = trim_adaptor("GGG" + "GATCGAATCGATC" + "CCC", adaptor, 1)
+        assert tseq == "GGG"
+        tseq = trim_adaptor("GGG" + "GATCGATCGA", adaptor, 2) # partial
+        assert tseq == "GGG"
+        tseq = trim_adaptor("GGG" + "GATCGATCG", adaptor, 2)
+        assert tseq == "GGGGATCGATCG"
+        tseq = trim_adaptor("GGG" + "GATTTCGATTTCGATC" + "CCC", adaptor, 0)
+        assert tseq == "GGG"
+        assert _lcs_length("GATC", "TTGTTCTT") == 3
+        assert _lcs_length("GATC", "") == 0
+
+    def t_9_fastq_pipeline(self):
+        """Trim FASTQ reads in batches and processes, keeping input order.
+        """
+        adaptor = "GATCGATCGATC"
+        reads = [("r1 first", "GGG" + "GATCGTTCGATC" + "CCC"),
+                 ("r2", "TTTTTTTTTTTTTTTTTT"), ("r3", "GATCGATCGATC" + "AA"),
+                 ("r4", "A" * 70 + adaptor)]
+        fastq = "".join(["@%s\n%s\n+\n%s\n" % (title, seq, "I" * len(seq))
+            for title, seq in reads])
+        outputs = []
+        for out_format, workers in [("fasta", 1), ("fasta", 2),
+                ("fastq", 1), ("fastq", 2)]:
+            out_handle = StringIO.StringIO()
+            trim_fastq(StringIO.StringIO(fastq), out_handle, adaptor, 2,
+                    out_format, workers, batch_size=1)
+            outputs.append(out_handle.getvalue())
+        assert outputs[0] == outputs[1] and outputs[2] == outputs[3]
+        recs = list(SeqIO.parse(StringIO.StringIO(outputs[0]), "fasta"))
+        assert [(r.description, str(r.seq)) for r in recs] == \
+                [("r1 first", "GGG"), ("r4", "A" * 70)]
+        assert outputs[0].split("\n")[3] == "A" * 60
+        recs = list(SeqIO.parse(StringIO.StringIO(outputs[2]), "fastq"))
+        assert [len(r.letter_annotations["phred_quality"]) for r in recs] == \
+                [3, 70]
+
+    def t_10_paired_trim(self):
+        """Trim paired reads in sync, writing pairs with sequence remaining.
+        """
+        reads1 = [("p1/1", "GGG" + "GATCGATCGATC"), ("p2/1", "GATCGATCGATC"),
+                  ("p3/1", "TTTTTTTTTT")]
+        reads2 = [("p1/2", "CCC" + "AAGGAAGGAAGG"), ("p2/2", "CCCCCC"),
+                  ("p3/2", "TT" + "AAGGAAGGAAGG")]
+        in_handles = [StringIO.StringIO("".join(["@%s\n%s\n+\n%s\n" % (t, s,
+            "".join([chr(33 + i) for i in range(len(s))])) for t, s in reads]))
+            for reads in [reads1, reads2]]
+        out_handles = [StringIO.StringIO(), StringIO.StringIO()]
+        trim_fastq_pairs(in_handles, out_handles,
+                ["GATCGATCGATC", "AAGGAAGGAAGG"], 1, workers=2, batch_size=2)
+        recs1, recs2 = [list(SeqIO.parse(StringIO.StringIO(h.getvalue()),
+            "fastq")) for h in out_handles]
+        assert [(r.id, str(r.seq)) for r in recs1] == [("p1/1", "GGG"),
+                ("p3/1", "TTTTTTTTTT")]
+        assert [(r.id, str(r.seq)) for r in recs2] == [("p1/2", "CCC"),
+                ("p3/2", "TT")]
+        assert recs1[0].letter_annotations["phred_quality"] == [0, 1, 2]
+        in_handles = [StringIO.StringIO("@a/1\nAA\n+\nII\n"),
+                StringIO.StringIO("@b/2\nAA\n+\nII\n")]
+        self.assertRaises(ValueError, trim_fastq_pairs, in_handles,
+                out_handles, ["GATC", "GATC"], 0)
+
+    def t_11_multi_adaptor(self):
+        """Trim the best of several adaptors, counting hits for each.
+        """
+        adaptors = ["GATCGATCGATC", "TTGGCCTTGGCC", "GATCGAACGATC"]
+        trimmer = MultiAdaptorTrimmer(adaptors, 2)
+        seqs = ["AAA" + "GATCGATCGATC" + "CCC", "AAA" + "TTGGCATTGGCC",
+                "AAAAAAAAAA", "AATTGGCCTTGGCC" + "GATCGATCGATC",
+                "AAA" + "GATCGAACGATC"]
+        assert trimmer.candidates(seqs[2]) == set()
+        starts, ends, used = trimmer.regions(seqs)
+        assert [s[start:end] for s, start, end in zip(seqs, starts, ends)] == \
+                ["AAA", "AAA", "AAAAAAAAAA", "AA", "AAA"]
+        assert used.tolist() == [0, 1, -1, 1, 2]
+        fastq = "".join(["@r%s\n%s\n+\n%s\n" % (i, s, "I" * len(s))
+            for i, s in enumerate(seqs)])
+        stats = trim_fastq(StringIO.StringIO(fastq), StringIO.StringIO(),
+                adaptors, 2)
+        assert stats.adaptor_hits == {"GATCGATCGATC": 1, "TTGGCCTTGGCC": 2,
+                "GATCGAACGATC": 1}
+        stats = trim_fastq(StringIO.StringIO(fastq), StringIO.StringIO(),
+                "GATCGATCGATC", 2)
+        assert stats.adaptor_hits == {"GATCGATCGATC": 3}
+
+    def t_12_trim_stats(self):
+        """Count reads by how they were matched, with trimmed lengths.
+        """
+        adaptor = "GATCGATCGATC"
+        # the last read aligns across a long insertion, with 5 errors
+        seqs = ["AAAA" + adaptor, "CCC" + "GATCGTTCGATC", "TT" + "GATCGATCATC",
+                "AAAAAAAAAAAAAA", adaptor + "CC", "GGGGG" + "GATCTTTTGATC",
+                "GATCGA" + "G" * 50 + "TCGATC"]
+        fastq = "".join(["@r%s\n%s\n+\n%s\n" % (i, s, "I" * len(s))
+            for i, s in enumerate(seqs)])
+        stats = trim_fastq(StringIO.StringIO(fastq), StringIO.StringIO(),
+                adaptor, 2, workers=2, batch_size=2)
+        assert (stats.reads_in, stats.reads_out) == (7, 3)
+        assert (stats.exact, stats.mismatch, stats.aligned) == (2, 1, 1)
+        assert (stats.rejected, stats.no_match, stats.empty) == (1, 2, 1)
+        assert stats.lengths == {2: 1, 3: 1, 4: 1}
+        assert stats.adaptor_hits == {adaptor: 4}
+        assert stats.times["match"] > 0 and stats.elapsed > 0
+        summary = json.loads(json.dumps(stats.summary()))
+        assert summary["lengths"] == {"2": 1, "3": 1, "4": 1}
+        assert (summary["rejected"], summary["no_match"]) == (1, 2)
+        stats = trim_fastq(StringIO.StringIO(fastq), StringIO.StringIO(),
+                [adaptor, "TTGGCCTTGGCC"], 2)
+        assert (stats.rejected, stats.no_match) == (1, 2)
+        out_handles = [StringIO.StringIO(), StringIO.StringIO()]
+        stats = trim_fastq_pairs([StringIO.StringIO(fastq),
+            StringIO.StringIO(fastq)], out_handles, [adaptor, adaptor], 2)
+        assert (stats.reads_in, stats.reads_out) == (14, 12)
+        assert (stats.rejected, stats.no_match) == (2, 4)
+        assert stats.adaptor_hits == {adaptor: 8}
+        assert stats.lengths == {2: 2, 3: 2, 4: 2, 14: 2, 17: 2, 62: 2}
+
+    def t_13_pairwise2_regressions(self):
+        """Trim the same as the local alignments of pairwise2 did.
+        """
+        cases = [("TAGGCACTTCATTGCACGGAAGAGCTCGTATGCCGTCTTCTGCTTGAGTT",
+                  "GATCGGAAGAGCTCGTATGCCGTCTTCTGCTTG", 3, "TAGGCACTTCATTGCA"),
+                 ("CGTAGGCACCATCAAT", "CTGTAGGCACCATCAAT", 2, "C"),
+                 ("GGTCCAAGGATTAAAGTGTCGATCGTC", "GATCGATCGATC", 2,
+                  "GGTCCAAGGATTAAAGTGTCGATCGTC")]
+        for seq, adaptor, num_errors, expected in cases:
+            assert _pairwise2_trim(seq, adaptor, num_errors) == expected
+            assert trim_adaptor(seq, adaptor, num_errors) == expected
+            assert trim_adaptor_batch([seq], adaptor, num_errors) == \
+                    [expected]
+        rand = random.Random(41)
+        def _mutate(seq_str, edits):
+            seq = list(seq_str)
+            for i in range(rand.randint(1, 3)):
+                pos = rand.randrange(len(seq))
+                edit = rand.choice(edits)
+                if edit == "mismatch":
+                    seq[pos] = rand.choice("ACGT")
+                elif edit == "deletion":
+                    del seq[pos]
+                else:
+                    seq.insert(pos, rand.choice("ACGT"))
+            return "".join(seq)
+        for edits in [["mismatch"], ["deletion"],
+                ["mismatch", "deletion", "insertion"]]:
+            for i in range(100):
+                adaptor = "".join([rand.choice("ACGT") for j in
+                    range(rand.randint(8, 33))])
+                seq = ("".join([rand.choice("ACGT") for j in
+                    range(rand.randint(0, 30))]) + _mutate(adaptor, edits) +
+                    "".join([rand.choice("ACGT") for j in
+                        range(rand.randint(0, 15))]))
+                for right_side in [True, False]:
+                    expected = _pairwise2_trim(seq, adaptor, 2, right_side)
+                    assert trim_adaptor(seq, adaptor, 2, right_side) == \
+                            expected, (seq, adaptor, right_side)
+
+def _pairwise2_trim(seq, adaptor, num_errors, right_side=True):
+    """Trim an adaptor with a pairwise2 local alignment, as originally done.
+    """
+    from Bio import pairwise2
+    if seq.find(adaptor) >= 0:
+        seq_region = adapt_region = adaptor
+    else:
+        aligns = pairwise2.align.localms(seq, adaptor, 5.0, -4.0, -9.0, -0.5,
+                one_alignment_only=True, gap_char="-")
+        if len(aligns) == 0:
+            adapt_region, seq_region = ("", "")
+        else:
+            seq_a, adaptor_a, score, start, end = aligns[0]
+            adapt_region = adaptor_a[start:end]
+            seq_region = seq_a[start:end]
+    matches = sum([1 for s, a in zip(seq_region, adapt_region) if s == a])
+    if len(adaptor) - matches > num_errors:
+        return seq
+    region = seq_region.replace("-", "")
+    if right_side:
+        return seq[:seq.find(region)]
+    else:
+        return seq[seq.rfind(region) + len(region):]
+
 def run_tests(argv):
     test_suite = testing_suite()
     runner = unittest.TextTestRunner(sys.stdout, verbosity = 2)
@@ -204,21 +1061,58 @@ def testing_suite():
         test_suite.addTest(cur_suite)
     return test_suite
 
-def main(in_file, out_file, adaptor_seq, num_errors):
+def main(in_file, out_file, adaptor_seq, num_errors, workers=1):
     num_errors = int(num_errors)
-   
+    if workers is not None:
+        workers = int(workers)
+    if os.path.splitext(out_file)[-1] in [".fastq", ".fq"]:
+        out_format = "fastq"
+    else:
+        out_format = "fasta"
+    adaptors = adaptor_seq.split(",")
+    if len(adaptors) == 1:
+        adaptors = adaptors[0]
     with open(in_file) as in_handle:
         with open(out_file, "w") as out_handle:
-            for rec in SeqIO.parse(in_handle, "fastq"):
-                trim = trim_adaptor(rec.seq, adaptor_seq, num_errors)
-                if len(trim) > 0 and len(trim) < len(rec):
-                    rec.letter_annotations = {}
-                    rec.seq = trim
-                    SeqIO.write([rec], out_handle, "fasta")
+            stats = trim_fastq(in_handle, out_handle, adaptors, num_errors,
+                    out_format, workers)
+    for adaptor in adaptor_seq.split(","):
+        print "%s\t%s reads trimmed" % (adaptor, stats.adaptor_hits[adaptor])
+    _report_stats(stats, out_file)
+
+def main_paired(in_file1, in_file2, out_file1, out_file2, adaptor_seq1,
+        adaptor_seq2, num_errors, workers=1):
+    num_errors = int(num_errors)
+    if workers is not None:
+        workers = int(workers)
+    with open(in_file1) as in_handle1:
+        with open(in_file2) as in_handle2:
+            with open(out_file1, "w") as out_handle1:
+                with open(out_file2, "w") as out_handle2:
+                    stats = trim_fastq_pairs((in_handle1, in_handle2),
+                            (out_handle1, out_handle2),
+                            (adaptor_seq1, adaptor_seq2), num_errors,
+                            "fastq", workers)
+    _report_stats(stats, out_file1)
+
+def _report_stats(stats, out_file):
+    """Print a summary of trimming and save all counts as JSON.
+    """
+    print "%s reads in, %s written" % (stats.reads_in, stats.reads_out)
+    print "Trimmed: %s exact, %s with mismatches, %s aligned; %s empty" % (
+            stats.exact, stats.mismatch, stats.aligned, stats.empty)
+    print "Rejected with too many errors: %s; no adaptor match: %s" % (
+            stats.rejected, stats.no_match)
+    print "Seconds: %.2f parse, %.2f match, %.2f write; %.0f reads/s" % (
+            stats.times["parse"], stats.times["match"], stats.times["write"],
+            stats.reads_per_second())
+    stats.write_json("%s-stats.json" % os.path.splitext(out_file)[0])
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         sys.exit(run_tests(sys.argv))
+    elif sys.argv[1] == "--paired":
+        main_paired(*sys.argv[2:])
     else:
         main(*sys.argv[1:])
         
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+"""Index MAF alignment blocks by the coordinates of their sequences.
+
+The MAF file is split into byte ranges at alignment block boundaries, and
+each range is indexed by a separate process. For every sequence source
+(like hg18.chr1) the index stores the forward strand start and end of each
+aligned sequence along with the file offset of its block, sorted by start.
+
+The index is a compact binary file: a short JSON directory of sources
+followed by arrays of 64 bit integers, which are memory mapped when read.
+Blocks overlapping a region are found with a binary search:
+
+    index = MafIndex("alignments.maf.mafidx")
+    offsets = index.find("hg18.chr1", 10000, 20000)
+
+Running the script with no arguments runs the tests.
+
+Usage:
+    maf_index.py <maf file> [<number of processes>]
+"""
+import sys
+import os
+import mmap
+import array
+import json
+import struct
+
+import numpy
+
+MAGIC = "MAFIDX1\n"
+
+def main(maf_file, workers=None):
+    if workers is not None:
+        workers = int(workers)
+    index_file = build_index(maf_file, workers=workers)
+    index = MafIndex(index_file)
+    print "Indexed %s sequences from %s sources in %s" % (
+            sum([index.get_count(src) for src in index.keys()]),
+            len(index.keys()), index_file)
+
+def build_index(maf_file, index_file=None, workers=None, parts_per_worker=4):
+    """Index a MAF file, using workers processes; None uses all CPUs.
+
+    Returns the index file name, by default the MAF file with .mafidx added.
+    """
+    if index_file is None:
+        index_file = "%s.mafidx" % maf_file
+    if workers is None:
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+    ranges = block_ranges(maf_file, workers * parts_per_worker)
+    if workers == 1:
+        parts = [_index_range(maf_file, start, end) for start, end in ranges]
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = [pool.apply_async(_index_range, (maf_file, start, end))
+                       for start, end in ranges]
+            parts = [r.get() for r in results]
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        pool.join()
+    _write_index(_merge_parts(parts), index_file)
+    return index_file
+
+def block_ranges(maf_file, num_parts):
+    """Split a MAF file into byte ranges which start at alignment blocks.
+    """
+    file_size = os.path.getsize(maf_file)
+    if file_size == 0:
+        return []
+    with open(maf_file, "rb") as in_handle:
+        data = mmap.mmap(in_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            bounds = [0]
+            for i in range(1, num_parts):
+                pos = data.find("\na", max(bounds[-1],
+                    file_size * i // num_parts))
+                if pos < 0:
+                    break
+                if pos + 1 > bounds[-1]:
+                    bounds.append(pos + 1)
+        finally:
+            data.close()
+    bounds.append(file_size)
+    return zip(bounds[:-1], bounds[1:])
+
+def _index_range(maf_file, start, end):
+    """Index the sequences of blocks starting within a byte range.
+
+    Returns a dictionary of source names to the source size and arrays of
+    forward strand starts, ends and block offsets.
+    """
+    found = dict()
+    pos = start
+    block_pos = None
+    with open(maf_file, "rb") as in_handle:
+        in_handle.seek(start)
+        for line in in_handle:
+            if line.startswith("a"):
+                if pos >= end:
+                    break
+                block_pos = pos
+            elif line.startswith("s") and block_pos is not None:
+                src, seq_start, size, strand, src_size = \
+                        line.split(None, 6)[1:6]
+                seq_start = int(seq_start)
+                size = int(size)
+                src_size = int(src_size)
+                if strand == "-":
+                    seq_start = src_size - seq_start - size
+                try:
+                    cur = found[src]
+                except KeyError:
+                    cur = [src_size, array.array("l"), array.array("l"),
+                           array.array("l")]
+                    found[src] = cur
+                cur[1].append(seq_start)
+                cur[2].append(seq_start + size)
+                cur[3].append(block_pos)
+            pos += len(line)
+    for src, (src_size, starts, ends, offsets) in found.items():
+        found[src] = (src_size, numpy.array(starts, dtype=numpy.int64),
+                numpy.array(ends, dtype=numpy.int64),
+                numpy.array(offsets, dtype=numpy.int64))
+    return found
+
+def _merge_parts(parts):
+    """Combine indexes of each range, sorting each source by start.
+    """
+    by_src = dict()
+    for part in parts:
+        for src, vals in part.items():
+            by_src.setdefault(src, []).append(vals)
+    merged = dict()
+    for src, vals in by_src.items():
+        starts = numpy.concatenate([v[1] for v in vals])
+        ends = numpy.concatenate([v[2] for v in vals])
+        offsets = numpy.concatenate([v[3] for v in vals])
+        order = numpy.lexsort((offsets, starts))
+        merged[src] = (max([v[0] for v in vals]), starts[order], ends[order],
+                offsets[order])
+    return merged
+
+def _write_index(merged, index_file):
+    """Write the JSON directory of sources and their coordinate arrays.
+
+    Each source lists its size, number of sequences, longest sequence and
+    the file position of its starts, ends and offsets arrays.
+    """
+    srcs = merged.keys()
+    srcs.sort()
+    directory = dict()
+    data_pos = 0
+    for src in srcs:
+        src_size, starts, ends, offsets = merged[src]
+        max_length = 0
+        if len(starts) > 0:
+            max_length = int((ends - starts).max())
+        directory[src] = [src_size, len(starts), max_length, data_pos]
+        data_pos += 3 * len(starts) * 8
+    directory_str = json.dumps(directory, sort_keys=True)
+    header_size = len(MAGIC) + 8 + len(directory_str)
+    # align the arrays on 8 bytes for memory mapping
+    padding = (8 - header_size % 8) % 8
+    with open(index_file, "wb") as out_handle:
+        out_handle.write(MAGIC)
+        out_handle.write(struct.pack("<Q", len(directory_str) + padding))
+        out_handle.write(directory_str + " " * padding)
+        for src in srcs:
+            for vals in merged[src][1:]:
+                out_handle.write(vals.astype("<i8").tostring())
+
+class MafIndex:
+    """Find MAF blocks containing sequence from a region of a source.
+    """
+    def __init__(self, index_file):
+        self._index_file = index_file
+        with open(index_file, "rb") as in_handle:
+            if in_handle.read(len(MAGIC)) != MAGIC:
+                raise ValueError("Not a MAF index file: %s" % index_file)
+            directory_size = struct.unpack("<Q", in_handle.read(8))[0]
+            self._directory = dict([(str(src), vals) for src, vals in
+                json.loads(in_handle.read(directory_size)).items()])
+        self._data_start = len(MAGIC) + 8 + directory_size
+        self._arrays = dict()
+
+    def keys(self):
+        srcs = self._directory.keys()
+        srcs.sort()
+        return srcs
+
+    def has_key(self, src):
+        return self._directory.has_key(src)
+
+    def get_size(self, src):
+        return self._directory[src][0]
+
+    def get_count(self, src):
+        return self._directory[src][1]
+
+    def intervals(self, src):
+        """Forward strand starts, ends and block offsets for a source.
+        """
+        if not self._arrays.has_key(src):
+            _, count, _, data_pos = self._directory[src]
+            if count == 0:
+                vals = numpy.zeros((3, 0), dtype=numpy.int64)
+            else:
+                vals = numpy.memmap(self._index_file, dtype="<i8", mode="r",
+                        offset=self._data_start + data_pos, shape=(3, count))
+            self._arrays[src] = vals
+        return self._arrays[src]
+
+    def find(self, src, start, end):
+        """Offsets of blocks with sequence of src overlapping start to end.
+
+        Coordinates are 0-based on the forward strand; offsets are sorted in
+        file order.
+        """
+        if not self._directory.has_key(src):
+            return numpy.zeros(0, dtype=numpy.int64)
+        starts, ends, offsets = self.intervals(src)
+        max_length = self._directory[src][2]
+        i_start = numpy.searchsorted(starts, start - max_length, "left")
+        i_end = numpy.searchsorted(starts, end, "left")
+        overlap = ends[i_start:i_end] > start
+        return numpy.unique(numpy.asarray(offsets[i_start:i_end][overlap]))
+
+# ------- Testing Code
+import unittest
+import random
+import shutil
+import tempfile
+
+class MafIndexTest(unittest.TestCase):
+    """Index a small MAF file and find the blocks overlapping regions.
+    """
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+        self._maf_file = os.path.join(self._work_dir, "test.maf")
+        self._seqs = _write_test_maf(self._maf_file, random.Random(47), 60)
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def t_1_find_blocks(self):
+        """Find the same blocks as a scan over every sequence.
+        """
+        index = MafIndex(build_index(self._maf_file, workers=1))
+        srcs = list(set([src for _, src, _, _ in self._seqs]))
+        srcs.sort()
+        assert index.keys() == srcs
+        rand = random.Random(1)
+        for src in srcs:
+            assert index.get_count(src) == len([s for s in self._seqs
+                if s[1] == src])
+            for i in range(50):
+                start = rand.randint(-50, 1000)
+                end = start + rand.randint(1, 300)
+                expected = list(set([offset for offset, cur_src, cur_start,
+                    cur_end in self._seqs if cur_src == src and
+                    cur_start < end and cur_end > start]))
+                expected.sort()
+                assert index.find(src, start, end).tolist() == expected
+        assert index.find("hg18.chrX", 0, 1000).tolist() == []
+
+    def t_2_parallel_index(self):
+        """Write the same index with one or several processes.
+        """
+        assert len(block_ranges(self._maf_file, 12)) > 1
+        contents = []
+        for workers, parts_per_worker in [(1, 1), (1, 4), (3, 4)]:
+            index_file = build_index(self._maf_file, "%s-%s-%s.mafidx" % (
+                self._maf_file, workers, parts_per_worker), workers,
+                parts_per_worker)
+            with open(index_file, "rb") as in_handle:
+                contents.append(in_handle.read())
+        assert contents[0] == contents[1] == contents[2]
+
+def _write_test_maf(maf_file, rand, num_blocks):
+    """Write random MAF blocks for testing.
+
+    Returns the block offset, source and forward strand start and end of
+    each sequence written.
+    """
+    seqs = []
+    with open(maf_file, "w") as out_handle:
+        out_handle.write("##maf version=1\n\n")
+        for i in range(num_blocks):
+            block_pos = out_handle.tell()
+            size = rand.randint(1, 80)
+            out_handle.write("a score=%s\n" % i)
+            for j in range(rand.randint(1, 4)):
+                src = rand.choice(["hg18.chr1", "hg18.chr2", "mm9.chr7"])
+                start = rand.randint(0, 1000 - size)
+                strand = rand.choice("+-")
+                out_handle.write("s %s %s %s %s 1000 %s\n" % (src, start, size,
+                    strand, "A" * size))
+                if strand == "-":
+                    start = 1000 - start - size
+                seqs.append((block_pos, src, start, start + size))
+            out_handle.write("\n")
+    return seqs
+
+def run_tests(argv):
+    test_suite = testing_suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity = 2)
+    runner.run(test_suite)
+
+def testing_suite():
+    """Generate the suite of tests.
+    """
+    test_suite = unittest.TestSuite()
+    test_loader = unittest.TestLoader()
+    test_loader.testMethodPrefix = 't_'
+    tests = [MafIndexTest]
+    for test in tests:
+        cur_suite = test_loader.loadTestsFromTestCase(test)
+        test_suite.addTest(cur_suite)
+    return test_suite
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(run_tests(sys.argv))
+    elif len(sys.argv) > 3:
+        print __doc__
+        sys.exit()
+    else:
+        main(*sys.argv[1:])
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+"""Extract alignments of a reference region from a MAF file for some species.
+
+Blocks overlapping the region are found with a maf_index.py index, built
+if needed, and read from a memory map of the MAF file. Each block is
+projected onto the reference sequence and the requested species, and the
+results are stacked into NumPy arrays with one column per alignment
+column, ready for vectorized scoring:
+
+    regions = MafRegions("alignments.maf")
+    aln = regions.region("hg18.chr1", 10000, 20000, ["hg18", "mm9", "rn4"])
+    identical = (aln.columns == aln.columns[0]).all(axis=0)
+
+Run directly, the projected alignment is printed as FASTA. Running the
+script with no arguments runs the tests.
+
+Usage:
+    maf_regions.py <maf file> <src:start-end> [<species,species>]
+"""
+from __future__ import with_statement
+import sys
+import os
+import mmap
+
+import numpy
+
+import maf_index
+
+_COMPLEMENT = numpy.arange(256, dtype=numpy.uint8)
+for _base, _comp in zip("ACGTUNacgtun", "TGCAANtgcaan"):
+    _COMPLEMENT[ord(_base)] = ord(_comp)
+
+def main(maf_file, region_str, species_str=None):
+    src, coords = region_str.rsplit(":", 1)
+    start, end = [int(x) for x in coords.split("-")]
+    species = None
+    if species_str:
+        species = species_str.split(",")
+    regions = MafRegions(maf_file)
+    aln = regions.region(src, start, end, species)
+    for name, seq_str in zip(aln.species, aln.as_strings()):
+        print ">%s" % name
+        for i in range(0, len(seq_str), 60):
+            print seq_str[i:i + 60]
+    regions.close()
+
+def _forward_start(component):
+    _, start, size, strand, src_size, _ = component
+    if strand == "-":
+        return src_size - start - size
+    return start
+
+def _overlaps(component, start, end):
+    comp_start = _forward_start(component)
+    return comp_start < end and comp_start + component[2] > start
+
+class RegionAlignment:
+    """Alignment columns of a reference region, stacked over blocks.
+
+    species -- Names for each row, like hg18.
+    columns -- uint8 array of alignment characters, species by columns.
+    Species without sequence in a block are filled with gaps.
+    present -- Boolean array, True where a species has sequence in the
+    block of the column, to tell missing data from alignment gaps.
+    ref_pos -- 0-based forward strand reference coordinate of each column,
+    or -1 for columns with a gap in the reference.
+    """
+    def __init__(self, species, columns, present, ref_pos):
+        self.species = species
+        self.columns = columns
+        self.present = present
+        self.ref_pos = ref_pos
+
+    def __len__(self):
+        return self.columns.shape[1]
+
+    def as_strings(self):
+        return [row.tostring() for row in self.columns]
+
+class MafRegions:
+    """Retrieve blocks and projected alignments for regions of a MAF file.
+    """
+    def __init__(self, maf_file, index_file=None, workers=1):
+        if index_file is None:
+            index_file = "%s.mafidx" % maf_file
+        if (not os.path.exists(index_file) or
+                os.path.getmtime(index_file) < os.path.getmtime(maf_file)):
+            maf_index.build_index(maf_file, index_file, workers)
+        self._index = maf_index.MafIndex(index_file)
+        self._handle = open(maf_file, "rb")
+        self._data = mmap.mmap(self._handle.fileno(), 0,
+                access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._data.close()
+        self._handle.close()
+
+    def blocks(self, src, start, end):
+        """Components of each block with sequence of src within start to end.
+
+        Blocks are returned in file order as lists of (src, start, size,
+        strand, src_size, text) tuples from the s lines.
+        """
+        for offset in self._index.find(src, start, end).tolist():
+            yield self._read_block(offset)
+
+    def _read_block(self, offset):
+        block_end = self._data.find("\n\n", offset)
+        if block_end < 0:
+            block_end = len(self._data)
+        components = []
+        for i, line in enumerate(self._data[offset:block_end].split("\n")):
+            if i > 0 and line.startswith("a"):
+                break
+            if line.startswith("s"):
+                name, seq_start, size, strand, src_size, text = \
+                        line.split()[1:7]
+                components.append((name, int(seq_start), int(size), strand,
+                    int(src_size), text))
+        return components
+
+    def region(self, src, start, end, species=None, with_insertions=False):
+        """Project blocks overlapping a reference region onto species.
+
+        src is the reference sequence name, like hg18.chr1, with 0-based
+        forward strand start and end. species is a list of names to include,
+        like hg18, defaulting to all species found in the region. Columns
+        follow the reference forward strand; blocks with the reference on
+        the minus strand are reverse complemented. Columns with a gap in the
+        reference are dropped unless with_insertions is set. Where a species
+        has several sequences in a block the first is used. The exception is
+        the reference: a block aligning several copies of src, like
+        paralogs, is projected once for each copy overlapping the region,
+        with that copy as the reference row.
+
+        Returns a RegionAlignment, with blocks in reference order.
+        """
+        ref_species = src.split(".")[0]
+        blocks = []
+        found_species = []
+        for components in self.blocks(src, start, end):
+            by_species = dict()
+            for component in components:
+                name = component[0].split(".")[0]
+                if not by_species.has_key(name):
+                    by_species[name] = component
+                    if name not in found_species:
+                        found_species.append(name)
+            for ref in components:
+                if ref[0] == src and _overlaps(ref, start, end):
+                    ref_by_species = dict(by_species)
+                    ref_by_species[ref_species] = ref
+                    blocks.append((ref, ref_by_species))
+        # blocks are not always in reference order, like after sorting
+        blocks.sort(key=lambda b: _forward_start(b[0]))
+        if species is None:
+            species = [ref_species] + [s for s in found_species
+                                       if s != ref_species]
+        columns = []
+        present = []
+        ref_pos = []
+        for ref, by_species in blocks:
+            cur = self._project_block(ref, by_species, start, end, species,
+                    with_insertions)
+            if cur is not None:
+                columns.append(cur[0])
+                present.append(cur[1])
+                ref_pos.append(cur[2])
+        if len(columns) == 0:
+            return RegionAlignment(species,
+                    numpy.zeros((len(species), 0), dtype=numpy.uint8),
+                    numpy.zeros((len(species), 0), dtype=bool),
+                    numpy.zeros(0, dtype=numpy.int64))
+        columns = numpy.concatenate(columns, axis=1)
+        present = numpy.concatenate(present, axis=1)
+        ref_pos = numpy.concatenate(ref_pos)
+        return RegionAlignment(species, columns, present, ref_pos)
+
+    def _project_block(self, ref, by_species, start, end, species,
+            with_insertions):
+        """Columns of one block within the region, for each species.
+        """
+        _, ref_start, ref_size, ref_strand, ref_src_size, ref_text = ref
+        num_cols = len(ref_text)
+        columns = numpy.zeros((len(species), num_cols), dtype=numpy.uint8)
+        columns[:] = ord("-")
+        present = numpy.zeros((len(species), num_cols), dtype=bool)
+        for i, name in enumerate(species):
+            if by_species.has_key(name):
+                columns[i] = numpy.frombuffer(by_species[name][5],
+                        dtype=numpy.uint8)
+                present[i] = True
+        ref_row = numpy.frombuffer(ref_text, dtype=numpy.uint8)
+        if ref_strand == "-":
+            columns = _COMPLEMENT[columns[:, ::-1]]
+            present = present[:, ::-1]
+            ref_row = ref_row[::-1]
+            ref_start = _forward_start(ref)
+        is_base = ref_row != ord("-")
+        pos = ref_start + numpy.cumsum(is_base) - 1
+        if with_insertions:
+            # gap columns follow the base at pos; keep those with the bases
+            # on both sides in the region
+            keep = (pos >= start) & (pos + numpy.where(is_base, 0, 1) < end)
+        else:
+            keep = is_base & (pos >= start) & (pos < end)
+        if not keep.any():
+            return None
+        pos = numpy.where(is_base, pos, -1)
+        return columns[:, keep], present[:, keep], pos[keep]
+
+# ------- Testing Code
+import unittest
+import shutil
+import tempfile
+
+_TEST_MAF = """##maf version=1
+
+a score=1
+s hg18.chr1 10 8 + 100 ACGT-ACGT
+s mm9.chr2  50 9 + 200 ACGTTACGA
+s rn4.chr3  20 8 + 150 ACG-TTCGT
+
+a score=2
+s hg18.chr1 70 6 - 100 AACCGT
+s mm9.chr2  80 6 + 200 AACTGT
+
+a score=3
+s hg18.chr1 40 4 + 100 GGCC
+s hg18.chr1 60 4 + 100 GGCA
+s rn4.chr3   5 4 + 150 GGCT
+"""
+
+class MafRegionsTest(unittest.TestCase):
+    """Project MAF blocks overlapping reference regions onto species.
+    """
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+        maf_file = os.path.join(self._work_dir, "test.maf")
+        with open(maf_file, "w") as out_handle:
+            out_handle.write(_TEST_MAF)
+        self._regions = MafRegions(maf_file)
+
+    def tearDown(self):
+        self._regions.close()
+        shutil.rmtree(self._work_dir)
+
+    def t_1_species_subset(self):
+        """Project blocks onto some species, filling in missing ones.
+        """
+        aln = self._regions.region("hg18.chr1", 12, 16, ["hg18", "rn4"])
+        assert aln.as_strings() == ["GTAC", "G-TC"]
+        assert aln.ref_pos.tolist() == [12, 13, 14, 15]
+        aln = self._regions.region("hg18.chr1", 12, 16, ["hg18", "rn4"],
+                with_insertions=True)
+        assert aln.as_strings() == ["GT-AC", "G-TTC"]
+        assert aln.ref_pos.tolist() == [12, 13, -1, 14, 15]
+        aln = self._regions.region("hg18.chr1", 12, 30, ["rn4", "hg18"])
+        assert aln.species == ["rn4", "hg18"]
+        assert aln.as_strings() == ["G-TCGT------", "GTACGTACGGTT"]
+        assert aln.present[0].tolist() == [True] * 6 + [False] * 6
+        assert aln.present[1].all()
+        aln = self._regions.region("hg18.chr1", 90, 95, ["hg18"])
+        assert len(aln) == 0 and aln.as_strings() == [""]
+
+    def t_2_minus_strand_reference(self):
+        """Reverse complement blocks with the reference on the minus strand.
+        """
+        aln = self._regions.region("hg18.chr1", 24, 30)
+        assert aln.species == ["hg18", "mm9"]
+        assert aln.as_strings() == ["ACGGTT", "ACAGTT"]
+        assert aln.ref_pos.tolist() == range(24, 30)
+        aln = self._regions.region("hg18.chr1", 26, 28, ["mm9"])
+        assert aln.as_strings() == ["AG"]
+
+    def t_3_duplicated_reference(self):
+        """Project each copy of the reference in a block separately.
+        """
+        aln = self._regions.region("hg18.chr1", 60, 64)
+        assert aln.species == ["hg18", "rn4"]
+        assert aln.as_strings() == ["GGCA", "GGCT"]
+        assert aln.ref_pos.tolist() == [60, 61, 62, 63]
+        aln = self._regions.region("hg18.chr1", 42, 62, ["hg18", "rn4"])
+        assert aln.as_strings() == ["CCGG", "CTGG"]
+        assert aln.ref_pos.tolist() == [42, 43, 60, 61]
+
+def run_tests(argv):
+    test_suite = testing_suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity = 2)
+    runner.run(test_suite)
+
+def testing_suite():
+    """Generate the suite of tests.
+    """
+    test_suite = unittest.TestSuite()
+    test_loader = unittest.TestLoader()
+    test_loader.testMethodPrefix = 't_'
+    tests = [MafRegionsTest]
+    for test in tests:
+        cur_suite = test_loader.loadTestsFromTestCase(test)
+        test_suite.addTest(cur_suite)
+    return test_suite
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(run_tests(sys.argv))
+    elif len(sys.argv) not in [3, 4]:
+        print __doc__
+        sys.exit()
+    else:
+        main(*sys.argv[1:])
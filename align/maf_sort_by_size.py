@@ -1,60 +1,151 @@
 #!/usr/bin/env python
 """Sort MAF file by the size of alignments -- largest to smallest.
 
+The MAF file is scanned once as raw text, recording the byte offsets and
+alignment size of each block. Blocks are then copied unchanged in sorted
+order from a memory map of the file. Files larger than the memory limit
+are sorted in chunks written to temporary files, which are then merged.
+
 Usage:
-    maf_sort_by_size.py <maf file>
+    maf_sort_by_size.py <maf file> [<memory limit in Mb>]
 """
 from __future__ import with_statement
 import sys
 import os
+import mmap
+import array
+import heapq
+import shutil
+import tempfile
 
-from bx.align import maf
-from bx import interval_index_file
+import numpy
 
-def main(in_file):
+def main(in_file, max_memory_mb=1000):
     base, ext = os.path.splitext(in_file)
     out_file = "%s-sorted%s" % (base, ext)
-    index_file = in_file + ".index"
-    if not os.path.exists(index_file):
-        build_index(in_file, index_file)
-
-    # pull out the sizes and positions of each record
-    index = maf.Indexed(in_file, index_file)
-    rec_info = []
-    with open(in_file) as in_handle:
-        reader = maf.Reader(in_handle)
-        while 1:
-            pos = reader.file.tell()
-            rec = reader.next()
-            if rec is None:
-                break
-            rec_info.append((rec.text_size, pos))
-    rec_info.sort(reverse=True)
-
-    # write the records in order, pulling from the index
-    with open(out_file, "w") as out_handle:
-        writer = maf.Writer(out_handle)
-        for size, pos in rec_info:
-            rec = index.get_at_offset(pos)
-            writer.write(rec)
-
-def build_index(in_file, index_file):
-    """Build an index of the MAF file for retrieval.
+    sort_maf(in_file, out_file, int(max_memory_mb) * 1024 * 1024)
+
+def sort_maf(in_file, out_file, max_memory=1000 * 1024 * 1024):
+    """Write MAF blocks from largest to smallest alignment text size.
+
+    Blocks of the same size are written last in the file first. Header
+    lines before the first block are copied to the output.
+    """
+    header, starts, ends, sizes = scan_blocks(in_file)
+    with open(out_file, "wb") as out_handle:
+        out_handle.write(header)
+        if len(starts) == 0:
+            return
+        if ends[-1] - starts[0] <= max_memory:
+            order = numpy.lexsort((starts, sizes))[::-1]
+            with open(in_file, "rb") as in_handle:
+                data = mmap.mmap(in_handle.fileno(), 0,
+                        access=mmap.ACCESS_READ)
+                try:
+                    for start, end in zip(starts[order].tolist(),
+                            ends[order].tolist()):
+                        _write_block(out_handle, data[start:end])
+                finally:
+                    data.close()
+        else:
+            _external_sort(in_file, out_handle, starts, ends, sizes,
+                    max_memory)
+
+def scan_blocks(in_file):
+    """Find the position and alignment size of each block in one pass.
+
+    Returns the header text before the first block, and arrays with the
+    start and end byte offsets and alignment text size of each block.
+    Ends exclude the blank line separating blocks.
+    """
+    header = []
+    starts = array.array("l")
+    ends = array.array("l")
+    sizes = array.array("l")
+    pos = 0
+    in_block = False
+    with open(in_file, "rb") as in_handle:
+        for line in in_handle:
+            if line.startswith("a"):
+                if in_block:
+                    ends.append(pos)
+                starts.append(pos)
+                sizes.append(0)
+                in_block = True
+            elif in_block:
+                if line.startswith("s"):
+                    if sizes[-1] == 0:
+                        sizes[-1] = len(line.split(None, 6)[6].rstrip())
+                elif not line.strip() or line.startswith("#"):
+                    ends.append(pos)
+                    in_block = False
+            elif len(starts) == 0:
+                header.append(line)
+            pos += len(line)
+    if in_block:
+        ends.append(pos)
+    return ("".join(header), numpy.array(starts, dtype=numpy.int64),
+            numpy.array(ends, dtype=numpy.int64),
+            numpy.array(sizes, dtype=numpy.int64))
+
+def _write_block(out_handle, block):
+    out_handle.write(block)
+    if not block.endswith("\n"):
+        out_handle.write("\n")
+    out_handle.write("\n")
+
+def _external_sort(in_file, out_handle, starts, ends, sizes, max_memory):
+    """Sort blocks of a large MAF file by merging sorted chunks.
+
+    Consecutive blocks totalling up to max_memory bytes are read
+    sequentially, sorted and written to a temporary run file. Runs are
+    then merged, reading each run from start to end.
+    """
+    work_dir = tempfile.mkdtemp(prefix="mafsort",
+            dir=os.path.dirname(os.path.abspath(in_file)))
+    try:
+        runs = []
+        with open(in_file, "rb") as in_handle:
+            chunk_start = 0
+            while chunk_start < len(starts):
+                chunk_end = chunk_start + 1
+                while (chunk_end < len(starts) and ends[chunk_end] -
+                        starts[chunk_start] <= max_memory):
+                    chunk_end += 1
+                chunk = slice(chunk_start, chunk_end)
+                runs.append(_write_run(in_handle, starts[chunk], ends[chunk],
+                    sizes[chunk], len(runs), work_dir))
+                chunk_start = chunk_end
+        run_handles = [open(run_file, "rb") for run_file, _ in runs]
+        try:
+            for _, _, run_index, length in heapq.merge(*[run_keys
+                    for _, run_keys in runs]):
+                _write_block(out_handle, run_handles[run_index].read(length))
+        finally:
+            for run_handle in run_handles:
+                run_handle.close()
+    finally:
+        shutil.rmtree(work_dir)
+
+def _write_run(in_handle, starts, ends, sizes, run_index, work_dir):
+    """Write one chunk of blocks in sorted order to a run file.
+
+    Returns the file and the merge keys of its blocks, in the order written.
     """
-    indexes = interval_index_file.Indexes()
-    with open(in_file) as in_handle:
-        reader = maf.Reader(in_handle)
-        while 1:
-            pos = reader.file.tell()
-            rec = reader.next()
-            if rec is None:
-                break
-            for c in rec.components:
-                indexes.add(c.src, c.forward_strand_start,
-                        c.forward_strand_end, pos, max=c.src_size )
-
-    with open(index_file, "w") as index_handle:
-        indexes.write(index_handle)
+    in_handle.seek(starts[0])
+    chunk = in_handle.read(ends[-1] - starts[0])
+    order = numpy.lexsort((starts, sizes))[::-1]
+    run_file = os.path.join(work_dir, "run%s" % run_index)
+    keys = []
+    with open(run_file, "wb") as run_handle:
+        for start, end, size in zip(starts[order].tolist(),
+                ends[order].tolist(), sizes[order].tolist()):
+            run_handle.write(chunk[start - starts[0]:end - starts[0]])
+            keys.append((-size, -start, run_index, end - start))
+    return run_file, keys
 
 if __name__ == "__main__":
-    main(sys.argv[1])
+    if len(sys.argv) not in [2, 3]:
+        print __doc__
+        sys.exit()
+    main(*sys.argv[1:])
@@ -18,9 +18,12 @@ Usage:
 from __future__ import with_statement
 import sys
 import os
-import operator
+import itertools
+
+import numpy
 
 from Bio import SeqIO
+from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 
 def main(glimmer_file, ref_file):
@@ -35,51 +38,74 @@ def main(glimmer_file, ref_file):
 def protein_recs(glimmer_file, ref_rec):
     """Generate protein records
     """
+    ref_str = str(ref_rec.seq)
     with open(glimmer_file) as in_handle:
         for gene_num, exons, strand in glimmer_predictions(in_handle):
-            seq_exons = []
-            for start, end in exons:
-                seq_exons.append(ref_rec.seq[start:end])
-            gene_seq = reduce(operator.add, seq_exons)
+            gene_seq = Seq("".join([ref_str[start:end]
+                for start, end in exons.tolist()]), ref_rec.seq.alphabet)
             if strand == '-':
                 gene_seq = gene_seq.reverse_complement()
             protein_seq = gene_seq.translate()
             yield SeqRecord(protein_seq, gene_num, "", "")
 
-def glimmer_predictions(in_handle):
+def glimmer_predictions(in_handle, block_lines=100000):
     """Parse Glimmer output, generating a exons and strand for each prediction.
+
+    The prediction table is read in blocks of lines into column arrays.
+    Exons are grouped by gene number with a stable sort, keeping exon
+    order, and returned as an array of 0-based (start, end) rows. The last
+    gene of a block is held back in case it continues in the next block.
     """
     # read the header
     while 1:
         line = in_handle.readline()
-        if line.startswith("   #    #"):
+        if not line or line.startswith("   #    #"):
             break
     in_handle.readline()
-    # read gene predictions one at a time
-    cur_exons, cur_gene_num, cur_strand = ([], None, None)
+    carry = None
     while 1:
-        line = in_handle.readline()
-        if not line:
+        lines = list(itertools.islice(in_handle, block_lines))
+        is_last = len(lines) < block_lines
+        cols = _prediction_columns(lines)
+        if carry is not None:
+            cols = [numpy.concatenate([c, n]) for c, n in zip(carry, cols)]
+            carry = None
+        if not is_last and len(cols[0]) > 0:
+            keep = cols[0] != cols[0][-1]
+            carry = [c[~keep] for c in cols]
+            cols = [c[keep] for c in cols]
+        for prediction in _group_by_gene(*cols):
+            yield prediction
+        if is_last:
             break
-        parts = line.strip().split()
-        # new exon
-        if len(parts) == 0:
-            yield cur_gene_num, cur_exons, cur_strand
-            cur_exons, cur_gene_num, cur_strand = ([], None, None)
-        else:
-            this_gene_num = parts[0]
-            this_strand = parts[2]
-            this_start = int(parts[4]) - 1 # 1 based
-            this_end = int(parts[5])
-            if cur_gene_num is None:
-                cur_gene_num = this_gene_num
-                cur_strand = this_strand
-            else:
-                assert cur_gene_num == this_gene_num
-                assert cur_strand == this_strand
-            cur_exons.append((this_start, this_end))
-    if len(cur_exons) > 0:
-        yield cur_gene_num, cur_exons, cur_strand
+
+def _prediction_columns(lines):
+    """Split prediction table lines into gene, strand, start and end arrays.
+
+    Rows have the gene number, exon number, strand, exon type, start, end
+    and length; blank lines between genes are ignored.
+    """
+    parts = numpy.array("".join(lines).split(), dtype=object)
+    if len(parts) % 7 != 0:
+        raise ValueError("Unexpected GlimmerHMM prediction line: %s" %
+                [l for l in lines if l.strip() and len(l.split()) != 7][:1])
+    table = parts.reshape((-1, 7))
+    return [table[:, 0].astype(int), table[:, 2].astype(str),
+            table[:, 4].astype(int) - 1, table[:, 5].astype(int)]
+
+def _group_by_gene(genes, strands, starts, ends):
+    order = numpy.argsort(genes, kind="mergesort")
+    genes, strands = genes[order], strands[order]
+    exons = numpy.column_stack([starts[order], ends[order]])
+    bounds = numpy.concatenate([[0],
+        numpy.flatnonzero(genes[1:] != genes[:-1]) + 1, [len(genes)]])
+    for i in range(len(bounds) - 1):
+        start, end = bounds[i], bounds[i + 1]
+        if start == end:
+            continue
+        assert (strands[start:end] == strands[start]).all(), \
+                "Mixed strands in gene %s" % genes[start]
+        yield str(genes[start]), exons[start:end], strands[start]
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
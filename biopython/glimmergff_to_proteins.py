@@ -16,16 +16,13 @@ Usage:
 from __future__ import with_statement
 import sys
 import os
-import operator
 
 from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
 
 from BCBio import GFF
 
 def main(glimmer_file, ref_file):
-    with open(ref_file) as in_handle:
-        ref_recs = SeqIO.to_dict(SeqIO.parse(in_handle, "fasta"))
+    ref_recs = GFF.FastaIndex(ref_file)
 
     base, ext = os.path.splitext(glimmer_file)
     out_file = "%s-proteins.fa" % base
@@ -35,24 +32,16 @@ def main(glimmer_file, ref_file):
 def protein_recs(glimmer_file, ref_recs):
     """Generate protein records from GlimmerHMM gene predictions.
     """
+    extractor = GFF.FeatureSeqExtractor(ref_recs)
     with open(glimmer_file) as in_handle:
-        for rec in glimmer_predictions(in_handle, ref_recs):
-            for feature in rec.features:
-                seq_exons = []
-                for cds in feature.sub_features:
-                    seq_exons.append(rec.seq[
-                        cds.location.nofuzzy_start:
-                        cds.location.nofuzzy_end])
-                gene_seq = reduce(operator.add, seq_exons)
-                if feature.strand == -1:
-                    gene_seq = gene_seq.reverse_complement()
-                protein_seq = gene_seq.translate()
-                yield SeqRecord(protein_seq, feature.qualifiers["ID"][0], "", "")
-
-def glimmer_predictions(in_handle, ref_recs):
+        for rec in extractor.proteins(glimmer_predictions(in_handle),
+                workers=None):
+            yield rec
+
+def glimmer_predictions(in_handle):
     """Parse Glimmer output, generating SeqRecord and SeqFeatures for predictions
     """
-    for rec in GFF.parse(in_handle, target_lines=1000, base_dict=ref_recs):
+    for rec in GFF.parse(in_handle, target_lines=1000):
         yield rec
 
 if __name__ == "__main__":
@@ -4,19 +4,26 @@
 This uses charge regions to classify, but could be modified to any
 type of useful classification.
 
+Isoelectric points of sliding windows come from protein_charge.py in the
+rest_apis directory, shared with the InterPro scripts. Put that directory on
+the Python path when running:
+
+    PYTHONPATH=../rest_apis histogram_thresh_find.py <positives> <negatives>
+
 Usage:
     histogram_thresh_find.py <fasta positive records> <fasta negative records>
 """
 from __future__ import with_statement
 import sys
+import itertools
 
 from Bio import SeqIO
-from Bio.SeqUtils import IsoelectricPoint
-from Bio.SeqUtils import ProtParam
 
 import numpy
 import pylab
 
+import protein_charge
+
 def main(pos_file, neg_file):
     cur_window = 75
     pos_charges = file_charges(pos_file, cur_window)
@@ -31,35 +38,40 @@ def main(pos_file, neg_file):
     pylab.savefig('pos_neg_hist.png')
     pylab.show()
 
-def file_charges(in_file, cur_window):
+def file_charges(in_file, cur_window, batch_size=1000):
     """Handle calculation of charges for all records in a file.
+
+    Records are handled in batches, calculating charges of all windows in
+    a batch together.
     """
     all_charges = []
     with open(in_file) as in_handle:
-        for rec in SeqIO.parse(in_handle, "fasta"):
-            cur_charges = calc_region_charges(rec.seq, cur_window)
-            above_thresh = [c for c in cur_charges if c >= 10.2]
-            if above_thresh:
-                print rec.name, len(above_thresh) / float(len(rec.seq))
-            all_charges.extend(cur_charges)
+        recs = SeqIO.parse(in_handle, "fasta")
+        while 1:
+            batch = list(itertools.islice(recs, batch_size))
+            if len(batch) == 0:
+                break
+            for rec, cur_charges in zip(batch, _region_charges(
+                    [rec.seq for rec in batch], cur_window)):
+                above_thresh = [c for c in cur_charges if c >= 10.2]
+                if above_thresh:
+                    print rec.name, len(above_thresh) / float(len(rec.seq))
+                all_charges.extend(cur_charges)
     return all_charges
 
 def calc_region_charges(seq, cur_window):
     """Perform calculation of charges via isoelectric points for a sequence.
     """
-    # internal small regions, so do not deal with C and N terminal charges
-    IsoelectricPoint.pKcterminal = {}
-    IsoelectricPoint.pKnterminal = {}
-    cur_pos = 0
-    region_charges = []
-    while cur_pos < len(seq) - cur_window:
-        cur_seq = seq[cur_pos:cur_pos + cur_window]
-        prot_analysis = ProtParam.ProteinAnalysis(str(cur_seq))
-        ie_calc = IsoelectricPoint.IsoelectricPoint(cur_seq,
-                prot_analysis.count_amino_acids())
-        region_charges.append(ie_calc.pi())
-        cur_pos += 1
-    return region_charges
+    return _region_charges([seq], cur_window)[0]
+
+def _region_charges(seqs, cur_window):
+    """Isoelectric points of windows in sequences, leaving out the last.
+
+    Windows are internal small regions, so C and N terminal charges are
+    not adjusted for the residues at the window ends.
+    """
+    return [list(charges[:-1]) for charges in
+            protein_charge.window_isoelectric_points(seqs, cur_window)]
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
@@ -0,0 +1,223 @@
+"""Lazy access to sequences in a FASTA file through a faidx style index.
+
+A FastaIndex can be passed as the base_dict when parsing GFF. Only records
+for sequence ids present in each parsed chunk are created, and their
+sequences are read from a memory map of the FASTA file when used:
+
+    seq_index = FastaIndex("genome.fa")
+    for rec in GFF.parse("genome.gff3", base_dict=seq_index):
+        ...
+
+The index is stored next to the FASTA file as a samtools compatible .fai
+file, and is rebuilt when missing or older than the FASTA file.
+"""
+import os
+import mmap
+
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.Alphabet import single_letter_alphabet
+
+class FastaIndex:
+    """Read only dictionary-like access to SeqRecords in an indexed FASTA file.
+
+    Each lookup returns a new SeqRecord whose sequence is an IndexedSeq;
+    no sequence data is read until it is used.
+    """
+    def __init__(self, fasta_file, index_file=None,
+            alphabet=single_letter_alphabet):
+        self._fasta_file = fasta_file
+        self._index_file = index_file or "%s.fai" % fasta_file
+        self._alphabet = alphabet
+        self._ids, self._index = self._read_or_build_index()
+        self._handle = None
+        self._mmap = None
+
+    def __getstate__(self):
+        """Memory maps cannot be copied or pickled; reopen them on use.
+        """
+        state = self.__dict__.copy()
+        state["_handle"] = None
+        state["_mmap"] = None
+        return state
+
+    def keys(self):
+        return list(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def has_key(self, seqid):
+        return self._index.has_key(seqid)
+
+    def __contains__(self, seqid):
+        return self._index.has_key(seqid)
+
+    def __getitem__(self, seqid):
+        length = self._index[seqid][0]
+        return SeqRecord(IndexedSeq(self, seqid, length, self._alphabet),
+                seqid, seqid, "")
+
+    def get_length(self, seqid):
+        return self._index[seqid][0]
+
+    def fetch(self, seqid, start, end):
+        """Retrieve the sequence string from 0-based start to end.
+        """
+        length, offset, line_bases, line_width = self._index[seqid]
+        start = max(0, start)
+        end = min(length, end)
+        if end <= start:
+            return ""
+        data = self._get_mmap()
+        start_offset = offset + (start // line_bases) * line_width + \
+                start % line_bases
+        end_offset = offset + ((end - 1) // line_bases) * line_width + \
+                (end - 1) % line_bases + 1
+        return data[start_offset:end_offset].replace("\n", "").replace(
+                "\r", "")
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._handle.close()
+            self._mmap = None
+            self._handle = None
+
+    def _get_mmap(self):
+        if self._mmap is None:
+            self._handle = open(self._fasta_file, "rb")
+            self._mmap = mmap.mmap(self._handle.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _read_or_build_index(self):
+        if (os.path.exists(self._index_file) and
+                os.path.getmtime(self._index_file) >=
+                os.path.getmtime(self._fasta_file)):
+            return self._read_index()
+        ids, index = self._build_index()
+        self._write_index(ids, index)
+        return ids, index
+
+    def _read_index(self):
+        ids = []
+        index = dict()
+        in_handle = open(self._index_file)
+        for line in in_handle:
+            parts = line.rstrip("\r\n").split("\t")
+            if len(parts) >= 5:
+                ids.append(parts[0])
+                index[parts[0]] = tuple([int(p) for p in parts[1:5]])
+        in_handle.close()
+        return ids, index
+
+    def _write_index(self, ids, index):
+        """Save the index alongside the FASTA file, if the directory allows.
+        """
+        try:
+            out_handle = open(self._index_file, "w")
+        except IOError:
+            return
+        for seqid in ids:
+            out_handle.write("\t".join([seqid] + [str(x) for x in
+                index[seqid]]) + "\n")
+        out_handle.close()
+
+    def _build_index(self):
+        """Scan the FASTA file, recording the layout of each sequence.
+
+        Index values are the sequence length, file offset of the first base,
+        bases per line and bytes per line, as in samtools faidx.
+        """
+        ids = []
+        index = dict()
+        cur = None
+        in_handle = open(self._fasta_file, "rb")
+        offset = 0
+        for line in in_handle:
+            if line.startswith(">"):
+                if cur is not None:
+                    self._finish_entry(cur, ids, index)
+                seqid = line[1:].strip().split(None, 1)[0]
+                cur = dict(id=seqid, length=0, offset=offset + len(line),
+                        line_bases=0, line_width=0, short_line=False)
+            elif cur is not None:
+                bases = len(line.rstrip("\r\n"))
+                if bases > 0:
+                    if cur["short_line"] or (cur["line_bases"] and
+                            bases > cur["line_bases"]):
+                        raise ValueError("Cannot index %s: lines of %s "
+                                "have different lengths" % (
+                                    self._fasta_file, cur["id"]))
+                    if cur["line_bases"] == 0:
+                        cur["line_bases"] = bases
+                        cur["line_width"] = len(line)
+                    elif bases < cur["line_bases"]:
+                        cur["short_line"] = True
+                    cur["length"] += bases
+            offset += len(line)
+        if cur is not None:
+            self._finish_entry(cur, ids, index)
+        in_handle.close()
+        return ids, index
+
+    def _finish_entry(self, cur, ids, index):
+        if index.has_key(cur["id"]):
+            raise ValueError("Duplicate sequence id in %s: %s" % (
+                self._fasta_file, cur["id"]))
+        ids.append(cur["id"])
+        index[cur["id"]] = (cur["length"], cur["offset"], cur["line_bases"],
+                cur["line_width"])
+
+class IndexedSeq(Seq):
+    """A read only sequence retrieved from an indexed FASTA file on demand.
+
+    Slices are read directly from disk; the full sequence is only loaded,
+    and then kept, when it is used as a whole.
+    """
+    def __init__(self, fasta_index, seqid, length,
+            alphabet=single_letter_alphabet):
+        self._fasta_index = fasta_index
+        self._seqid = seqid
+        self._length = length
+        self._full_seq = None
+        self.alphabet = alphabet
+
+    def _get_data(self):
+        if self._full_seq is None:
+            self._full_seq = self._fasta_index.fetch(self._seqid, 0,
+                    self._length)
+        return self._full_seq
+    _data = property(_get_data)
+
+    def __len__(self):
+        return self._length
+
+    def fetch(self, start, end):
+        """Retrieve the sequence string from 0-based start to end.
+        """
+        if self._full_seq is not None:
+            return self._full_seq[max(0, start):max(0, end)]
+        return self._fasta_index.fetch(self._seqid, start, end)
+
+    def __repr__(self):
+        return "IndexedSeq(%r, %i, alphabet = %r)" % (self._seqid,
+                self._length, self.alphabet)
+
+    def __getitem__(self, index):
+        if self._full_seq is None:
+            if isinstance(index, int):
+                if index < 0:
+                    index += self._length
+                if index < 0 or index >= self._length:
+                    raise IndexError("sequence index out of range")
+                return self._fasta_index.fetch(self._seqid, index, index + 1)
+            elif isinstance(index, slice) and index.step in [None, 1]:
+                start, end, _ = index.indices(self._length)
+                return Seq(self._fasta_index.fetch(self._seqid, start, end),
+                        self.alphabet)
+        return Seq.__getitem__(self, index)
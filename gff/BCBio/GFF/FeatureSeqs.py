@@ -0,0 +1,185 @@
+"""Extract nucleotide and protein sequences of features from parsed GFF.
+
+Features made up of parts, like mRNAs with CDS or exon sub_features, are
+retrieved by joining the sequences of their parts:
+
+    extractor = FeatureSeqExtractor(FastaIndex("genome.fa"))
+    recs = GFF.parse("genome.gff3")
+    SeqIO.write(extractor.proteins(recs, workers=4), out_handle, "fasta")
+
+All parts within a record are sliced from a single sequence buffer; with
+a FastaIndex this is a memory map of the FASTA file so sequences are not
+loaded into memory.
+"""
+import collections
+
+from Bio.Seq import Seq, UnknownSeq
+from Bio.SeqRecord import SeqRecord
+from Bio.Alphabet import generic_dna
+
+from FastaIndex import FastaIndex, IndexedSeq
+
+def _translate_batch(batch, table, to_stop):
+    """Translate a list of (id, nucleotide string) pairs; used by workers.
+    """
+    return [(seq_id, Seq(seq_str, generic_dna).translate(table,
+        to_stop=to_stop)) for (seq_id, seq_str) in batch]
+
+class FeatureSeqExtractor:
+    """Retrieve joined sequences for features and their parts.
+
+    seq_source - Where to retrieve sequences. Either a FastaIndex, a
+    dictionary of SeqRecords or Seqs keyed by record id, or None to use the
+    sequences attached to the parsed records.
+    """
+    def __init__(self, seq_source=None, table="Standard"):
+        self._seq_source = seq_source
+        self._table = table
+
+    def cds(self, recs, feature_type=None):
+        """Coding sequences, joining the CDS parts of each feature.
+        """
+        return self.extract(recs, "CDS", feature_type)
+
+    def mrna(self, recs, feature_type=None):
+        """Transcript sequences, joining the exon parts of each feature.
+        """
+        return self.extract(recs, "exon", feature_type)
+
+    def extract(self, recs, part_type, feature_type=None):
+        """Generate SeqRecords with the joined part sequences of features.
+
+        part_type - The type of sub_features to join, like CDS or exon.
+        feature_type - Only use parent features of this type, like mRNA.
+        By default every feature with parts of part_type is used. Top level
+        features of part_type without a parent are returned individually.
+
+        Parts are joined in coordinate order and reverse complemented for
+        features on the minus strand.
+        """
+        for seq_id, seq_str, _ in self._extract_strs(recs, part_type,
+                feature_type):
+            yield SeqRecord(Seq(seq_str, generic_dna), seq_id, "", "")
+
+    def proteins(self, recs, feature_type=None, to_stop=False, workers=1,
+            batch_size=500):
+        """Generate translated protein SeqRecords from CDS parts of features.
+
+        The phase of the first CDS part is skipped before translating.
+
+        workers - Number of processes to translate in; None uses the number
+        of CPUs. Batches of batch_size sequences are sent to each worker and
+        results are returned in input order.
+        """
+        batches = self._translation_batches(recs, feature_type, batch_size)
+        if workers == 1:
+            for batch in batches:
+                for seq_id, protein_seq in _translate_batch(batch,
+                        self._table, to_stop):
+                    yield SeqRecord(protein_seq, seq_id, "", "")
+            return
+        import multiprocessing
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(workers)
+        try:
+            pending = collections.deque()
+            for batch in batches:
+                pending.append(pool.apply_async(_translate_batch,
+                    (batch, self._table, to_stop)))
+                # limit the number of batches held in memory
+                if len(pending) >= workers * 4:
+                    for seq_id, protein_seq in pending.popleft().get():
+                        yield SeqRecord(protein_seq, seq_id, "", "")
+            while len(pending) > 0:
+                for seq_id, protein_seq in pending.popleft().get():
+                    yield SeqRecord(protein_seq, seq_id, "", "")
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        pool.join()
+
+    def _translation_batches(self, recs, feature_type, batch_size):
+        batch = []
+        for seq_id, seq_str, phase in self._extract_strs(recs, "CDS",
+                feature_type):
+            batch.append((seq_id, seq_str[phase:]))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    def _extract_strs(self, recs, part_type, feature_type):
+        """Retrieve id, joined sequence and phase for features in records.
+        """
+        for rec in recs:
+            feature_parts = list(self._feature_parts(rec.features,
+                part_type, feature_type, True))
+            if len(feature_parts) == 0:
+                continue
+            fetch = self._get_fetcher(rec)
+            for feature, parts in feature_parts:
+                parts = sorted(parts,
+                        key=lambda p: p.location.nofuzzy_start)
+                seq_str = "".join([fetch(p.location.nofuzzy_start,
+                    p.location.nofuzzy_end) for p in parts])
+                strand = feature.strand or parts[0].strand
+                if strand == -1:
+                    seq_str = str(Seq(seq_str,
+                        generic_dna).reverse_complement())
+                    first_part = parts[-1]
+                else:
+                    first_part = parts[0]
+                yield (self._feature_id(feature), seq_str,
+                        self._phase(first_part))
+
+    def _feature_parts(self, features, part_type, feature_type, toplevel):
+        """Find features with sub_features of part_type, searching nested.
+        """
+        for feature in features:
+            parts = [sf for sf in feature.sub_features if sf.type == part_type]
+            if len(parts) > 0 and (feature_type is None or
+                    feature.type == feature_type):
+                yield feature, parts
+            elif (toplevel and feature.type == part_type and
+                    feature_type is None and not feature.sub_features):
+                yield feature, [feature]
+            else:
+                for feature_parts in self._feature_parts(feature.sub_features,
+                        part_type, feature_type, False):
+                    yield feature_parts
+
+    def _get_fetcher(self, rec):
+        """Function to retrieve sequence strings by coordinate for a record.
+        """
+        if isinstance(self._seq_source, FastaIndex):
+            def _fetch_index(start, end):
+                return self._seq_source.fetch(rec.id, start, end)
+            return _fetch_index
+        if self._seq_source is None:
+            seq = rec.seq
+        else:
+            seq = self._seq_source[rec.id]
+            if isinstance(seq, SeqRecord):
+                seq = seq.seq
+        if isinstance(seq, IndexedSeq):
+            return seq.fetch
+        if seq is None or isinstance(seq, UnknownSeq):
+            raise ValueError("No sequence available for %s" % rec.id)
+        seq_str = str(seq)
+        def _fetch_str(start, end):
+            return seq_str[start:end]
+        return _fetch_str
+
+    def _feature_id(self, feature):
+        if feature.id and feature.id != "<unknown id>":
+            return feature.id
+        return feature.qualifiers.get("ID", [""])[0]
+
+    def _phase(self, part):
+        try:
+            return int(part.qualifiers.get("phase", ["0"])[0])
+        except ValueError:
+            return 0
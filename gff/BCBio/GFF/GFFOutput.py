@@ -3,7 +3,18 @@
 The target format is GFF3, the current GFF standard:
     http://www.sequenceontology.org/gff3.shtml
 """
+import re
 import urllib
+import collections
+import cStringIO
+import heapq
+import tempfile
+import struct
+import zlib
+
+from Bio.Seq import UnknownSeq
+
+from GFFParser import _identify_dup_ids
 
 class _IdHandler:
     """Generate IDs for GFF3 Parent/Child relationships where they don't exist.
@@ -11,7 +22,7 @@ class _IdHandler:
     def __init__(self):
         self._prefix = "biopygen"
         self._counter = 1
-        self._seen_ids = []
+        self._seen_ids = set()
 
     def _generate_id(self, quals):
         """Generate a unique ID not present in our existing IDs.
@@ -50,85 +61,585 @@ class _IdHandler:
             if not isinstance(cur_id, list) and not isinstance(cur_id, tuple):
                 cur_id = [cur_id]
             for add_id in cur_id:
-                self._seen_ids.append(add_id)
+                self._seen_ids.add(add_id)
         # if we need one and don't have it, create a new one
         elif has_children:
             new_id = self._generate_id(quals)
-            self._seen_ids.append(new_id)
+            self._seen_ids.add(new_id)
+            quals["ID"] = [new_id]
+        return quals
+
+class _DeferredIdHandler(_IdHandler):
+    """Record ID usage while formatting in a worker process.
+
+    Generated IDs depend on every ID written before them, so workers insert
+    placeholders and log seen and generated IDs in order. The parent process
+    replays the log to assign final IDs, giving the same IDs as a serial
+    write.
+    """
+    def __init__(self):
+        _IdHandler.__init__(self)
+        self.id_log = []
+
+    def update_quals(self, quals, has_children):
+        cur_id = quals.get("ID", None)
+        if cur_id:
+            if not isinstance(cur_id, list) and not isinstance(cur_id, tuple):
+                cur_id = [cur_id]
+            for add_id in cur_id:
+                self.id_log.append(("seen", add_id))
+        elif has_children:
+            new_id = self._get_standard_id(quals)
+            if new_id is None:
+                new_id = "%spending%s_" % (self._prefix, len(self.id_log))
+                self.id_log.append(("generated", new_id))
+            else:
+                self.id_log.append(("seen", new_id))
             quals["ID"] = [new_id]
         return quals
 
+_pending_id_pat = re.compile("biopygenpending\d+_")
+
+def _format_feature_block(writer, block):
+    """Format a block of features in GFF3 in a worker process.
+    """
+    rec_id, anns, features = block
+    id_handler = _DeferredIdHandler()
+    out_handle = cStringIO.StringIO()
+    if anns:
+        writer._write_annotations(anns, rec_id, out_handle)
+    for sf in features:
+        id_handler = writer._write_feature(sf, rec_id, out_handle,
+                id_handler)
+    return out_handle.getvalue(), id_handler.id_log
+
+class _BufferedLineWriter:
+    """Collect output lines, writing them to a handle in large blocks.
+    """
+    def __init__(self, out_handle, buffer_lines):
+        self._out_handle = out_handle
+        self._buffer_lines = buffer_lines
+        self._lines = []
+
+    def write(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self._buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self._out_handle.write("".join(self._lines))
+            self._lines = []
+
+class _SortedLineCollector:
+    """Collect GFF lines with keys to sort by sequence and start coordinate.
+
+    Sequences are kept in the order they are first seen; a line counter
+    keeps the original order for ties, so parents stay before children.
+    """
+    def __init__(self, sorter):
+        self._sorter = sorter
+        self._seqids = dict()
+        self._count = 0
+
+    def write(self, line):
+        seqid, source, ftype, start = line.split("\t", 4)[:4]
+        seq_index = self._seqids.setdefault(seqid, len(self._seqids))
+        if start == ".":
+            start = 0
+        self._count += 1
+        self._sorter.add((seq_index, int(start), self._count), line)
+
+class _ExternalLineSorter:
+    """Sort keyed lines, spilling sorted runs to temporary files.
+
+    At most max_lines lines are held in memory; larger inputs are merged
+    from the sorted runs on disk.
+    """
+    def __init__(self, max_lines):
+        self._max_lines = max_lines
+        self._items = []
+        self._runs = []
+
+    def add(self, key, line):
+        self._items.append((key, line))
+        if len(self._items) >= self._max_lines:
+            self._write_run()
+
+    def _write_run(self):
+        self._items.sort()
+        run_handle = tempfile.TemporaryFile()
+        for (seq_index, start, count), line in self._items:
+            run_handle.write("%s\t%s\t%s\t%s" % (seq_index, start, count,
+                line))
+        run_handle.seek(0)
+        self._runs.append(run_handle)
+        self._items = []
+
+    def _read_run(self, run_handle):
+        for run_line in run_handle:
+            seq_index, start, count, line = run_line.split("\t", 3)
+            yield (int(seq_index), int(start), int(count)), line
+        run_handle.close()
+
+    def sorted_lines(self):
+        self._items.sort()
+        all_items = [self._read_run(r) for r in self._runs] + [self._items]
+        for key, line in heapq.merge(*all_items):
+            yield line
+
+class _BgzfWriter:
+    """Write BGZF compressed output, the block gzip format used by tabix.
+
+    Closing writes the BGZF end of file marker, but leaves the underlying
+    handle open.
+    """
+    _header = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+    _eof = _header + "\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+    # input per block, leaving space for incompressible data in 64Kb
+    _block_size = 65280
+
+    def __init__(self, out_handle, compresslevel=6):
+        self._handle = out_handle
+        self._compresslevel = compresslevel
+        self._buffer = ""
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            self._write_block(self._buffer[:self._block_size])
+            self._buffer = self._buffer[self._block_size:]
+
+    def _write_block(self, block):
+        compressor = zlib.compressobj(self._compresslevel, zlib.DEFLATED, -15)
+        data = compressor.compress(block) + compressor.flush()
+        # block size minus 1: 18 byte header, data and 8 byte trailer
+        self._handle.write(self._header + struct.pack("<H", len(data) + 25) +
+                data + struct.pack("<II", zlib.crc32(block) & 0xffffffff,
+                    len(block)))
+
+    def close(self):
+        if self._buffer:
+            self._write_block(self._buffer)
+            self._buffer = ""
+        self._handle.write(self._eof)
+        self._handle.flush()
+
 class GFF3Writer:
     """Write GFF3 files starting with standard Biopython objects.
     """
-    def __init__(self):
-        pass
+    _first_keys = ["ID", "Name", "Parent"]
+    # characters which urllib.quote leaves unchanged
+    _safe_val_pat = re.compile("^[A-Za-z0-9_.\-/]*$")
+    _max_quote_cache = 100000
+
+    def __init__(self, buffer_lines=5000):
+        """Initialize writer.
+
+        buffer_lines - Number of GFF lines to collect before writing them
+        to the output handle.
+        """
+        self._buffer_lines = buffer_lines
+        self._quote_cache = dict()
 
-    def write(self, recs, out_handle):
+    def __getstate__(self):
+        # avoid passing cached values to worker processes
+        state = self.__dict__.copy()
+        state["_quote_cache"] = dict()
+        return state
+
+    def write(self, recs, out_handle, include_fasta=False):
         """Write the provided records to the given handle in GFF3 format.
+
+        Records are written as they are iterated over, so recs can be a
+        generator like GFFParser.parse_in_parts.
+
+        include_fasta - Write a ##sequence-region directive for each record
+        and finish with a ##FASTA section containing record sequences.
+        Records with unknown sequences, like those created for features
+        without a base_dict, are not included in the ##FASTA section.
+        Records split over several parts, as from parse_in_parts, get one
+        directive and one sequence for each record id.
         """
         id_handler = _IdHandler()
         self._write_header(out_handle)
+        out_writer = _BufferedLineWriter(out_handle, self._buffer_lines)
+        fasta_recs = []
+        fasta_ids = set()
+        region_ids = set()
+        unknown_sizes = collections.OrderedDict()
         for rec in recs:
-            self._write_annotations(rec.annotations, rec.id, out_handle)
+            anns = rec.annotations
+            if include_fasta:
+                anns = self._write_sequence_region(rec, out_writer,
+                        region_ids, unknown_sizes)
+                if (len(rec.seq) > 0 and not isinstance(rec.seq, UnknownSeq)
+                        and rec.id not in fasta_ids):
+                    fasta_ids.add(rec.id)
+                    fasta_recs.append((rec.id, rec.seq))
+            self._write_annotations(anns, rec.id, out_writer)
             for sf in rec.features:
-                id_handler = self._write_feature(sf, rec.id, out_handle,
+                id_handler = self._write_feature(sf, rec.id, out_writer,
                         id_handler)
+        # placeholder lengths are used only without any sequence for a record
+        for rec_id, size in unknown_sizes.items():
+            if rec_id not in region_ids:
+                out_writer.write("##sequence-region %s 1 %s\n" % (rec_id,
+                    size))
+        out_writer.flush()
+        if fasta_recs:
+            self._write_fasta(fasta_recs, out_handle)
+
+    def _write_sequence_region(self, rec, out_handle, region_ids,
+            unknown_sizes):
+        """Write a sequence-region directive from the length of a record.
+
+        Each record id is written once, tracked in region_ids. The length of
+        an UnknownSeq only covers the features parsed so far, so the largest
+        is kept in unknown_sizes until the whole file is read.
+
+        Returns record annotations without any parsed sequence-region, which
+        this replaces.
+        """
+        if isinstance(rec.seq, UnknownSeq):
+            if len(rec.seq) > unknown_sizes.get(rec.id, 0):
+                unknown_sizes[rec.id] = len(rec.seq)
+        elif len(rec.seq) > 0 and rec.id not in region_ids:
+            region_ids.add(rec.id)
+            out_handle.write("##sequence-region %s 1 %s\n" % (rec.id,
+                len(rec.seq)))
+        anns = rec.annotations
+        if anns.has_key("sequence-region"):
+            anns = anns.copy()
+            del anns["sequence-region"]
+        return anns
+
+    def _write_fasta(self, fasta_recs, out_handle, line_size=60,
+            block_lines=1000):
+        """Write a ##FASTA section, wrapping sequences at line_size.
+
+        Sequences are converted to strings block_lines lines at a time,
+        so full chromosome strings are never built.
+        """
+        out_handle.write("##FASTA\n")
+        block_size = line_size * block_lines
+        for rec_id, seq in fasta_recs:
+            out_handle.write(">%s\n" % rec_id)
+            for block_start in range(0, len(seq), block_size):
+                seq_block = str(seq[block_start:block_start + block_size])
+                out_handle.write("".join(["%s\n" % seq_block[i:i + line_size]
+                    for i in range(0, len(seq_block), line_size)]))
+
+    def write_parallel(self, recs, out_handle, workers=None,
+            block_features=500):
+        """Write records in GFF3 format, formatting in multiple processes.
+
+        Blocks of block_features top level features are formatted by a pool
+        of worker processes and written in input order. The output is the
+        same as from write, including generated IDs.
+
+        workers - Number of processes to use; defaults to the number of CPUs.
+        """
+        import multiprocessing
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        id_handler = _IdHandler()
+        self._write_header(out_handle)
+        pool = multiprocessing.Pool(workers)
+        try:
+            pending = collections.deque()
+            for block in self._feature_blocks(recs, block_features):
+                pending.append(pool.apply_async(_format_feature_block,
+                    (self, block)))
+                # limit the number of blocks held in memory
+                if len(pending) >= workers * 4:
+                    self._write_formatted_block(pending.popleft().get(),
+                            id_handler, out_handle)
+            while len(pending) > 0:
+                self._write_formatted_block(pending.popleft().get(),
+                        id_handler, out_handle)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        pool.join()
+
+    def write_sorted(self, recs, out_handle, bgzip=False, max_lines=500000,
+            write_annotations=True):
+        """Write records in GFF3 format, sorted by start within each sequence.
+
+        Sequences are written in the order they are first seen. A ###
+        directive separates blocks of overlapping features, so all
+        references in a block are resolved. Sorting holds at most max_lines
+        lines in memory, merging larger outputs from temporary files.
+
+        bgzip - Write BGZF compressed output, ready for indexing with
+        tabix -p gff. tabix needs numeric coordinates, so use
+        write_annotations=False to leave out whole sequence annotations.
+        """
+        sorter = _ExternalLineSorter(max_lines)
+        collector = _SortedLineCollector(sorter)
+        id_handler = _IdHandler()
+        for rec in recs:
+            if write_annotations:
+                self._write_annotations(rec.annotations, rec.id, collector)
+            for sf in rec.features:
+                id_handler = self._write_feature(sf, rec.id, collector,
+                        id_handler)
+        if bgzip:
+            out_handle = _BgzfWriter(out_handle)
+        self._write_header(out_handle)
+        out_writer = _BufferedLineWriter(out_handle, self._buffer_lines)
+        last_seqid = None
+        block_end = None
+        for line in sorter.sorted_lines():
+            seqid, source, ftype, start, end = line.split("\t", 5)[:5]
+            if start == "." or end == ".":
+                start, end = 0, 0
+            else:
+                start, end = int(start), int(end)
+            if last_seqid is not None and (seqid != last_seqid or
+                    start > block_end):
+                out_writer.write("###\n")
+                block_end = None
+            out_writer.write(line)
+            last_seqid = seqid
+            if block_end is None or end > block_end:
+                block_end = end
+        out_writer.flush()
+        if bgzip:
+            out_handle.close()
+
+    def _feature_blocks(self, recs, block_features):
+        """Split records into blocks of top level features for formatting.
+        """
+        for rec in recs:
+            yield (rec.id, rec.annotations, rec.features[:block_features])
+            for start in range(block_features, len(rec.features),
+                    block_features):
+                yield (rec.id, None,
+                       rec.features[start:start + block_features])
+
+    def _write_formatted_block(self, formatted, id_handler, out_handle):
+        """Assign final generated IDs to a formatted block and write it.
+        """
+        text, id_log = formatted
+        final_ids = dict()
+        for id_type, cur_id in id_log:
+            if id_type == "generated":
+                final_ids[cur_id] = id_handler._generate_id(dict())
+                id_handler._seen_ids.add(final_ids[cur_id])
+            else:
+                id_handler._seen_ids.add(cur_id)
+        if final_ids:
+            text = _pending_id_pat.sub(
+                    lambda m: final_ids.get(m.group(0), m.group(0)), text)
+        out_handle.write(text)
 
     def _write_feature(self, feature, rec_id, out_handle, id_handler,
             parent_id=None):
         """Write a feature with location information.
         """
-        if feature.strand == 1:
-            strand = '+'
-        elif feature.strand == -1:
-            strand = '-'
-        else:
-            strand = '.'
-        # remove any standard features from the qualifiers
-        quals = feature.qualifiers.copy()
+        quals = self._remove_std_quals(feature.qualifiers)
+        # add a link to a parent identifier if it exists; copy so the
+        # qualifiers of the feature being written stay unchanged
+        if parent_id:
+            cur_parents = quals.get("Parent", [])
+            if not isinstance(cur_parents, (list, tuple)):
+                cur_parents = [cur_parents]
+            quals["Parent"] = list(cur_parents) + [parent_id]
+        quals = id_handler.update_quals(quals, len(feature.sub_features) > 0)
+        self._write_feature_line(out_handle, rec_id, feature.type,
+                feature.location.nofuzzy_start, feature.location.nofuzzy_end,
+                feature.strand, feature.qualifiers, quals)
+        for sub_feature in feature.sub_features:
+            id_handler = self._write_feature(sub_feature, rec_id, out_handle,
+                    id_handler, quals["ID"][0])
+        return id_handler
+
+    def _remove_std_quals(self, all_quals):
+        """Copy qualifiers, removing those written in standard GFF columns.
+        """
+        quals = all_quals.copy()
         for std_qual in ["source", "score", "phase"]:
             if quals.has_key(std_qual) and len(quals[std_qual]) == 1:
                 del quals[std_qual]
-        # add a link to a parent identifier if it exists
-        if parent_id:
-            if not quals.has_key("Parent"):
-                quals["Parent"] = []
-            quals["Parent"].append(parent_id)
-        quals = id_handler.update_quals(quals, len(feature.sub_features) > 0)
-        if feature.type:
-            ftype = feature.type
+        return quals
+
+    def _write_feature_line(self, out_handle, rec_id, ftype, start, end,
+            strand, all_quals, quals):
+        """Write a GFF3 feature line from a 0-based start and 1-based end.
+        """
+        if strand == 1:
+            strand = '+'
+        elif strand == -1:
+            strand = '-'
         else:
+            strand = '.'
+        if not ftype:
             ftype = "sequence_feature"
         parts = [str(rec_id),
-                 feature.qualifiers.get("source", ["feature"])[0],
+                 all_quals.get("source", ["feature"])[0],
                  ftype,
-                 str(feature.location.nofuzzy_start + 1), # 1-based indexing
-                 str(feature.location.nofuzzy_end),
-                 feature.qualifiers.get("score", ["."])[0],
+                 str(start + 1), # 1-based indexing
+                 str(end),
+                 all_quals.get("score", ["."])[0],
                  strand,
-                 str(feature.qualifiers.get("phase", ["."])[0]),
-                 self._format_keyvals(quals)]
+                 str(all_quals.get("phase", ["."])[0]),
+                 self._format_keyvals(quals) or "."]
         out_handle.write("\t".join(parts) + "\n")
-        for sub_feature in feature.sub_features:
-            id_handler = self._write_feature(sub_feature, rec_id, out_handle,
-                    id_handler, quals["ID"][0])
+
+    def write_simple(self, results_iter, out_handle):
+        """Write GFF3 directly from GFFParser.parse_simple results.
+
+        No SeqRecord or SeqFeature objects are built, so converting a file
+        parsed in parts with target_lines needs memory only for one part.
+        Children are written after their parent and, as in parse, parents
+        are inferred for GFF2 style children which share a missing parent.
+        Children with multiple parents are written once. Sequences parsed
+        from a ##FASTA section are written in a ##FASTA section at the end,
+        as with include_fasta in write.
+        """
+        id_handler = _IdHandler()
+        self._write_header(out_handle)
+        out_writer = _BufferedLineWriter(out_handle, self._buffer_lines)
+        fasta_recs = []
+        for results in results_iter:
+            id_handler = self._write_simple_results(results, out_writer,
+                    id_handler)
+            fasta_recs.extend([(rec.id, rec.seq) for rec in
+                results.get('fasta', [])])
+        out_writer.flush()
+        if fasta_recs:
+            self._write_fasta(fasta_recs, out_handle)
+
+    def _write_simple_results(self, results, out_handle, id_handler):
+        """Write a set of parse_simple results, nesting children and parents.
+        """
+        for directive in results.get('directive', []):
+            if directive.startswith("sequence-region"):
+                out_handle.write("##%s\n" % directive)
+        for ann in results.get('annotation', []):
+            self._write_annotations(ann['quals'], ann['rec_id'], out_handle)
+        for feature in results.get('feature', []):
+            id_handler = self._write_simple_feature(feature, dict(),
+                    out_handle, id_handler)
+        parents = results.get('parent', [])
+        multi_remap = _identify_dup_ids(parents)
+        for parent in parents:
+            if multi_remap.has_key(parent['id']):
+                parent['id'] = multi_remap[parent['id']].remap_id(parent)
+                parent['quals']['ID'] = [parent['id']]
+        parent_ids = set([p['id'] for p in parents])
+        # nest children under the first parent found, in line order
+        children = dict()
+        child_order = []
+        for child in results.get('child', []):
+            child_parents = child['quals']['Parent']
+            for pindex, pid in enumerate(child_parents):
+                if multi_remap.has_key(pid):
+                    child_parents[pindex] = multi_remap[pid].remap_id(child)
+            write_pid = child_parents[0]
+            for pid in child_parents:
+                if pid in parent_ids:
+                    write_pid = pid
+                    break
+            if not children.has_key(write_pid):
+                children[write_pid] = []
+                child_order.append(write_pid)
+            children[write_pid].append(child)
+        for parent in parents:
+            id_handler = self._write_simple_feature(parent, children,
+                    out_handle, id_handler)
+        # children without a parent line, like GFF2 transcript parts
+        for pid in child_order:
+            cur_children = children.pop(pid, None)
+            if cur_children is None:
+                continue
+            if len(cur_children) == 1:
+                id_handler = self._write_simple_feature(cur_children[0],
+                        children, out_handle, id_handler)
+            else:
+                rec_ids = set([c['rec_id'] for c in cur_children])
+                assert len(rec_ids) == 1, (pid, rec_ids)
+                parent = dict(id=pid, strand=None, type="inferred_parent",
+                        quals=dict(ID=[pid]), rec_id=cur_children[0]['rec_id'],
+                        location=(min([c['location'][0] for c in cur_children]),
+                            max([c['location'][1] for c in cur_children])))
+                children[pid] = cur_children
+                id_handler = self._write_simple_feature(parent, children,
+                        out_handle, id_handler)
+        return id_handler
+
+    def _write_simple_feature(self, feature, children, out_handle, id_handler):
+        """Write a parse_simple feature dictionary and its children.
+        """
+        cur_children = []
+        if feature['id']:
+            cur_children = children.pop(feature['id'], [])
+        quals = self._remove_std_quals(feature['quals'])
+        quals = id_handler.update_quals(quals, len(cur_children) > 0)
+        start, end = feature['location']
+        self._write_feature_line(out_handle, feature['rec_id'],
+                feature['type'], start, end, feature['strand'],
+                feature['quals'], quals)
+        for child in cur_children:
+            id_handler = self._write_simple_feature(child, children,
+                    out_handle, id_handler)
         return id_handler
 
     def _format_keyvals(self, keyvals):
+        """Format key value pairs in GFF3 style.
+
+        Keys are written in a fixed order, with the common ID, Name and Parent
+        keys first and the remainder sorted, so output is reproducible.
+        """
         format_kvs = []
-        for key, values in keyvals.items():
+        other_keys = [k for k in keyvals.keys() if k not in self._first_keys]
+        other_keys.sort()
+        for key in [k for k in self._first_keys if keyvals.has_key(k)] + \
+                other_keys:
+            values = keyvals[key]
             key = key.strip()
-            format_vals = []
             if not isinstance(values, list) or isinstance(values, tuple):
                 values = [values]
+            # common case of a single value without duplicates to remove
+            if len(values) == 1:
+                val = self._quote_val(values[0])
+                if key and val:
+                    format_kvs.append("%s=%s" % (key, val))
+                else:
+                    format_kvs.append("%s=" % key)
+                continue
+            format_vals = []
+            seen_vals = set()
             for val in values:
-                val = urllib.quote(str(val).strip())
-                if ((key and val) and val not in format_vals):
+                val = self._quote_val(val)
+                if ((key and val) and val not in seen_vals):
+                    seen_vals.add(val)
                     format_vals.append(val)
             format_kvs.append("%s=%s" % (key, ",".join(format_vals)))
         return ";".join(format_kvs)
 
+    def _quote_val(self, val):
+        """URL quote a value for GFF3 output, caching repeated values.
+
+        Values with only characters left unchanged by quoting are used as is.
+        """
+        if isinstance(val, str):
+            try:
+                return self._quote_cache[val]
+            except KeyError:
+                pass
+        quoted = str(val).strip()
+        if not self._safe_val_pat.match(quoted):
+            quoted = urllib.quote(quoted)
+        if isinstance(val, str):
+            if len(self._quote_cache) >= self._max_quote_cache:
+                self._quote_cache.clear()
+            self._quote_cache[val] = quoted
+        return quoted
+
     def _write_annotations(self, anns, rec_id, out_handle):
         """Add annotations which refer to an entire sequence.
         """
@@ -143,8 +654,8 @@ class GFF3Writer:
         """
         out_handle.write("##gff-version 3\n")
 
-def write(recs, out_handle):
+def write(recs, out_handle, include_fasta=False):
     """High level interface to write GFF3 files from SeqRecords and SeqFeatures.
     """
     writer = GFF3Writer()
-    return writer.write(recs, out_handle)
+    return writer.write(recs, out_handle, include_fasta)
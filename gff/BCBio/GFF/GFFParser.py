@@ -16,11 +16,15 @@ Erlang for parallelization. The code works on a single processor without
 Disco using the same architecture.
 """
 import os
+import sys
 import copy
 import re
 import collections
 import urllib
 import itertools
+import time
+import threading
+import Queue
 
 # Make defaultdict compatible with versions of python older than 2.4
 try:
@@ -34,6 +38,8 @@ from Bio.SeqRecord import SeqRecord
 from Bio.SeqFeature import SeqFeature, FeatureLocation
 from Bio import SeqIO
 
+from FastaIndex import FastaIndex
+
 def _gff_line_map(line, params):
     """Map part of Map-Reduce; parses a line of GFF into a dictionary.
 
@@ -56,7 +62,7 @@ def _gff_line_map(line, params):
         """
         quals = collections.defaultdict(list)
         if keyval_str is None:
-            return quals
+            return quals, False
         # ensembl GTF has a stray semi-colon at the end
         if keyval_str[-1] == ';':
             keyval_str = keyval_str[:-1]
@@ -159,7 +165,7 @@ def _gff_line_map(line, params):
             if len(parts) > 8:
                 quals, is_gff2 = _split_keyvals(gff_parts[8])
             else:
-                quals, is_gff2 = dict(), False
+                quals, is_gff2 = collections.defaultdict(list), False
             gff_info["is_gff2"] = is_gff2
             if gff_parts[1]:
                 quals["source"].append(gff_parts[1])
@@ -236,6 +242,111 @@ class _MultiIDRemapper:
                 self._base_id, [p['location'] for p in self._parents],
                 feature_dict['location']))
 
+def _identify_dup_ids(parents):
+    """Identify duplicated ID attributes in potential nested parents.
+
+    According to the GFF3 spec ID attributes are supposed to be unique
+    for a file, but this is not always true in practice. This looks
+    for duplicates, and provides unique IDs sorted by locations.
+    """
+    multi_ids = collections.defaultdict(list)
+    for parent in parents:
+        multi_ids[parent['id']].append(parent)
+    multi_ids = [(mid, parents) for (mid, parents) in multi_ids.items()
+            if len(parents) > 1]
+    multi_remap = dict()
+    for mid, parents in multi_ids:
+        multi_remap[mid] = _MultiIDRemapper(mid, parents)
+    return multi_remap
+
+class _ParseStats:
+    """Collect timing and count statistics for each chunk of a GFF parse.
+    """
+    stages = ["read", "map", "reduce", "results_to_features",
+              "add_parent_child_features"]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.chunks = 0
+        self.peak_chunk_lines = 0
+        self._reset_chunk()
+
+    def _reset_chunk(self):
+        self.times = dict((stage, 0.0) for stage in self.stages)
+        self.lines = 0
+        self.inferred_parents = 0
+
+    def add_time(self, stage, start):
+        self.times[stage] += time.time() - start
+
+    def timed_fn(self, stage, fn):
+        """Wrap a function to add the time spent in it to a stage.
+        """
+        def _timed_fn(*args):
+            start = time.time()
+            out = fn(*args)
+            self.add_time(stage, start)
+            return out
+        return _timed_fn
+
+    def timed_lines(self, line_iter):
+        """Generate lines, counting them and timing the reads.
+        """
+        line_iter = iter(line_iter)
+        while 1:
+            start = time.time()
+            try:
+                line = line_iter.next()
+            except StopIteration:
+                self.add_time("read", start)
+                break
+            self.add_time("read", start)
+            self.lines += 1
+            yield line
+
+    def finish_chunk(self, results):
+        """Summarize statistics for a parsed chunk and start a new one.
+        """
+        self.chunks += 1
+        self.peak_chunk_lines = max(self.peak_chunk_lines, self.lines)
+        # parent/child addition is timed within results_to_features
+        total_time = sum(t for (stage, t) in self.times.items()
+                         if stage != "add_parent_child_features")
+        if total_time > 0:
+            lines_per_sec = self.lines / total_time
+        else:
+            lines_per_sec = None
+        bucket_counts = dict()
+        for key, vals in results.items():
+            bucket_counts[key] = len(vals)
+        stats = dict(chunk=self.chunks, lines=self.lines,
+                lines_per_sec=lines_per_sec, times=dict(self.times),
+                bucket_counts=bucket_counts,
+                peak_chunk_lines=self.peak_chunk_lines,
+                inferred_parents=self.inferred_parents)
+        self._reset_chunk()
+        return stats
+
+class _IndexedBaseDict(dict):
+    """Records for a parsed chunk, retrieved from a FastaIndex when first used.
+    """
+    def __init__(self, fasta_index):
+        dict.__init__(self)
+        self._fasta_index = fasta_index
+
+    def __missing__(self, rec_id):
+        rec = self._fasta_index[rec_id]
+        self[rec_id] = rec
+        return rec
+
+    def has_key(self, rec_id):
+        return dict.has_key(self, rec_id) or self._fasta_index.has_key(rec_id)
+
+    def __contains__(self, rec_id):
+        return self.has_key(rec_id)
+
 class _AbstractMapReduceGFF:
     """Base class providing general GFF parsing for local and remote classes.
 
@@ -244,16 +355,35 @@ class _AbstractMapReduceGFF:
     the _gff_process function, which returns a dictionary of SeqRecord
     information.
     """
-    def __init__(self, create_missing=True):
+    def __init__(self, create_missing=True, collect_stats=False):
         """Initialize GFF parser 
 
         create_missing - If True, create blank records for GFF ids not in
         the base_dict. If False, an error will be raised.
+
+        collect_stats - If True, collect timing and count statistics for
+        each parsed chunk, available from get_stats.
         """
         self._create_missing = create_missing
         self._map_fn = _gff_line_map
         self._reduce_fn = _gff_line_reduce
         self._examiner = GFFExaminer()
+        if collect_stats:
+            self._stats = _ParseStats()
+        else:
+            self._stats = None
+        self._last_stats = None
+
+    def get_stats(self):
+        """Retrieve statistics for the most recently parsed chunk.
+
+        Returns a dictionary with per-stage times in seconds (read, map,
+        reduce, results_to_features, add_parent_child_features), lines
+        parsed and lines per second, counts of parsed lines by type, the
+        largest chunk seen so far and the number of inferred parents
+        created. Returns None if statistics are not being collected.
+        """
+        return self._last_stats
 
     def _gff_process(self, gff_files, limit_info, target_lines=None):
         raise NotImplementedError("Derived class must define")
@@ -267,7 +397,9 @@ class _AbstractMapReduceGFF:
         
         base_dict - A base dictionary of SeqRecord objects which may be
         pre-populated with sequences and other features. The new features from
-        the GFF file will be added to this dictionary.
+        the GFF file will be added to this dictionary. A FastaIndex can be
+        used instead to avoid reading all sequences into memory; only records
+        with features in the GFF file are then returned.
         """
         for rec in self.parse_in_parts(gff_files, base_dict, limit_info):
             yield rec
@@ -283,9 +415,13 @@ class _AbstractMapReduceGFF:
         for results in self.parse_simple(gff_files, limit_info, target_lines):
             if base_dict is None:
                 cur_dict = dict()
+            elif isinstance(base_dict, FastaIndex):
+                cur_dict = _IndexedBaseDict(base_dict)
             else:
                 cur_dict = copy.deepcopy(base_dict)
             cur_dict = self._results_to_features(cur_dict, results)
+            if self._stats is not None:
+                self._last_stats = self._stats.finish_chunk(results)
             all_ids = cur_dict.keys()
             all_ids.sort()
             for cur_id in all_ids:
@@ -301,6 +437,8 @@ class _AbstractMapReduceGFF:
         if not isinstance(gff_files, (list, tuple)):
             gff_files = [gff_files]
         limit_info = self._normalize_limit_info(limit_info)
+        if self._stats is not None:
+            self._stats.reset()
         for results in self._gff_process(gff_files, limit_info, target_lines):
             yield results
        
@@ -321,13 +459,19 @@ class _AbstractMapReduceGFF:
     def _results_to_features(self, base, results):
         """Add parsed dictionaries of results to Biopython SeqFeatures.
         """
+        start = time.time()
         base = self._add_annotations(base, results.get('annotation', []))
         for feature in results.get('feature', []):
             (_, base) = self._add_toplevel_feature(base, feature)
+        pc_start = time.time()
         base = self._add_parent_child_features(base, results.get('parent', []),
                 results.get('child', []))
+        if self._stats is not None:
+            self._stats.add_time("add_parent_child_features", pc_start)
         base = self._add_seqs(base, results.get('fasta', []))
         base = self._add_directives(base, results.get('directive', []))
+        if self._stats is not None:
+            self._stats.add_time("results_to_features", start)
         return base
 
     def _add_directives(self, base, directives):
@@ -405,20 +549,8 @@ class _AbstractMapReduceGFF:
 
     def _identify_dup_ids(self, parents):
         """Identify duplicated ID attributes in potential nested parents.
-
-        According to the GFF3 spec ID attributes are supposed to be unique
-        for a file, but this is not always true in practice. This looks
-        for duplicates, and provides unique IDs sorted by locations.
         """
-        multi_ids = collections.defaultdict(list)
-        for parent in parents:
-            multi_ids[parent['id']].append(parent)
-        multi_ids = [(mid, parents) for (mid, parents) in multi_ids.items()
-                if len(parents) > 1]
-        multi_remap = dict()
-        for mid, parents in multi_ids:
-            multi_remap[mid] = _MultiIDRemapper(mid, parents)
-        return multi_remap
+        return _identify_dup_ids(parents)
 
     def _add_children_to_parent(self, cur_parent, children):
         """Recursively add children to parent features.
@@ -484,6 +616,8 @@ class _AbstractMapReduceGFF:
                 for r, c in cur_children]
         feature_dict["location"] = (min([c[0] for c in coords]),
                 max([c[1] for c in coords]))
+        if self._stats is not None:
+            self._stats.inferred_parents += 1
         return self._add_toplevel_feature(base, feature_dict)
 
     def _add_toplevel_feature(self, base, feature_dict):
@@ -527,6 +661,9 @@ class _GFFParserLocalOut:
                 if vals[0] == '#':
                     self.can_break = True
                 self._last_parent = None
+            # sequences come at the end of the file, after all features
+            elif key == 'fasta':
+                self.can_break = True
             elif not vals[0].get("is_gff2", False):
                 self._update_missing_parents(key, vals)
                 self.can_break = (len(self._missing_keys) == 0)
@@ -568,12 +705,101 @@ class _GFFParserLocalOut:
         self._last_parent = None
         return self._items
 
+class _PrefetchLineReader:
+    """Read GFF files in large blocks ahead of parsing on a background thread.
+
+    Blocks are placed on a bounded queue so file reads, which can be slow
+    on network filesystems, overlap with parsing of the previous blocks.
+    """
+    def __init__(self, gff_files, queue_depth, block_size):
+        self._block_size = block_size
+        self._queue = Queue.Queue(queue_depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read_blocks,
+                args=(gff_files,))
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _read_blocks(self, gff_files):
+        """Producer: put file blocks on the queue, marking each file end.
+        """
+        try:
+            for gff_file in gff_files:
+                if hasattr(gff_file, "read"):
+                    need_close = False
+                    in_handle = gff_file
+                else:
+                    need_close = True
+                    in_handle = open(gff_file)
+                try:
+                    while not self._stop.isSet():
+                        block = in_handle.read(self._block_size)
+                        if not block:
+                            break
+                        self._put(("block", block))
+                finally:
+                    if need_close:
+                        in_handle.close()
+                self._put(("eof", None))
+        except:
+            self._put(("error", sys.exc_info()))
+        self._put(("done", None))
+
+    def _put(self, item):
+        """Add an item to the queue, giving up if the consumer went away.
+        """
+        while not self._stop.isSet():
+            try:
+                self._queue.put(item, True, 0.1)
+                break
+            except Queue.Full:
+                pass
+
+    def lines(self):
+        """Consumer: generate single lines from the queued blocks.
+        """
+        partial = ""
+        try:
+            while 1:
+                item_type, item = self._queue.get()
+                if item_type == "block":
+                    cur_lines = (partial + item).split("\n")
+                    partial = cur_lines.pop()
+                    for line in cur_lines:
+                        yield line + "\n"
+                elif item_type == "eof":
+                    if partial:
+                        yield partial
+                    partial = ""
+                elif item_type == "error":
+                    raise item[0], item[1], item[2]
+                else:
+                    break
+        finally:
+            self._stop.set()
+
 class GFFParser(_AbstractMapReduceGFF):
     """Local GFF parser providing standardized parsing of GFF3 and GFF2 files.
     """
-    def __init__(self, line_adjust_fn=None, create_missing=True):
-        _AbstractMapReduceGFF.__init__(self, create_missing=create_missing)
+    def __init__(self, line_adjust_fn=None, create_missing=True,
+            prefetch_depth=0, prefetch_block_size=1048576,
+            collect_stats=False):
+        """Initialize parser.
+
+        prefetch_depth - Number of blocks to read ahead of parsing in a
+        background thread. Useful when reading from slow or network
+        filesystems. The default of 0 reads lines directly while parsing.
+
+        prefetch_block_size - Size, in bytes, of the blocks read ahead.
+
+        collect_stats - If True, collect timing and count statistics for
+        each parsed chunk, available from get_stats.
+        """
+        _AbstractMapReduceGFF.__init__(self, create_missing=create_missing,
+                collect_stats=collect_stats)
         self._line_adjust_fn = line_adjust_fn
+        self._prefetch_depth = prefetch_depth
+        self._prefetch_block_size = prefetch_block_size
     
     def _gff_process(self, gff_files, limit_info, target_lines):
         """Process GFF addition without any parallelization.
@@ -589,6 +815,12 @@ class GFFParser(_AbstractMapReduceGFF):
     def _file_line_generator(self, gff_files):
         """Generate single lines from a set of GFF files.
         """
+        if self._prefetch_depth > 0:
+            reader = _PrefetchLineReader(gff_files, self._prefetch_depth,
+                    self._prefetch_block_size)
+            for line in reader.lines():
+                yield line
+            return
         for gff_file in gff_files:
             if hasattr(gff_file, "read"):
                 need_close = False
@@ -612,14 +844,20 @@ class GFFParser(_AbstractMapReduceGFF):
         params = self._examiner._get_local_params(limit_info)
         out_info = _GFFParserLocalOut((target_lines is not None and
                 target_lines > 1))
+        map_fn = self._map_fn
+        reduce_fn = self._reduce_fn
+        if self._stats is not None:
+            line_iter = self._stats.timed_lines(line_iter)
+            map_fn = self._stats.timed_fn("map", map_fn)
+            reduce_fn = self._stats.timed_fn("reduce", reduce_fn)
         found_seqs = False
         for line in line_iter:
-            results = self._map_fn(line, params)
+            results = map_fn(line, params)
             if self._line_adjust_fn and results:
                 if results[0][0] not in ['directive']:
                     results = [(results[0][0],
                         self._line_adjust_fn(results[0][1]))]
-            self._reduce_fn(results, out_info, params)
+            reduce_fn(results, out_info, params)
             if (target_lines and out_info.num_lines >= target_lines and
                     out_info.can_break):
                 yield out_info.get_results()
@@ -749,6 +987,9 @@ class GFFExaminer:
         for filter_key in self._filter_info.keys():
             cur_limits[filter_key] = collections.defaultdict(int)
         for line in gff_handle:
+            # sequences, not features, follow a FASTA directive
+            if line.startswith("##FASTA"):
+                break
             # ignore empty and comment lines
             if line.strip() and line.strip()[0] != "#":
                 parts = [p.strip() for p in line.split('\t')]
@@ -780,7 +1021,9 @@ class GFFExaminer:
         parent_sts = dict()
         child_sts = collections.defaultdict(list)
         for line in gff_handle:
-            if line.strip():
+            if line.startswith("##FASTA"):
+                break
+            if line.strip() and line.strip()[0] != "#":
                 line_type, line_info = _gff_line_map(line,
                         self._get_local_params())[0]
                 if (line_type == 'parent' or (line_type == 'child' and
@@ -2,3 +2,5 @@
 """
 from GFFParser import GFFParser, DiscoGFFParser, GFFExaminer, parse
 from GFFOutput import GFF3Writer, write
+from FastaIndex import FastaIndex
+from FeatureSeqs import FeatureSeqExtractor
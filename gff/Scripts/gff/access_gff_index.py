@@ -8,18 +8,28 @@ Index time:
   44 Mb file
   11 seconds
   Index is 7.5Mb
+
+Indexing is incremental. Alongside the bx-python index we keep the indexed
+intervals and a small info file with the number of bytes indexed, the file
+modification time and a fingerprint of the head and tail of that indexed
+region. When a GFF file only has lines appended, just the new lines are read;
+the index is rebuilt from scratch when the previously indexed content
+changed. Files are assumed to change only by having lines appended: a
+rewrite keeping the same size is found from the modification time, but a
+file edited in the middle and also made longer is only caught if the edit
+reaches the fingerprinted head or tail. Use force to re-index such files.
 """
 from __future__ import with_statement
 import os
 import sys
+import hashlib
 
 from bx import interval_index_file
 
 from BCBio import GFF
 
 def main(gff_file):
-    gff_index = gff_file + ".index"
-    if not os.path.exists(gff_index):
+    if not index_is_current(gff_file):
         print "Indexing GFF file"
         index(gff_file)
     index = GFFIndexedAccess(gff_file, keep_open=True)
@@ -76,23 +86,154 @@ class GFFIndexedAccess(interval_index_file.AbstractIndexedAccess):
         line = handle.readline()
         return line
 
-def index(gff_file, index_file=None):
-    index = interval_index_file.Indexes()
+def index(gff_file, index_file=None, force=False):
+    """Build or update an interval index for a GFF file.
+
+    Only lines appended since the last indexing are read. The full file is
+    re-read if the previously indexed content changed, or if force is set.
+    """
+    if index_file is None:
+        index_file = gff_file + ".index"
+    interval_file = index_file + ".intervals"
+    info = _read_index_info(index_file)
+    if (force or info is None or not os.path.exists(interval_file) or
+            _content_changed(gff_file, info)):
+        info = dict(gff_size=0, interval_size=0, complete_size=0,
+                complete_interval_size=0)
+    gff_mtime = os.path.getmtime(gff_file)
+    with open(interval_file, "a+") as interval_handle:
+        # drop intervals written by an update that did not finish, and the
+        # interval of a final line without a newline, which is read again
+        interval_handle.truncate(info["complete_interval_size"])
+        interval_handle.seek(0, 2)
+        complete_size, complete_interval_size, gff_size = _index_new_lines(
+                gff_file, info["complete_size"], interval_handle)
+        interval_handle.flush()
+        interval_size = interval_handle.tell()
+    if (gff_size != info["gff_size"] or interval_size != info["interval_size"]
+            or not os.path.exists(index_file)):
+        _write_interval_index(interval_file, index_file)
+    _write_index_info(index_file, dict(gff_size=gff_size,
+        interval_size=interval_size, complete_size=complete_size,
+        complete_interval_size=complete_interval_size, gff_mtime=gff_mtime,
+        fingerprint=_fingerprint(gff_file, gff_size)))
+    return index_file
+
+def index_is_current(gff_file, index_file=None):
+    """Check if an index covers all lines currently in a GFF file.
+    """
+    if index_file is None:
+        index_file = gff_file + ".index"
+    info = _read_index_info(index_file)
+    if info is None or not os.path.exists(index_file):
+        return False
+    return (os.path.getsize(gff_file) == info["gff_size"] and
+            not _content_changed(gff_file, info))
+
+def _content_changed(gff_file, info):
+    """Check if the indexed part of a GFF file changed, other than appending.
+
+    Files of the same size as when indexed are compared by modification
+    time; otherwise the fingerprint of the indexed bytes is checked.
+    """
+    if (os.path.getsize(gff_file) == info["gff_size"] and
+            os.path.getmtime(gff_file) != info["gff_mtime"]):
+        return True
+    return _fingerprint(gff_file, info["gff_size"]) != info["fingerprint"]
+
+def _index_new_lines(gff_file, start_pos, interval_handle):
+    """Write intervals for GFF lines starting at the given byte position.
+
+    Returns the byte position after the last complete line and the size of
+    the intervals written up to then, followed by the position after all
+    indexed lines. A final line without a newline is indexed when it has
+    all GFF columns, but is read again by the next update in case it was
+    still being written; a shorter one is left for the next update.
+    """
     with open(gff_file) as in_handle:
+        in_handle.seek(start_pos)
+        pos = start_pos
         while 1:
-            pos = in_handle.tell()
             line = in_handle.readline()
-            if not line:
+            if not line.endswith("\n"):
                 break
-            if not line.startswith("#"):
-                parts = line.split("\t")
-                (seqid, gtype, source, start, end) = parts[:5]
-                index.add(seqid, int(start), int(end), pos)
-    if index_file is None:
-        index_file = gff_file + ".index"
+            if line.startswith("##FASTA"):
+                pos = os.path.getsize(gff_file)
+                return pos, interval_handle.tell(), pos
+            _write_interval(interval_handle, line, pos)
+            pos += len(line)
+    complete_interval_size = interval_handle.tell()
+    end_pos = pos
+    if line.startswith("#") or len(line.split("\t")) >= 9:
+        _write_interval(interval_handle, line, pos)
+        end_pos += len(line)
+    return pos, complete_interval_size, end_pos
+
+def _write_interval(interval_handle, line, pos):
+    """Write the interval of a GFF feature line found at pos.
+    """
+    if line.strip() and not line.startswith("#"):
+        parts = line.split("\t")
+        (seqid, gtype, source, start, end) = parts[:5]
+        interval_handle.write("%s\t%s\t%s\t%s\n" % (seqid,
+            int(start), int(end), pos))
+
+def _write_interval_index(interval_file, index_file):
+    """Write a bx-python interval index from the stored intervals.
+    """
+    index = interval_index_file.Indexes()
+    with open(interval_file) as in_handle:
+        for line in in_handle:
+            seqid, start, end, pos = line.rstrip("\n").split("\t")
+            index.add(seqid, int(start), int(end), int(pos))
     with open(index_file, "w") as index_handle:
         index.write(index_handle)
-    return index_file
+
+def _fingerprint(gff_file, size, block_size=65536):
+    """Fingerprint the first size bytes of a file from its head and tail.
+
+    Appending to a file leaves this unchanged. Rewriting it changes this
+    when the first or last indexed block differs; edits only in between
+    are not seen.
+    """
+    if size > os.path.getsize(gff_file):
+        return None
+    md5 = hashlib.md5(str(size))
+    with open(gff_file, "rb") as in_handle:
+        md5.update(in_handle.read(min(size, block_size)))
+        if size > block_size:
+            in_handle.seek(max(block_size, size - block_size))
+            md5.update(in_handle.read(size - in_handle.tell()))
+    return md5.hexdigest()
+
+def _read_index_info(index_file):
+    """Retrieve the size and fingerprint details recorded with an index.
+    """
+    info_file = index_file + ".info"
+    if not os.path.exists(info_file):
+        return None
+    info = dict()
+    with open(info_file) as in_handle:
+        for line in in_handle:
+            key, val = line.rstrip("\n").split("\t")
+            if key in ["gff_size", "interval_size", "complete_size",
+                    "complete_interval_size"]:
+                val = int(val)
+            elif key == "gff_mtime":
+                val = float(val)
+            info[key] = val
+    # info files of older indexes have only whole lines indexed
+    info.setdefault("complete_size", info["gff_size"])
+    info.setdefault("complete_interval_size", info["interval_size"])
+    info.setdefault("gff_mtime", None)
+    return info
+
+def _write_index_info(index_file, info):
+    with open(index_file + ".info", "w") as out_handle:
+        for key in ["gff_size", "interval_size", "complete_size",
+                "complete_interval_size", "fingerprint"]:
+            out_handle.write("%s\t%s\n" % (key, info[key]))
+        out_handle.write("gff_mtime\t%r\n" % info["gff_mtime"])
 
 if __name__ == "__main__":
     main(*sys.argv[1:])
@@ -2,29 +2,36 @@
 """Convert a GFF2 file to an updated GFF3 format file.
 
 Usage:
-    gff2_to_gff3.py <in_gff2_file>
+    gff2_to_gff3.py <in_gff2_file> [<number of processes>]
 
-The output file has the same name with the extension gff3.
+The output file has the same name with the extension gff3. GFF3 lines are
+written directly from the parsed lines, without building features, so memory
+use stays bounded. Passing a number of processes instead builds features and
+formats the GFF3 output in parallel.
 """
 import sys
 import os
 
 from BCBio.GFF import GFFParser, GFF3Writer
 
-def main(in_file):
+def main(in_file, workers=None):
     base, ext = os.path.splitext(in_file)
     out_file = "%s.gff3" % (base)
     in_handle = open(in_file)
     out_handle = open(out_file, "w")
     reader = GFFParser()
     writer = GFF3Writer()
-    writer.write(reader.parse_in_parts(in_handle, target_lines=25000),
-            out_handle)
+    if workers is None:
+        writer.write_simple(reader.parse_simple(in_handle,
+            target_lines=25000), out_handle)
+    else:
+        writer.write_parallel(reader.parse_in_parts(in_handle,
+            target_lines=25000), out_handle, workers=int(workers))
     in_handle.close()
     out_handle.close()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
+    if len(sys.argv) not in [2, 3]:
         print __doc__
         sys.exit()
-    main(sys.argv[1])
+    main(*sys.argv[1:])
@@ -6,6 +6,15 @@ up. See:
 
 http://biopython.org/wiki/BioSQL
 
+The GFF file is parsed in parts and loaded in batches, so memory use depends
+on the batch size rather than the size of the annotation file. Sequences are
+retrieved one at a time from an index of the FASTA file. Features are written
+with multi-row inserts and committed after each batch.
+
+To load into a local SQLite database instead of MySQL, pass the database file
+and, when creating a new database, the BioSQL SQLite schema
+(biosqldb-sqlite.sql from the BioSQL distribution).
+
 Depending on the size of the sequences being loaded, you may also get errors on
 loading very large chromosome sequences. Updating these options can help:
 
@@ -13,28 +22,27 @@ loading very large chromosome sequences. Updating these options can help:
     set global net_buffer_length=1000000;
 
 Usage:
-    gff_to_biosql.py <fasta file> <gff file>
+    gff_to_biosql.py <fasta file> <gff file> [<sqlite db> [<sqlite schema>]]
 """
 from __future__ import with_statement
 import sys
 
-from BioSQL import BioSeqDatabase
+from BioSQL import BioSeqDatabase, Loader
 from Bio import SeqIO
+from Bio.SeqRecord import SeqRecord
 
 from BCBio.GFF import GFFParser
 
-def main(seq_file, gff_file):
+def main(seq_file, gff_file, sqlite_file=None, schema_file=None):
     # -- To be customized
     # You need to update these parameters to point to your local database
-    # XXX demo example could be swapped to use SQLite when that is integrated
     user = "chapmanb"
     passwd = "cdev"
     host = "localhost"
     db_name = "wb199_gff"
     biodb_name = "wb199_gff_cds_pcr"
     # These need to be updated to reflect what you would like to parse
-    # out of the GFF file. Set limit_info=None to parse everything, but
-    # be sure the file is small or you may deal with memory issues.
+    # out of the GFF file. Set limit_info=None to parse everything.
     rnai_types = [('Orfeome', 'PCR_product'),
                 ('GenePair_STS', 'PCR_product'),
                 ('Promoterome', 'PCR_product')]
@@ -43,18 +51,22 @@ def main(seq_file, gff_file):
                   ('Coding_transcript', 'mRNA'),
                   ('Coding_transcript', 'CDS')]
     limit_info = dict(gff_source_type = rnai_types + gene_types)
+    # Number of GFF lines to parse at once, and features to write per commit
+    target_lines = 50000
+    batch_features = 10000
     # --
-    print "Parsing FASTA sequence file..."
-    with open(seq_file) as seq_handle:
-        seq_dict = SeqIO.to_dict(SeqIO.parse(seq_handle, "fasta"))
-
-    print "Parsing GFF data file..."
-    parser = GFFParser()
-    recs = parser.parse(gff_file, seq_dict, limit_info=limit_info)
+    print "Indexing FASTA sequence file..."
+    seq_index = SeqIO.index(seq_file, "fasta")
 
-    print "Writing to BioSQL database..."
-    server = BioSeqDatabase.open_database(driver="MySQLdb", user=user,
-            passwd=passwd, host=host, db=db_name)
+    if sqlite_file:
+        server = BioSeqDatabase.open_database(driver="sqlite3", db=sqlite_file)
+        if schema_file:
+            server.load_database_sql(schema_file)
+        # the database is rebuilt from scratch on failure, so favor speed
+        server.adaptor.execute("PRAGMA synchronous = OFF")
+    else:
+        server = BioSeqDatabase.open_database(driver="MySQLdb", user=user,
+                passwd=passwd, host=host, db=db_name)
     try:
         if biodb_name not in server.keys():
             server.new_database(biodb_name)
@@ -63,14 +75,192 @@ def main(seq_file, gff_file):
             server.adaptor.commit()
             server.new_database(biodb_name)
         db = server[biodb_name]
-        db.load(recs)
         server.adaptor.commit()
+
+        print "Loading GFF data file into BioSQL..."
+        loader = BatchFeatureLoader(server.adaptor, db.dbid, seq_index,
+                batch_features)
+        parser = GFFParser()
+        for rec in parser.parse_in_parts(gff_file, limit_info=limit_info,
+                target_lines=target_lines):
+            loader.load(rec)
+        # sequences without features are loaded as plain records
+        for rec_id in seq_index:
+            if not loader.has_record(rec_id):
+                loader.load(SeqRecord(None, rec_id))
+        loader.finish()
+        print "Loaded %s records with %s features" % (loader.num_records,
+                loader.num_features)
     except:
         server.adaptor.rollback()
         raise
 
+class BatchFeatureLoader:
+    """Load streamed SeqRecords into BioSQL, writing features in batches.
+
+    parse_in_parts can return the same record from several parts of a GFF
+    file. The bioentry and sequence are loaded the first time a record is
+    seen; features from later parts are appended to it. Row layout matches
+    BioSQL.Loader, so the database reads back as if loaded with db.load.
+    """
+    def __init__(self, adaptor, dbid, seq_index, batch_features=10000,
+            rows_per_insert=200):
+        self._adaptor = adaptor
+        self._loader = Loader.DatabaseLoader(adaptor, dbid)
+        self._seq_index = seq_index
+        self._batch_features = batch_features
+        # SQLite limits the number of parameters in a single statement
+        self._rows_per_insert = rows_per_insert
+        # record id -> [bioentry_id, features loaded]
+        self._bioentries = dict()
+        self._term_ids = dict()
+        self._pending = []
+        self.num_records = 0
+        self.num_features = 0
+
+    def has_record(self, rec_id):
+        return self._bioentries.has_key(rec_id)
+
+    def load(self, rec):
+        """Add a record, flushing features when a full batch is pending.
+        """
+        if not self._bioentries.has_key(rec.id):
+            self._bioentries[rec.id] = [self._load_bioentry(rec), 0]
+            self.num_records += 1
+        entry = self._bioentries[rec.id]
+        for feature in rec.features:
+            self._pending.append((entry[0], entry[1], feature))
+            entry[1] += 1
+            if len(self._pending) >= self._batch_features:
+                self.flush()
+
+    def finish(self):
+        self.flush()
+        self._adaptor.commit()
+
+    def _load_bioentry(self, rec):
+        """Load the bioentry, sequence and annotations of a record.
+
+        The sequence comes from the FASTA index, so only one is held in
+        memory at a time.
+        """
+        if self._seq_index.has_key(rec.id):
+            seq_rec = self._seq_index[rec.id]
+            load_rec = SeqRecord(seq_rec.seq, rec.id, seq_rec.name,
+                    seq_rec.description, annotations=rec.annotations)
+        else:
+            load_rec = SeqRecord(rec.seq, rec.id, rec.name, rec.description,
+                    annotations=rec.annotations)
+        # as in Loader.load_seqrecord, with features loaded separately in
+        # batches. The id comes from the bioentry insert itself, since
+        # last_id on MySQL reports the most recent insert of any table.
+        bioentry_id = self._loader._load_bioentry_table(load_rec)
+        self._loader._load_bioentry_date(load_rec, bioentry_id)
+        self._loader._load_biosequence(load_rec, bioentry_id)
+        self._loader._load_comment(load_rec, bioentry_id)
+        self._loader._load_dbxrefs(load_rec, bioentry_id)
+        references = load_rec.annotations.get('references', ())
+        for rank, reference in enumerate(references):
+            self._loader._load_reference(reference, rank, bioentry_id)
+        self._loader._load_annotations(load_rec, bioentry_id)
+        return bioentry_id
+
+    def flush(self):
+        """Write all pending features with multi-row inserts and commit.
+        """
+        if not self._pending:
+            return
+        type_ontology = self._loader._get_ontology_id('SeqFeature Keys')
+        source_term_id = self._term_id('EMBL/GenBank/SwissProt',
+                self._loader._get_ontology_id('SeqFeature Sources'))
+        feature_rows = [(bioentry_id, self._term_id(f.type, type_ontology),
+                         source_term_id, rank + 1)
+                        for (bioentry_id, rank, f) in self._pending]
+        self._insert_rows("seqfeature", ["bioentry_id", "type_term_id",
+            "source_term_id", "rank"], feature_rows)
+        seqfeature_ids = self._fetch_seqfeature_ids()
+        tag_ontology = self._loader._get_ontology_id('Annotation Tags')
+        location_rows = []
+        qualifier_rows = []
+        for bioentry_id, rank, feature in self._pending:
+            seqfeature_id = seqfeature_ids[(bioentry_id, rank + 1)]
+            location_rows.extend(self._location_rows(feature, seqfeature_id))
+            for key, vals in feature.qualifiers.items():
+                if key == "db_xref":
+                    self._loader._load_seqfeature_dbxref(vals, seqfeature_id)
+                    continue
+                if not isinstance(vals, list):
+                    vals = [vals]
+                term_id = self._term_id(key, tag_ontology)
+                for val_rank, val in enumerate(vals):
+                    qualifier_rows.append((seqfeature_id, term_id,
+                        val_rank + 1, val))
+        self._insert_rows("location", ["seqfeature_id", "dbxref_id",
+            "term_id", "start_pos", "end_pos", "strand", "rank"],
+            location_rows)
+        self._insert_rows("seqfeature_qualifier_value", ["seqfeature_id",
+            "term_id", "rank", "value"], qualifier_rows)
+        self.num_features += len(self._pending)
+        self._pending = []
+        self._adaptor.commit()
+
+    def _fetch_seqfeature_ids(self):
+        """Retrieve ids of the pending features, keyed by bioentry and rank.
+        """
+        rank_ranges = dict()
+        for bioentry_id, rank, _ in self._pending:
+            cur_min, cur_max = rank_ranges.get(bioentry_id, (rank, rank))
+            rank_ranges[bioentry_id] = (min(cur_min, rank), max(cur_max, rank))
+        seqfeature_ids = dict()
+        sql = r"SELECT seqfeature_id, rank FROM seqfeature " \
+              r"WHERE bioentry_id = %s AND rank >= %s AND rank <= %s"
+        for bioentry_id, (min_rank, max_rank) in rank_ranges.items():
+            for seqfeature_id, rank in self._adaptor.execute_and_fetchall(sql,
+                    (bioentry_id, min_rank + 1, max_rank + 1)):
+                seqfeature_ids[(bioentry_id, rank)] = seqfeature_id
+        return seqfeature_ids
+
+    def _location_rows(self, feature, seqfeature_id):
+        """Location rows for a feature: itself, or each sub_feature if split.
+        """
+        if feature.sub_features:
+            parts = feature.sub_features
+        else:
+            parts = [feature]
+        rows = []
+        for rank, part in enumerate(parts):
+            if part.ref:
+                dbxref_id = self._loader._get_dbxref_id(part.ref_db or "",
+                        part.ref)
+            else:
+                dbxref_id = None
+            rows.append((seqfeature_id, dbxref_id, None,
+                part.location.nofuzzy_start + 1, part.location.nofuzzy_end,
+                part.strand or 0, rank + 1))
+        return rows
+
+    def _term_id(self, name, ontology_id):
+        key = (name, ontology_id)
+        if not self._term_ids.has_key(key):
+            self._term_ids[key] = self._loader._get_term_id(name,
+                    ontology_id=ontology_id)
+        return self._term_ids[key]
+
+    def _insert_rows(self, table, cols, rows):
+        """Insert rows into a table using multi-row INSERT statements.
+        """
+        row_sql = "(%s)" % ", ".join(["%s"] * len(cols))
+        for start in range(0, len(rows), self._rows_per_insert):
+            cur_rows = rows[start:start + self._rows_per_insert]
+            sql = "INSERT INTO %s (%s) VALUES %s" % (table, ", ".join(cols),
+                    ", ".join([row_sql] * len(cur_rows)))
+            args = []
+            for row in cur_rows:
+                args.extend(row)
+            self._adaptor.execute(sql, args)
+
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
+    if len(sys.argv) not in [3, 4, 5]:
         print __doc__
         sys.exit()
-    main(sys.argv[1], sys.argv[2])
+    main(*sys.argv[1:])
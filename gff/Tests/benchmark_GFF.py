@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""Benchmark GFF parsing and writing on synthetic genome annotations.
+
+Generates deterministic GFF3, GFF2 (WormBase style) and GTF (Ensembl style)
+files with the requested number of genes, then times:
+
+    GFF.parse
+    GFFParser.parse_in_parts with several target_lines values
+    GFFExaminer.available_limits and parent_child_map
+    GFF3Writer.write
+
+Each benchmark runs in a separate process so the reported peak RSS belongs
+to that benchmark alone. Throughput is reported in GFF lines per second.
+
+The GFF3 files include genes with two transcripts sharing CDS regions
+(multi-parent features), genes with duplicated ID attributes and, with
+--fasta, an embedded ##FASTA section.
+
+Usage:
+    benchmark_GFF.py [--genes=<number>] [--formats=gff3,gff2,gtf]
+                     [--target_lines=1000,10000] [--fasta] [--out=<file>]
+"""
+import sys
+import os
+import time
+import random
+import resource
+import tempfile
+import shutil
+import multiprocessing
+from optparse import OptionParser
+
+from BCBio import GFF
+from BCBio.GFF import GFFParser, GFFExaminer, GFF3Writer
+
+def main(num_genes, formats, target_lines, include_fasta, out_file=None):
+    work_dir = tempfile.mkdtemp(prefix="gffbench")
+    try:
+        results = []
+        for gff_format in formats:
+            gff_file = os.path.join(work_dir, "synthetic.%s" % gff_format)
+            num_lines = write_synthetic_gff(gff_file, gff_format, num_genes,
+                    include_fasta=(include_fasta and gff_format == "gff3"))
+            for name, fn, args in _benchmarks(gff_file, target_lines):
+                secs, peak_rss = _run_isolated(fn, args)
+                results.append((gff_format, name, num_genes, num_lines, secs,
+                    num_lines / max(secs, 1e-9), peak_rss))
+                _print_result(results[-1])
+    finally:
+        shutil.rmtree(work_dir)
+    if out_file:
+        _write_results(results, out_file)
+    return results
+
+def _benchmarks(gff_file, target_lines):
+    """Provide the name, function and arguments of each benchmark.
+    """
+    yield ("parse", time_parse, (gff_file,))
+    for lines in target_lines:
+        yield ("parse_in_parts_%s" % lines, time_parse_in_parts,
+               (gff_file, lines))
+    yield ("available_limits", time_available_limits, (gff_file,))
+    yield ("parent_child_map", time_parent_child_map, (gff_file,))
+    yield ("write", time_write, (gff_file,))
+
+# ## Timed operations; each returns elapsed seconds
+
+def time_parse(gff_file):
+    start = time.time()
+    for rec in GFF.parse(gff_file):
+        pass
+    return time.time() - start
+
+def time_parse_in_parts(gff_file, target_lines):
+    parser = GFFParser()
+    start = time.time()
+    for rec in parser.parse_in_parts(gff_file, target_lines=target_lines):
+        pass
+    return time.time() - start
+
+def time_available_limits(gff_file):
+    start = time.time()
+    GFFExaminer().available_limits(gff_file)
+    return time.time() - start
+
+def time_parent_child_map(gff_file):
+    start = time.time()
+    GFFExaminer().parent_child_map(gff_file)
+    return time.time() - start
+
+def time_write(gff_file):
+    """Time writing of GFF3; parsing the input is not included.
+    """
+    recs = list(GFF.parse(gff_file))
+    out_handle = open(os.devnull, "w")
+    start = time.time()
+    GFF3Writer().write(recs, out_handle)
+    elapsed = time.time() - start
+    out_handle.close()
+    return elapsed
+
+def _run_isolated(fn, args):
+    """Run a benchmark in a new process, returning seconds and peak RSS in Kb.
+    """
+    queue = multiprocessing.Queue()
+    def _run():
+        try:
+            secs = fn(*args)
+        except:
+            queue.put(None)
+            raise
+        queue.put((secs, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    process = multiprocessing.Process(target=_run)
+    process.start()
+    out = queue.get()
+    process.join()
+    if out is None:
+        raise ValueError("Benchmark failed: %s" % fn.__name__)
+    return out
+
+def _print_result(result):
+    print "%-5s %-22s %8s genes %10s lines %9.2fs %12.0f lines/s %9s Kb" % \
+            result
+    sys.stdout.flush()
+
+def _write_results(results, out_file):
+    """Append results as tab delimited lines, for tracking across runs.
+    """
+    need_header = not os.path.exists(out_file)
+    out_handle = open(out_file, "a")
+    if need_header:
+        out_handle.write("\t".join(["format", "benchmark", "genes", "lines",
+            "seconds", "lines_per_sec", "peak_rss_kb"]) + "\n")
+    for result in results:
+        out_handle.write("\t".join([str(x) for x in result]) + "\n")
+    out_handle.close()
+
+# ## Synthetic GFF generation
+
+def write_synthetic_gff(out_file, gff_format, num_genes, seed=42,
+        num_seqids=4, include_fasta=False):
+    """Write a deterministic synthetic GFF file, returning the line count.
+    """
+    line_fn = {"gff3": _gff3_gene_lines,
+               "gff2": _gff2_gene_lines,
+               "gtf": _gtf_gene_lines}[gff_format]
+    rand = random.Random(seed)
+    seqid_lens = dict()
+    num_lines = 0
+    out_handle = open(out_file, "w")
+    if gff_format == "gff3":
+        out_handle.write("##gff-version 3\n")
+        num_lines += 1
+    for index, gene in enumerate(_synthetic_genes(rand, num_genes,
+            num_seqids)):
+        seqid_lens[gene["seqid"]] = gene["end"] + 1000
+        for line in line_fn(gene, index):
+            out_handle.write(line + "\n")
+            num_lines += 1
+        if gff_format == "gff3":
+            out_handle.write("###\n")
+            num_lines += 1
+    if include_fasta:
+        out_handle.write("##FASTA\n")
+        num_lines += 1
+        seqids = seqid_lens.keys()
+        seqids.sort()
+        for seqid in seqids:
+            num_lines += _write_fasta_seq(out_handle, rand, seqid,
+                    seqid_lens[seqid])
+    out_handle.close()
+    return num_lines
+
+def _synthetic_genes(rand, num_genes, num_seqids):
+    """Generate gene models with exon coordinates spread over seqids.
+
+    Every fifth gene has two transcripts which share their coding exons,
+    and every fiftieth gene reuses the ID of the previous gene.
+    """
+    genes_per_seqid = max(1, num_genes // num_seqids)
+    pos = 0
+    for index in range(num_genes):
+        if index % genes_per_seqid == 0:
+            pos = 1000
+        start = pos + rand.randint(100, 2000)
+        exons = []
+        exon_start = start
+        for i in range(rand.randint(1, 8)):
+            exon_end = exon_start + rand.randint(50, 400)
+            exons.append((exon_start, exon_end))
+            exon_start = exon_end + rand.randint(40, 1000)
+        gene_id = "gene%s" % index
+        if index % 50 == 49:
+            gene_id = "gene%s" % (index - 1)
+        yield dict(seqid="chr%s" % (min(index // genes_per_seqid,
+                       num_seqids - 1) + 1),
+                   gene_id=gene_id, start=start, end=exons[-1][1],
+                   strand=rand.choice("+-"), exons=exons,
+                   num_transcripts=(2 if index % 5 == 0 else 1))
+        pos = exons[-1][1]
+
+def _gff3_gene_lines(gene, index):
+    transcript_ids = ["%s.t%s" % (gene["gene_id"], i + 1)
+                      for i in range(gene["num_transcripts"])]
+    base = [gene["seqid"], "synthetic"]
+    yield "\t".join(base + ["gene", str(gene["start"]), str(gene["end"]), ".",
+        gene["strand"], ".", "ID=%s;Name=%s;Note=synthetic%%20gene%%3B%s" %
+        (gene["gene_id"], gene["gene_id"], index)])
+    for tid in transcript_ids:
+        yield "\t".join(base + ["mRNA", str(gene["start"]), str(gene["end"]),
+            ".", gene["strand"], ".", "ID=%s;Parent=%s" % (tid,
+                gene["gene_id"])])
+    for exon_index, (start, end) in enumerate(gene["exons"]):
+        yield "\t".join(base + ["exon", str(start), str(end), ".",
+            gene["strand"], ".", "Parent=%s;exon_number=%s" % (
+                transcript_ids[0], exon_index + 1)])
+        yield "\t".join(base + ["CDS", str(start), str(end), ".",
+            gene["strand"], str(exon_index % 3), "Parent=%s" %
+            ",".join(transcript_ids)])
+
+def _gff2_gene_lines(gene, index):
+    transcript = gene["gene_id"] + ".1"
+    base = [gene["seqid"], "Coding_transcript"]
+    yield "\t".join(base + ["Transcript", str(gene["start"]), str(gene["end"]),
+        ".", gene["strand"], ".", 'Transcript "%s" ; Gene "%s" ; '
+        'Note "synthetic; gene %s"' % (transcript, gene["gene_id"], index)])
+    for start, end in gene["exons"]:
+        yield "\t".join(base + ["coding_exon", str(start), str(end), ".",
+            gene["strand"], "0", 'Transcript "%s" ; CDS "%s"' % (transcript,
+                transcript)])
+
+def _gtf_gene_lines(gene, index):
+    keyvals = 'gene_id "%s"; transcript_id "%s.1"; gene_name "g%s";' % (
+            gene["gene_id"], gene["gene_id"], index)
+    base = [gene["seqid"], "protein_coding"]
+    for exon_index, (start, end) in enumerate(gene["exons"]):
+        exon_keyvals = '%s exon_number "%s";' % (keyvals, exon_index + 1)
+        yield "\t".join(base + ["exon", str(start), str(end), ".",
+            gene["strand"], ".", exon_keyvals])
+        yield "\t".join(base + ["CDS", str(start), str(end), ".",
+            gene["strand"], str(exon_index % 3), exon_keyvals])
+
+def _write_fasta_seq(out_handle, rand, seqid, seq_len, line_size=60):
+    out_handle.write(">%s\n" % seqid)
+    num_lines = 1
+    for start in range(0, seq_len, line_size):
+        size = min(line_size, seq_len - start)
+        out_handle.write("".join([rand.choice("GATC") for i in range(size)])
+                + "\n")
+        num_lines += 1
+    return num_lines
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("-g", "--genes", dest="genes", type="int",
+            default=2000)
+    parser.add_option("-f", "--formats", dest="formats",
+            default="gff3,gff2,gtf")
+    parser.add_option("-t", "--target_lines", dest="target_lines",
+            default="1000,10000,100000")
+    parser.add_option("-a", "--fasta", dest="fasta", action="store_true",
+            default=False)
+    parser.add_option("-o", "--out", dest="out_file", default=None)
+    (options, args) = parser.parse_args()
+    if len(args) > 0:
+        print __doc__
+        sys.exit()
+    main(options.genes, options.formats.split(","),
+         [int(x) for x in options.target_lines.split(",")], options.fasta,
+         options.out_file)
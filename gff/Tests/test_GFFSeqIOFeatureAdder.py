@@ -2,11 +2,18 @@
 """
 import sys
 import os
+import re
+import gzip
+import shutil
+import tempfile
 import unittest
 import pprint
 import StringIO
 
 from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.SeqFeature import SeqFeature, FeatureLocation
 from BCBio import GFF
 from BCBio.GFF import (GFF3Writer, GFFExaminer, GFFParser, DiscoGFFParser)
 
@@ -278,6 +285,82 @@ class GFF3Test(unittest.TestCase):
                 ['yk1055g06.5', 'OSTF085G5_1']
         assert line_info['location'] == [4582718, 4583189]
 
+    def t_prefetch_parse(self):
+        """Parse with blocks read ahead of parsing on a background thread.
+        """
+        base_recs = [r for r in GFFParser().parse_in_parts(
+            self._test_gff_file, target_lines=70)]
+        parser = GFFParser(prefetch_depth=4, prefetch_block_size=100)
+        prefetch_recs = [r for r in parser.parse_in_parts(
+            self._test_gff_file, target_lines=70)]
+        assert len(prefetch_recs) == len(base_recs)
+        for base_rec, prefetch_rec in zip(base_recs, prefetch_recs):
+            assert base_rec.id == prefetch_rec.id
+            assert len(base_rec.features) == len(prefetch_rec.features)
+            for base_f, prefetch_f in zip(base_rec.features,
+                    prefetch_rec.features):
+                assert str(base_f) == str(prefetch_f)
+        fasta_file = os.path.join(self._test_dir, "hybrid1.gff3")
+        recs = SeqIO.to_dict(parser.parse(fasta_file))
+        assert str(recs['chr17'].seq) == "GATTACAGATTACA"
+
+    def t_fasta_index(self):
+        """Parse with sequences retrieved lazily from an indexed FASTA file.
+        """
+        work_dir = tempfile.mkdtemp()
+        try:
+            seq_file = os.path.join(work_dir, "seqs.fa")
+            shutil.copy(self._test_seq_file, seq_file)
+            seq_index = GFF.FastaIndex(seq_file)
+            assert os.path.exists(seq_file + ".fai")
+            seq_dict = self._get_seq_dict()
+            assert seq_index.keys() == [r.id for r in
+                    SeqIO.parse(open(seq_file), "fasta")]
+            index_rec = seq_index["II"]
+            assert len(index_rec.seq) == len(seq_dict["II"].seq) == 100
+            assert str(index_rec.seq[55:65]) == str(seq_dict["II"].seq[55:65])
+            assert index_rec.seq[-1] == seq_dict["II"].seq[-1]
+            assert str(index_rec.seq) == str(seq_dict["II"].seq)
+            limit_info = dict(gff_id=["I"], gff_type=["gene", "mRNA", "CDS"])
+            recs = list(GFF.parse(self._test_gff_file, base_dict=seq_index,
+                limit_info=limit_info))
+            assert [r.id for r in recs] == ["I"]
+            assert str(recs[0].seq) == str(seq_dict["I"].seq)
+            assert len(recs[0].features) == 32
+            # reloaded from the saved .fai file
+            assert GFF.FastaIndex(seq_file).get_length("MtDNA") == \
+                    len(seq_dict["MtDNA"].seq)
+            seq_index.close()
+        finally:
+            shutil.rmtree(work_dir)
+
+    def t_feature_seqs(self):
+        """Extract joined CDS and translated protein sequences of features.
+        """
+        gff_lines = ["##gff-version 3",
+            "chr1\ttest\tmRNA\t1\t15\t.\t+\t.\tID=m1",
+            "chr1\ttest\tCDS\t10\t15\t.\t+\t0\tParent=m1",
+            "chr1\ttest\tCDS\t1\t6\t.\t+\t0\tParent=m1",
+            "chr1\ttest\tgene\t1\t18\t.\t-\t.\tID=g2",
+            "chr1\ttest\tmRNA\t1\t18\t.\t-\t.\tID=m2;Parent=g2",
+            "chr1\ttest\tCDS\t1\t3\t.\t-\t0\tParent=m2",
+            "chr1\ttest\tCDS\t13\t18\t.\t-\t0\tParent=m2",
+            "chr1\ttest\tmRNA\t2\t14\t.\t+\t.\tID=m3",
+            "chr1\ttest\tCDS\t2\t14\t.\t+\t1\tParent=m3"]
+        base_dict = dict(chr1=SeqRecord(Seq("ATGAAACCCGGGTAATTT"), "chr1"))
+        recs = list(GFF.parse(StringIO.StringIO("\n".join(gff_lines) + "\n"),
+            base_dict=base_dict))
+        extractor = GFF.FeatureSeqExtractor()
+        cds = [(r.id, str(r.seq)) for r in extractor.cds(recs)]
+        assert cds == [("m1", "ATGAAAGGGTAA"), ("m2", "AAATTACAT"),
+                ("m3", "TGAAACCCGGGTA")], cds
+        proteins = [(r.id, str(r.seq)) for r in extractor.proteins(recs)]
+        assert proteins == [("m1", "MKG*"), ("m2", "KLH"), ("m3", "ETRV")]
+        extractor = GFF.FeatureSeqExtractor(base_dict)
+        parallel = [(r.id, str(r.seq)) for r in extractor.proteins(recs,
+            workers=2, batch_size=1)]
+        assert parallel == proteins
+
 class SolidGFFTester(unittest.TestCase):
     """Test reading output from SOLiD analysis, as GFF3.
 
@@ -437,6 +520,31 @@ class GFF2Tester(unittest.TestCase):
         assert recs[0].features[1].type == 'SAGE_tag'
         assert len(recs[0].features[2].sub_features) == 29
 
+    def t_parse_stats(self):
+        """Collect timing and count statistics for each parsed chunk.
+        """
+        parser = GFFParser()
+        for rec in parser.parse(self._jgi_file):
+            pass
+        assert parser.get_stats() is None
+        parser = GFFParser(collect_stats=True)
+        for rec in parser.parse(self._jgi_file):
+            pass
+        stats = parser.get_stats()
+        assert stats["chunk"] == 1
+        assert stats["lines"] == stats["peak_chunk_lines"] == 6
+        assert stats["bucket_counts"] == dict(child=6)
+        assert stats["inferred_parents"] == 1
+        assert stats["times"]["results_to_features"] >= \
+                stats["times"]["add_parent_child_features"]
+        all_stats = []
+        for rec in parser.parse_in_parts(self._wormbase_file, target_lines=15):
+            if parser.get_stats() not in all_stats:
+                all_stats.append(parser.get_stats())
+        assert [s["chunk"] for s in all_stats] == range(1, len(all_stats) + 1)
+        assert max(s["lines"] for s in all_stats) == \
+                all_stats[-1]["peak_chunk_lines"]
+
 class DirectivesTest(unittest.TestCase):
     """Tests for parsing directives and other meta-data.
     """
@@ -465,6 +573,257 @@ class DirectivesTest(unittest.TestCase):
         test_rec = recs['chr17']
         assert str(test_rec.seq) == "GATTACAGATTACA"
 
+    def t_fasta_directive_in_parts(self):
+        """Parse FASTA sequence information when parsing in parts.
+        """
+        recs = list(GFF.parse(self._gff_file, target_lines=3))
+        test_rec = [r for r in recs if r.id == "chr17"][-1]
+        assert str(test_rec.seq) == "GATTACAGATTACA"
+
+    def t_fasta_output(self):
+        """Write sequences as a ##FASTA section with sequence-region details.
+        """
+        recs = SeqIO.to_dict(GFF.parse(self._gff_file))
+        long_rec = SeqRecord(Seq("GATC" * 40), "long")
+        long_rec.features.append(SeqFeature(FeatureLocation(10, 20),
+            type="gene", strand=1))
+        out_handle = StringIO.StringIO()
+        GFF.write([recs["chr17"], long_rec], out_handle, include_fasta=True)
+        lines = out_handle.getvalue().split("\n")
+        assert "##sequence-region chr17 1 14" in lines
+        assert "##sequence-region long 1 160" in lines
+        fasta_lines = lines[lines.index("##FASTA") + 1:]
+        assert fasta_lines[:2] == [">chr17", "GATTACAGATTACA"]
+        assert [len(l) for l in fasta_lines[3:6]] == [60, 60, 40]
+        wrote_recs = SeqIO.to_dict(GFF.parse(StringIO.StringIO(
+            out_handle.getvalue())))
+        assert str(wrote_recs["chr17"].seq) == "GATTACAGATTACA"
+        assert str(wrote_recs["long"].seq) == "GATC" * 40
+        assert len(wrote_recs["chr17"].features) == \
+                len(recs["chr17"].features)
+
+    def t_fasta_output_in_parts(self):
+        """Write one sequence-region and sequence per record parsed in parts.
+        """
+        parser = GFFParser()
+        out_handle = StringIO.StringIO()
+        GFF3Writer().write(parser.parse_in_parts(self._gff_file,
+            target_lines=2), out_handle, include_fasta=True)
+        lines = out_handle.getvalue().split("\n")
+        assert [l for l in lines if l.startswith("##sequence-region")] == \
+                ["##sequence-region chr17 1 14"]
+        assert lines[lines.index("##FASTA") + 1:] == [">chr17",
+                "GATTACAGATTACA", ""]
+        test_dir = os.path.join(os.getcwd(), "GFF")
+        gff_file = os.path.join(test_dir, "c_elegans_WS199_shortened_gff.txt")
+        seq_dict = SeqIO.to_dict(SeqIO.parse(os.path.join(test_dir,
+            "c_elegans_WS199_dna_shortened.fa"), "fasta"))
+        num_features = dict()
+        for rec in parser.parse_in_parts(gff_file, seq_dict, target_lines=5):
+            num_features[rec.id] = num_features.get(rec.id, 0) + \
+                    len(rec.features)
+        out_handle = StringIO.StringIO()
+        GFF3Writer().write(parser.parse_in_parts(gff_file, seq_dict,
+            target_lines=5), out_handle, include_fasta=True)
+        lines = out_handle.getvalue().split("\n")
+        rec_ids = seq_dict.keys()
+        rec_ids.sort()
+        regions = [l.split()[1] for l in lines
+                   if l.startswith("##sequence-region")]
+        seq_ids = [l[1:] for l in lines if l.startswith(">")]
+        regions.sort()
+        seq_ids.sort()
+        assert regions == rec_ids and seq_ids == rec_ids
+        wrote_recs = SeqIO.to_dict(GFF.parse(StringIO.StringIO(
+            out_handle.getvalue())))
+        for rec_id in rec_ids:
+            assert str(wrote_recs[rec_id].seq) == str(seq_dict[rec_id].seq)
+            assert len(wrote_recs[rec_id].features) == \
+                    num_features.get(rec_id, 0)
+        # without sequences, the longest placeholder gives each length
+        out_handle = StringIO.StringIO()
+        GFF3Writer().write(parser.parse_in_parts(gff_file, target_lines=5),
+                out_handle, include_fasta=True)
+        lines = out_handle.getvalue().split("\n")
+        regions = [l.split()[1] for l in lines
+                   if l.startswith("##sequence-region")]
+        assert len(regions) == len(set(regions)) > 0
+        assert "##FASTA" not in lines
+
+    def t_fasta_simple_output(self):
+        """Keep a ##FASTA section when writing parse_simple results.
+        """
+        out_handle = StringIO.StringIO()
+        GFF3Writer().write_simple(GFFParser().parse_simple(self._gff_file,
+            target_lines=3), out_handle)
+        lines = out_handle.getvalue().split("\n")
+        assert lines[lines.index("##FASTA") + 1:] == [">chr17",
+                "GATTACAGATTACA", ""]
+        recs = SeqIO.to_dict(GFF.parse(StringIO.StringIO(
+            out_handle.getvalue())))
+        assert str(recs["chr17"].seq) == "GATTACAGATTACA"
+
+class GFFIndexTest(unittest.TestCase):
+    """Tests for incremental interval indexing of GFF files with bx-python.
+    """
+    def setUp(self):
+        self._script_dir = os.path.join(os.getcwd(), os.pardir, "Scripts",
+                "gff")
+        self._work_dir = tempfile.mkdtemp()
+        self._gff_file = os.path.join(self._work_dir, "test.gff3")
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _get_index_module(self):
+        try:
+            import bx
+        except ImportError:
+            print "Skipping -- bx-python not found"
+            return None
+        if self._script_dir not in sys.path:
+            sys.path.append(self._script_dir)
+        import access_gff_index
+        return access_gff_index
+
+    def _gene_lines(self, start, count):
+        return ["Chr1\ttest\tgene\t%s\t%s\t.\t+\t.\tID=gene%s\n" %
+                (i * 100 + 1, i * 100 + 50, i) for i in
+                range(start, start + count)]
+
+    def _write(self, lines, mode="w"):
+        with open(self._gff_file, mode) as out_handle:
+            out_handle.write("".join(lines))
+
+    def _gene_ids(self, index_module, start, end):
+        access = index_module.GFFIndexedAccess(self._gff_file,
+                keep_open=True)
+        ids = [f.id for f in access.get_features_in_region("Chr1", start,
+            end)]
+        access.close()
+        return ids
+
+    def t_index_append(self):
+        """Index only the lines appended to a GFF file.
+        """
+        index_module = self._get_index_module()
+        if index_module is None:
+            return
+        self._write(["##gff-version 3\n"] + self._gene_lines(0, 3))
+        index_module.index(self._gff_file)
+        assert index_module.index_is_current(self._gff_file)
+        assert self._gene_ids(index_module, 0, 1000) == \
+                ["gene0", "gene1", "gene2"]
+        self._write(self._gene_lines(3, 2), "a")
+        assert not index_module.index_is_current(self._gff_file)
+        index_module.index(self._gff_file)
+        assert index_module.index_is_current(self._gff_file)
+        assert self._gene_ids(index_module, 0, 1000) == \
+                ["gene%s" % i for i in range(5)]
+
+    def t_index_modified(self):
+        """Re-index a GFF file edited in place without changing its size.
+        """
+        index_module = self._get_index_module()
+        if index_module is None:
+            return
+        lines = ["##gff-version 3\n"] + self._gene_lines(0, 3000)
+        self._write(lines)
+        index_module.index(self._gff_file)
+        assert self._gene_ids(index_module, 150055, 150060) == []
+        # an edit in the middle, outside of the fingerprinted blocks
+        lines[1501] = lines[1501].replace("150001\t150050", "150011\t150060")
+        mtime = os.path.getmtime(self._gff_file)
+        self._write(lines)
+        os.utime(self._gff_file, (mtime + 10, mtime + 10))
+        assert not index_module.index_is_current(self._gff_file)
+        index_module.index(self._gff_file)
+        assert index_module.index_is_current(self._gff_file)
+        assert self._gene_ids(index_module, 150055, 150060) == ["gene1500"]
+
+    def t_index_no_final_newline(self):
+        """Index a final line without a newline, reading it again if extended.
+        """
+        index_module = self._get_index_module()
+        if index_module is None:
+            return
+        lines = self._gene_lines(0, 3)
+        self._write(lines[:2] + [lines[2].rstrip("\n")])
+        index_module.index(self._gff_file)
+        assert index_module.index_is_current(self._gff_file)
+        assert self._gene_ids(index_module, 0, 1000) == \
+                ["gene0", "gene1", "gene2"]
+        self._write([";Note=extended\n"] + self._gene_lines(3, 1), "a")
+        index_module.index(self._gff_file)
+        assert index_module.index_is_current(self._gff_file)
+        assert self._gene_ids(index_module, 0, 1000) == \
+                ["gene%s" % i for i in range(4)]
+        # a final line still being written is left for the next update
+        self._write(["Chr1\ttest\tgene\t401"], "a")
+        index_module.index(self._gff_file)
+        assert not index_module.index_is_current(self._gff_file)
+        assert self._gene_ids(index_module, 0, 1000) == \
+                ["gene%s" % i for i in range(4)]
+
+class BioSQLLoadTest(unittest.TestCase):
+    """Tests for batch loading of parsed GFF records into BioSQL.
+    """
+    def setUp(self):
+        self._script_dir = os.path.join(os.getcwd(), os.pardir, "Scripts",
+                "gff")
+        self._schema_file = os.path.join(os.getcwd(), "GFF",
+                "biosqldb-sqlite.sql")
+        self._work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _rec(self, rec_id, features, annotations):
+        rec = SeqRecord(Seq("GATTACA" * 20), rec_id)
+        rec.annotations = annotations
+        for start, end, name in features:
+            rec.features.append(SeqFeature(FeatureLocation(start, end),
+                type="gene", strand=1, qualifiers={"ID": [name]}))
+        return rec
+
+    def t_bioentry_features(self):
+        """Load features of each record onto its own bioentry.
+        """
+        try:
+            from BioSQL import BioSeqDatabase
+            import sqlite3
+        except ImportError:
+            print "Skipping -- BioSQL not found"
+            return
+        if self._script_dir not in sys.path:
+            sys.path.append(self._script_dir)
+        import gff_to_biosql
+        server = BioSeqDatabase.open_database(driver="sqlite3",
+                db=os.path.join(self._work_dir, "test.db"))
+        server.load_database_sql(self._schema_file)
+        db = server.new_database("test")
+        # like MySQL, report the last insert into any table
+        server.adaptor.dbutils.last_id = lambda cursor, table: \
+                cursor.lastrowid
+        recs = [self._rec("chr1", [(0, 10, "a1"), (20, 30, "a2")],
+                          {"keywords": ["k1", "k2"], "date": "01-JAN-2010"}),
+                self._rec("chr2", [(5, 15, "b1")], {"keywords": ["k3"]}),
+                self._rec("chr1", [(40, 50, "a3")], {})]
+        seq_index = dict([(rec.id, rec) for rec in recs[:2]])
+        loader = gff_to_biosql.BatchFeatureLoader(server.adaptor, db.dbid,
+                seq_index, batch_features=2)
+        for rec in recs:
+            loader.load(rec)
+        loader.finish()
+        assert loader.num_records == 2 and loader.num_features == 4
+        expected = {"chr1": ["a1", "a2", "a3"], "chr2": ["b1"]}
+        for rec_id, names in expected.items():
+            db_rec = db.lookup(accession=rec_id)
+            assert str(db_rec.seq) == "GATTACA" * 20
+            assert [f.qualifiers["ID"][0] for f in db_rec.features] == \
+                    names, (rec_id, db_rec.features)
+        server.close()
+
 class OutputTest(unittest.TestCase):
     """Tests to write SeqFeatures to GFF3 output format.
     """
@@ -514,6 +873,116 @@ class OutputTest(unittest.TestCase):
                 assert line.find("Note=MSP%3AFADFSPLDVSDVNFATDDLAK") > 0
         assert checks == 3, "Missing check line"
 
+    def t_generated_ids(self):
+        """Generate unique IDs for parent features written without them.
+        """
+        rec = SeqRecord(Seq("ACGT" * 1000), "chr1")
+        for i in range(100):
+            parent = SeqFeature(FeatureLocation(i * 10, i * 10 + 10),
+                    type="gene", strand=1, qualifiers=dict(source=["test"]))
+            child = SeqFeature(FeatureLocation(i * 10, i * 10 + 5),
+                    type="exon", strand=1, qualifiers=dict(Parent=["x"]))
+            parent.sub_features = [child]
+            rec.features.append(parent)
+        out_handle = StringIO.StringIO()
+        GFF3Writer(buffer_lines=7).write([rec], out_handle)
+        ids = re.findall("[\t;]ID=(biopygen\d+)", out_handle.getvalue())
+        assert len(ids) == 100
+        assert len(ids) == len(set(ids))
+        # writing does not modify the qualifiers of written features
+        assert rec.features[0].sub_features[0].qualifiers == dict(
+                Parent=["x"])
+        assert not rec.features[0].qualifiers.has_key("ID")
+
+    def t_write_parallel(self):
+        """Write GFF3 in multiple processes, matching serial output.
+        """
+        rec = SeqRecord(Seq("ACGT" * 1000), "chr1")
+        for i in range(50):
+            parent = SeqFeature(FeatureLocation(i * 10, i * 10 + 10),
+                    type="gene", strand=1)
+            parent.sub_features = [SeqFeature(FeatureLocation(i * 10,
+                i * 10 + 5), type="exon", strand=1)]
+            rec.features.append(parent)
+        # an explicit ID clashing with the first generated one
+        rec.features[0].qualifiers["ID"] = ["biopygen1"]
+        recs = SeqIO.to_dict(GFF.parse(self._wormbase_file)).values() + [rec]
+        serial_handle = StringIO.StringIO()
+        GFF3Writer().write(recs, serial_handle)
+        parallel_handle = StringIO.StringIO()
+        GFF3Writer().write_parallel(recs, parallel_handle, workers=2,
+                block_features=7)
+        assert parallel_handle.getvalue() == serial_handle.getvalue()
+        gen_ids = re.findall("[\t;]ID=(biopygen\d+)",
+                serial_handle.getvalue())
+        assert len(gen_ids) == len(set(gen_ids)) == 50
+
+    def t_write_sorted(self):
+        """Write coordinate sorted GFF3, compressed with BGZF.
+        """
+        recs = SeqIO.to_dict(GFF.parse(self._test_gff_file)).values()
+        out_handle = StringIO.StringIO()
+        GFF3Writer().write_sorted(recs, out_handle, bgzip=True, max_lines=25,
+                write_annotations=False)
+        compressed = out_handle.getvalue()
+        # BGZF blocks are gzip members, ending with an empty EOF block
+        assert compressed[12:14] == "BC"
+        assert compressed.endswith("\x1b\x00\x03\x00" + "\x00" * 8)
+        gz_handle = gzip.GzipFile(fileobj=StringIO.StringIO(compressed))
+        lines = gz_handle.read().split("\n")
+        assert lines[0] == "##gff-version 3"
+        assert "###" in lines
+        last_pos = None
+        for line in lines[1:]:
+            if line and not line.startswith("#"):
+                parts = line.split("\t")
+                cur_pos = (parts[0], int(parts[3]))
+                if last_pos and last_pos[0] == cur_pos[0]:
+                    assert cur_pos[1] >= last_pos[1], (last_pos, cur_pos)
+                last_pos = cur_pos
+        sorted_recs = SeqIO.to_dict(GFF.parse(StringIO.StringIO(
+            "\n".join(lines))))
+        assert len(sorted_recs["I"].features) == \
+                len(SeqIO.to_dict(recs)["I"].features)
+
+    def t_write_simple(self):
+        """Write GFF3 directly from simple parsing, without building features.
+        """
+        # children with multiple parents are written once, so may be
+        # reparsed in a different order
+        def _feature_summary(features):
+            summary = [(f.type, f.location.nofuzzy_start,
+                        f.location.nofuzzy_end, f.strand,
+                        _feature_summary(f.sub_features)) for f in features]
+            summary.sort()
+            return summary
+        ensembl_file = os.path.join(self._test_dir, "ensembl_gtf.txt")
+        for in_file in [self._wormbase_file, ensembl_file,
+                self._test_gff_file]:
+            out_handle = StringIO.StringIO()
+            GFF3Writer().write_simple(GFFParser().parse_simple(in_file,
+                target_lines=1000), out_handle)
+            orig_recs = SeqIO.to_dict(GFF.parse(in_file))
+            wrote_recs = SeqIO.to_dict(GFF.parse(StringIO.StringIO(
+                out_handle.getvalue())))
+            assert orig_recs.keys() == wrote_recs.keys()
+            for rec_id, orig_rec in orig_recs.items():
+                assert _feature_summary(orig_rec.features) == \
+                        _feature_summary(wrote_recs[rec_id].features), rec_id
+
+    def t_keyval_format(self):
+        """Format attributes in a fixed order, quoting values when needed.
+        """
+        writer = GFF3Writer()
+        keyvals = dict(Note=["a;b", "a;b", "c"], Parent=["p1"], ID=["x.1"],
+                Alias=["al/1"], Name=["n 1"])
+        expected = "ID=x.1;Name=n%201;Parent=p1;Alias=al/1;Note=a%3Bb,c"
+        assert writer._format_keyvals(keyvals) == expected
+        reordered = dict()
+        for key in ["Name", "Note", "Alias", "ID", "Parent"]:
+            reordered[key] = keyvals[key]
+        assert writer._format_keyvals(reordered) == expected
+
 def run_tests(argv):
     test_suite = testing_suite()
     runner = unittest.TextTestRunner(sys.stdout, verbosity = 2)
@@ -526,7 +995,7 @@ def testing_suite():
     test_loader = unittest.TestLoader()
     test_loader.testMethodPrefix = 't_'
     tests = [GFF3Test, MapReduceGFFTest, SolidGFFTester, GFF2Tester,
-             DirectivesTest, OutputTest]
+             DirectivesTest, OutputTest, GFFIndexTest, BioSQLLoadTest]
     #tests = [GFF3Test]
     for test in tests:
         cur_suite = test_loader.loadTestsFromTestCase(test)
@@ -22,8 +22,8 @@ import numpy
 
 from Bio import Cluster
 from Bio import Fasta
-from Bio.SeqUtils import IsoelectricPoint
-from Bio.SeqUtils import ProtParam
+
+import protein_charge
 
 def main(ipr_number, num_clusters, out_dir):
     charge_window = 75
@@ -151,20 +151,13 @@ def calc_charge_plot(uniprot_id, cur_db, charge_window, out_dir):
 
 def calc_region_charges(seq, cur_window):
     """Perform calculation of charges via isoelectric points for a sequence.
+
+    Windows are internal small regions, so C and N terminal charges are
+    not adjusted for the residues at the window ends. The last window is
+    left out.
     """
-    # internal small regions, so do not deal with C and N terminal charges
-    IsoelectricPoint.pKcterminal = {}
-    IsoelectricPoint.pKnterminal = {}
-    cur_pos = 0
-    region_charges = []
-    while cur_pos < len(seq) - cur_window:
-        cur_seq = seq[cur_pos:cur_pos + cur_window]
-        prot_analysis = ProtParam.ProteinAnalysis(str(cur_seq))
-        ie_calc = IsoelectricPoint.IsoelectricPoint(cur_seq,
-                prot_analysis.count_amino_acids())
-        region_charges.append(ie_calc.pi())
-        cur_pos += 1
-    return region_charges
+    return list(protein_charge.window_isoelectric_points([seq],
+        cur_window)[0][:-1])
 
 cluster_template = """
 <html>
@@ -12,7 +12,6 @@ from __future__ import with_statement
 import sys
 import os
 import urllib2
-import subprocess
 import xml.etree.ElementTree as ET
 import shelve
 import time
@@ -20,9 +19,8 @@ import collections
 
 from Bio import SeqIO
 from Bio.SeqRecord import SeqRecord
-from Bio.Emboss import Applications
-from Bio.SeqUtils import IsoelectricPoint
-from Bio.SeqUtils import ProtParam
+
+import protein_charge
 
 org_includes = [
         'Homo sapiens',
@@ -56,7 +54,7 @@ def main(ipr_number, domain_description):
     uniprot_retriever = UniprotRestRetrieval(cache_dir)
     uniref_retriever = UniRefRetrieval(cache_dir)
     string_retriever = StringRetrieval(cache_dir)
-    charge_calc = ProteinChargeCalculator(cache_dir)
+    charge_calc = ProteinChargeCalculator()
     hmmsearch_parser = SimpleHmmsearchDomainParser(std_name_parser)
     cur_db = shelve.open(os.path.join(db_dir, ipr_number))
     seq_recs = interpro_retriever.get_interpro_records(ipr_number)
@@ -70,7 +68,8 @@ def main(ipr_number, domain_description):
     uniref_data = {}
     all_children = []
     all_recs = []
-    for seq_rec in seq_recs:
+    neutral_charges = charge_calc.get_neutral_charges(seq_recs)
+    for seq_rec, neutral_charge in zip(seq_recs, neutral_charges):
         uniprot_id = std_name_parser(seq_rec.id)
         metadata = uniprot_retriever.get_xml_metadata(uniprot_id,
                 domain_description)
@@ -99,7 +98,7 @@ def main(ipr_number, domain_description):
                         uniref_data[vals[0]] = vals[1:]
                         all_children.extend(vals[1:])
                     metadata["seq"] = seq_rec.seq.data
-                    metadata["charge"] = charge_calc.get_neutral_charge(seq_rec)
+                    metadata["charge"] = neutral_charge
                     metadata["charge_region"] = \
                             charge_calc.get_region_charge_percent(
                             seq_rec, aa_window, charge_thresh)
@@ -177,70 +176,38 @@ class SimpleHmmsearchDomainParser:
         return name, start, end
 
 class ProteinChargeCalculator:
-    """Calculate protein charge using the emboss iep program.
+    """Calculate protein charge with the pK values of the emboss iep program.
     """
-    def __init__(self, tmp_dir):
-        self._tmp_dir = tmp_dir
-
     def get_neutral_charge(self, aa_rec):
         """Get the charge of the provided protein at pH 7.
         """
-        in_file = os.path.join(self._tmp_dir, "iep_in.txt")
-        out_file = os.path.join(self._tmp_dir, "iep_out.txt")
-        try:
-            charge = self._calc_neutral_charge(aa_rec, in_file, out_file,
-                    '7.00')
-        finally:
-            for fname in [in_file, out_file]:
-                if os.path.exists(fname):
-                    os.remove(fname)
-        return charge
+        return self.get_neutral_charges([aa_rec])[0]
+
+    def get_neutral_charges(self, aa_recs):
+        """Get the charges of many proteins at pH 7, calculated together.
+        """
+        return protein_charge.protein_charges([rec.seq for rec in aa_recs],
+                7.0).tolist()
 
     def get_region_charge_percent(self, aa_rec, aa_window, charge_thresh):
         """Retrieve the percent of windows in a sequence above a given threshold
         """
         region_charges = self._calc_region_charges(aa_rec.seq, aa_window)
-        above_thresh = [c for c in region_charges if c >= charge_thresh]
         if len(region_charges) > 0:
-            return float(len(above_thresh)) / float(len(region_charges))
+            return float((region_charges >= charge_thresh).sum()) / \
+                    float(len(region_charges))
         else:
             return 0.0
 
     def _calc_region_charges(self, seq, cur_window):
         """Perform calculation of charges via isoelectric points for a sequence.
+
+        Windows are internal small regions, so C and N terminal charges are
+        not adjusted for the residues at the window ends. The last window is
+        left out.
         """
-        # internal small regions, so do not deal with C and N terminal charges
-        IsoelectricPoint.pKcterminal = {}
-        IsoelectricPoint.pKnterminal = {}
-        cur_pos = 0
-        region_charges = []
-        while cur_pos < len(seq) - cur_window:
-            cur_seq = seq[cur_pos:cur_pos + cur_window]
-            prot_analysis = ProtParam.ProteinAnalysis(str(cur_seq))
-            ie_calc = IsoelectricPoint.IsoelectricPoint(cur_seq,
-                    prot_analysis.count_amino_acids())
-            region_charges.append(ie_calc.pi())
-            cur_pos += 1
-        return region_charges
-
-    def _calc_neutral_charge(self, aa_rec, in_file, out_file, ph_target):
-        with open(in_file, 'w') as in_handle:
-            SeqIO.write([aa_rec], in_handle, "fasta")
-        iep_cl = Applications.IepCommandline()
-        iep_cl.set_parameter('-sequence', in_file)
-        iep_cl.set_parameter('-outfile', out_file)
-        child = subprocess.Popen(str(iep_cl).split(), stdout =
-                subprocess.PIPE, stderr = subprocess.PIPE)
-        child.wait()
-        return self._parse_out_file(out_file, ph_target)
-
-    def _parse_out_file(self, out_file, ph_target):
-        with open(out_file) as out_handle:
-            for line in out_handle:
-                parts = [p for p in line.strip().split() if p]
-                if len(parts) == 3 and parts[0] == ph_target:
-                    return float(parts[2])
-        raise ValueError('Did not find a charge')
+        return protein_charge.window_isoelectric_points([seq],
+                cur_window)[0][:-1]
 
 class _BaseCachingRetrieval:
     """Provide a base class for web retrieval with local file caching.
@@ -0,0 +1,231 @@
+"""Isoelectric points and charges of proteins, calculated together with NumPy.
+
+Uses the pK values and method of Bjellqvist from Biopython's
+IsoelectricPoint module, which solves for the pH giving a charge of zero
+by bracketing and bisection. Instead of a new ProteinAnalysis for every
+window, charged residue counts for all windows come from cumulative sums
+over the sequence, and the bisection runs on every window at once:
+
+    pis = window_isoelectric_points([str(rec.seq) for rec in recs], 75)
+
+Windows are internal regions of proteins, so by default the N and C
+terminal pK values are not adjusted for the residues at each end.
+
+Net charges of whole proteins at a pH are calculated in batch with the pK
+values of EMBOSS iep, replacing a run of iep for every protein:
+
+    charges = protein_charges([str(rec.seq) for rec in recs], 7.0)
+
+Running the script runs the tests.
+"""
+import sys
+
+import numpy
+
+from Bio.SeqUtils import IsoelectricPoint
+
+_POS_AAS = ["K", "R", "H"]
+_NEG_AAS = ["D", "E", "C", "Y"]
+
+# positive and negative pK values, including the N and C termini
+BJELLQVIST_PKS = (IsoelectricPoint.positive_pKs, IsoelectricPoint.negative_pKs)
+# defaults of the EMBOSS Epk.dat file, used by iep
+EMBOSS_PKS = ({"Nterm": 8.6, "K": 10.8, "R": 12.5, "H": 6.5},
+              {"Cterm": 3.6, "D": 3.9, "E": 4.1, "C": 8.5, "Y": 10.1})
+
+def _pk_table(terminal_pks, default):
+    table = numpy.zeros(256) + default
+    for aa, pk in terminal_pks.items():
+        table[ord(aa)] = pk
+    return table
+
+_NTERM_PKS = _pk_table(IsoelectricPoint.pKnterminal,
+        IsoelectricPoint.positive_pKs["Nterm"])
+_CTERM_PKS = _pk_table(IsoelectricPoint.pKcterminal,
+        IsoelectricPoint.negative_pKs["Cterm"])
+
+def window_isoelectric_points(seqs, window, terminal_pks=False):
+    """Isoelectric point of every window of window residues in sequences.
+
+    Returns a list with an array for each sequence, holding the pI of each
+    window start from 0 to len(seq) - window. With terminal_pks, pK values
+    of the window ends depend on the residues there, as for whole proteins.
+    """
+    seq_strs = [_prepare_seq(s) for s in seqs]
+    lengths = numpy.array([len(s) for s in seq_strs], dtype=numpy.int64)
+    num_windows = numpy.maximum(lengths - window + 1, 0)
+    if window <= 0 or num_windows.sum() == 0:
+        return [numpy.zeros(n) for n in num_windows]
+    residues = numpy.frombuffer("".join(seq_strs), dtype=numpy.uint8)
+    seq_starts = numpy.concatenate([[0], numpy.cumsum(lengths)[:-1]])
+    # positions of the first residue of each window, in all sequences
+    starts = (numpy.repeat(seq_starts - numpy.concatenate([[0],
+        numpy.cumsum(num_windows)[:-1]]), num_windows) +
+        numpy.arange(num_windows.sum()))
+    counts = dict()
+    for aa in _POS_AAS + _NEG_AAS:
+        aa_sums = numpy.concatenate([[0],
+            numpy.cumsum(residues == ord(aa))])
+        counts[aa] = (aa_sums[starts + window] -
+                aa_sums[starts]).astype(float)
+    if terminal_pks:
+        nterm_pks = _NTERM_PKS[residues[starts]]
+        cterm_pks = _CTERM_PKS[residues[starts + window - 1]]
+    else:
+        nterm_pks = numpy.zeros(len(starts)) + \
+                IsoelectricPoint.positive_pKs["Nterm"]
+        cterm_pks = numpy.zeros(len(starts)) + \
+                IsoelectricPoint.negative_pKs["Cterm"]
+    pis = solve_isoelectric_points(counts, nterm_pks, cterm_pks)
+    return numpy.split(pis, numpy.cumsum(num_windows)[:-1])
+
+def protein_charges(seqs, ph=7.0, pks=EMBOSS_PKS):
+    """Net charge of each protein sequence at a pH.
+
+    As with iep, sequences are upper cased and one N and one C terminus
+    is counted for each. Returns an array of charges.
+    """
+    seq_strs = [str(s).upper() for s in seqs]
+    lengths = numpy.array([len(s) for s in seq_strs], dtype=numpy.int64)
+    residues = numpy.frombuffer("".join(seq_strs), dtype=numpy.uint8)
+    seq_indexes = numpy.repeat(numpy.arange(len(seq_strs)), lengths)
+    counts = dict()
+    for aa in _POS_AAS + _NEG_AAS:
+        counts[aa] = numpy.bincount(seq_indexes[residues == ord(aa)],
+                minlength=len(seq_strs)).astype(float)
+    return charges_at_ph(counts, numpy.zeros(len(seq_strs)) +
+            pks[0]["Nterm"], numpy.zeros(len(seq_strs)) + pks[1]["Cterm"],
+            ph, pks)
+
+def _prepare_seq(seq):
+    seq_str = str(seq)
+    # as in ProtParam, only all lower case sequences are upper cased
+    if seq_str.islower():
+        seq_str = seq_str.upper()
+    return seq_str
+
+def charges_at_ph(counts, nterm_pks, cterm_pks, ph, pks=BJELLQVIST_PKS):
+    """Net charge at each pH, from arrays of charged residue counts.
+
+    counts is a dictionary of residues to arrays of counts; one N and one
+    C terminus is counted with the given pK values. pks are the positive
+    and negative pK values of residues, by default those of Biopython.
+    """
+    # partial charges as in IsoelectricPoint, with one power of 10 per pH:
+    # 10 ** (pK - pH) / (10 ** (pK - pH) + 1) == 1 / (1 + 10 ** pH / 10 ** pK)
+    ph_power = 10.0 ** ph
+    charge = 1.0 / (1.0 + ph_power / 10.0 ** nterm_pks)
+    for aa in _POS_AAS:
+        charge += counts[aa] / (1.0 + ph_power / 10.0 ** pks[0][aa])
+    charge -= 1.0 / (1.0 + 10.0 ** cterm_pks / ph_power)
+    for aa in _NEG_AAS:
+        charge -= counts[aa] / (1.0 + 10.0 ** pks[1][aa] / ph_power)
+    return charge
+
+def solve_isoelectric_points(counts, nterm_pks, cterm_pks):
+    """Find the pH of zero charge for each set of counts.
+
+    Starting from pH 7, each pH is bracketed in steps of 1 and then bisected
+    until the bracket is within 0.0001, with every window solved together.
+    """
+    def _charges(index, ph):
+        return charges_at_ph(dict([(aa, vals[index]) for aa, vals in
+            counts.items()]), nterm_pks[index], cterm_pks[index], ph)
+    size = len(nterm_pks)
+    everything = numpy.arange(size)
+    ph = numpy.zeros(size) + 7.0
+    charge = _charges(everything, ph)
+    ph_low = ph.copy()
+    ph_high = ph.copy()
+    step = numpy.where(charge > 0.0, 1.0, -1.0)
+    active = everything[charge != 0.0]
+    while len(active) > 0:
+        ph[active] += step[active]
+        charge[active] = _charges(active, ph[active])
+        # brackets move in steps of 1 until the sign of the charge changes
+        going_up = step[active] > 0
+        done = numpy.where(going_up, charge[active] <= 0.0,
+                charge[active] >= 0.0)
+        finished = active[done]
+        ph_low[finished] = numpy.where(going_up[done], ph[finished] - 1.0,
+                ph[finished])
+        ph_high[finished] = ph_low[finished] + 1.0
+        active = active[~done]
+    active = everything[(ph_high - ph_low > 0.0001) & (charge != 0.0)]
+    while len(active) > 0:
+        ph[active] = (ph_low[active] + ph_high[active]) / 2.0
+        charge[active] = _charges(active, ph[active])
+        positive = charge[active] > 0.0
+        ph_low[active[positive]] = ph[active[positive]]
+        ph_high[active[~positive]] = ph[active[~positive]]
+        active = active[(ph_high[active] - ph_low[active] > 0.0001) &
+                (charge[active] != 0.0)]
+    return ph
+
+# ------- Testing Code
+import unittest
+
+from Bio.SeqUtils import ProtParam
+
+class ProteinChargeTest(unittest.TestCase):
+    """Calculate isoelectric points and charges for batches of proteins.
+    """
+    def setUp(self):
+        self._seqs = ["MKRHDECYAGSTKKRREEDDHCYWLP" * 3, "kkkrrrhhh",
+                "DDDEEECCCYYY", "AKD", "GSGSGS"]
+
+    def t_1_window_isoelectric_points(self):
+        """Match Biopython pI calculations on each window.
+        """
+        window = 5
+        pis = window_isoelectric_points(self._seqs, window)
+        term_pis = window_isoelectric_points(self._seqs, window, True)
+        assert [len(p) for p in pis] == [74, 5, 8, 0, 2]
+        nterm = IsoelectricPoint.pKnterminal
+        cterm = IsoelectricPoint.pKcterminal
+        for seq, seq_pis, seq_term_pis in zip(self._seqs, pis, term_pis):
+            for i in range(len(seq) - window + 1):
+                cur_seq = _prepare_seq(seq[i:i + window])
+                prot_analysis = ProtParam.ProteinAnalysis(cur_seq)
+                assert abs(seq_term_pis[i] -
+                        prot_analysis.isoelectric_point()) < 1e-9
+                # without terminal adjustment, as for internal regions
+                IsoelectricPoint.pKnterminal = {}
+                IsoelectricPoint.pKcterminal = {}
+                try:
+                    ie_calc = IsoelectricPoint.IsoelectricPoint(cur_seq,
+                            prot_analysis.count_amino_acids())
+                    assert abs(seq_pis[i] - ie_calc.pi()) < 1e-9
+                finally:
+                    IsoelectricPoint.pKnterminal = nterm
+                    IsoelectricPoint.pKcterminal = cterm
+
+    def t_2_protein_charges(self):
+        """Net charges of proteins with the EMBOSS pK values.
+        """
+        charges = protein_charges(["KKKK", "MDEHCY", "", "gsrk"])
+        for charge, expected in zip(charges,
+                [3.975261, -1.813248, -0.024105]):
+            assert abs(charge - expected) < 1e-6, (charge, expected)
+        charge = protein_charges(["gsrk"], 5.0)[0]
+        assert abs(charge - 2.038034) < 1e-6, charge
+
+def run_tests(argv):
+    test_suite = testing_suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity = 2)
+    runner.run(test_suite)
+
+def testing_suite():
+    """Generate the suite of tests.
+    """
+    test_suite = unittest.TestSuite()
+    test_loader = unittest.TestLoader()
+    test_loader.testMethodPrefix = 't_'
+    tests = [ProteinChargeTest]
+    for test in tests:
+        cur_suite = test_loader.loadTestsFromTestCase(test)
+        test_suite.addTest(cur_suite)
+    return test_suite
+
+if __name__ == "__main__":
+    sys.exit(run_tests(sys.argv))